@@ -0,0 +1,135 @@
+from utils.stoppable_thread import StoppableThread
+from command_listener import Command
+import json
+import logging
+import os
+import selectors
+import socket
+
+
+class AdminConnection:
+    """
+    Buffers of single admin client connection
+    """
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.input = b''
+        self.output = b''
+
+
+class AdminServer(StoppableThread):
+    """
+    Local unix socket API. Each request is single JSON line {"cmd": <command>, "args": {<name>: <value>}}, response is
+    single JSON line {"ok": true, "result": <data>} or {"ok": false, "error": <message>}. All sockets are non-blocking,
+    so slow client does not block other clients. Commands read snapshots (copies) of bridge tables. Failure of command
+    is returned as error response, it never stops server.
+    """
+    SELECT_TIMEOUT = 0.5
+    RECEIVE_SIZE = 4096
+    MAX_REQUEST_SIZE = 65536
+
+    def __init__(self, path: str):
+        StoppableThread.__init__(self)
+        self._path = path
+        self._commands = {}
+        self._stats_sources = {}
+        self._selector = selectors.DefaultSelector()
+        self.add_command(Command("help", self.get_help, "Shows help"))
+        self.add_command(Command("metrics", self.get_metrics, "Shows counters of bridge services"))
+
+    def add_command(self, command: Command):
+        self._commands.update({command.get_command_string(): command})
+
+    def add_stats_source(self, name: str, stats_function):
+        self._stats_sources.update({name: stats_function})
+
+    def copy_commands(self, admin_server):
+        """
+        Takes commands and stats sources of other server (restarted server replaces dead one)
+        """
+        self._commands.update(admin_server._commands)
+        self._stats_sources.update(admin_server._stats_sources)
+
+    def get_help(self) -> dict:
+        return {key: command.get_help_text() for (key, command) in sorted(self._commands.items())}
+
+    def get_metrics(self) -> dict:
+        return {name: stats_function() for (name, stats_function) in list(self._stats_sources.items())}
+
+    def _handle_request(self, request: bytes) -> dict:
+        try:
+            request = json.loads(request.decode("UTF-8"))
+            command = self._commands[request["cmd"]]
+            return {"ok": True, "result": command.execute_command(**request.get("args", {}))}
+        except KeyError as e:
+            return {"ok": False, "error": "unknown command or argument {}".format(str(e))}
+        except (ValueError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            logging.exception('BRIDGE:admin command failed')
+            return {"ok": False, "error": "command failed: {}".format(str(e))}
+
+    def _accept(self, server: socket.socket):
+        connection, address = server.accept()
+        connection.setblocking(False)
+        self._selector.register(connection, selectors.EVENT_READ, AdminConnection(connection))
+
+    def _close(self, client: AdminConnection):
+        self._selector.unregister(client.connection)
+        client.connection.close()
+
+    def _read(self, client: AdminConnection):
+        try:
+            data = client.connection.recv(self.RECEIVE_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data or len(client.input) > self.MAX_REQUEST_SIZE:
+            self._close(client)
+            return
+        client.input += data
+        while b'\n' in client.input:
+            request, client.input = client.input.split(b'\n', 1)
+            response = self._handle_request(request)
+            client.output += json.dumps(response, default=str).encode("UTF-8") + b'\n'
+        if client.output:
+            self._selector.modify(client.connection, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def _write(self, client: AdminConnection):
+        try:
+            sent = client.connection.send(client.output)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(client)
+            return
+        client.output = client.output[sent:]
+        if not client.output:
+            self._selector.modify(client.connection, selectors.EVENT_READ, client)
+
+    def run(self):
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self._path)
+        os.chmod(self._path, 0o660)
+        server.listen()
+        server.setblocking(False)
+        self._selector.register(server, selectors.EVENT_READ, None)
+        logging.info('BRIDGE:admin socket listening on "{}"'.format(self._path))
+        try:
+            while not self.is_stopped():
+                for key, mask in self._selector.select(self.SELECT_TIMEOUT):
+                    if key.data is None:
+                        self._accept(key.fileobj)
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._read(key.data)
+                    if mask & selectors.EVENT_WRITE and key.fileobj.fileno() != -1:
+                        self._write(key.data)
+        finally:
+            for key in list(self._selector.get_map().values()):
+                key.fileobj.close()
+            self._selector.close()
+            os.unlink(self._path)
@@ -1,27 +1,49 @@
-from serial_connection import SerialListener, SerialSender, ContikiBootEvent, SerialPacketToSendEvent, SerialCommands, \
-    SerialParser, MoteGlobalAddressEvent, RequestRouteToMoteEvent, ResponseToPacketRequest, HelloBridgeRequestEvent
-from timers import NeighbourRequestTimer, PurgeTimer
-from interface_listener import InterfaceListener, Ipv6PacketParser, PacketSendToSerialEvent, PacketSender, \
-    NeighbourSolicitationEvent, NeighbourAdvertisementEvent, RootPacketForwardEvent, PacketForwardToSerialEvent
+import time
+_IMPORT_STARTED = time.perf_counter()
+from serial_connection import SerialCommands, MoteGlobalAddressEvent
+from timers import PurgeTimer, SnapshotTimer, LinkQualityTimer, RootProbeTimer
+from interface_listener import InterfaceListener, PacketSender
 from neighbors import PendingSolicitations, NewNodeEvent, NodeTable, NodeRefreshEvent
-from utils.configuration_loader import ConfigurationLoader
-from data import Data, IpConfigurator, ChangeModeEvent, PacketBuffer, PacketBuffEvent
-from neighbors import NeighborManager, PendingEntry
+from utils.configuration_loader import ConfigurationLoader, ConfigurationError
+from data import Data, IpConfigurator, ChangeModeEvent
+from radio import Radio, RadioDispatcher
 from command_listener import CommandListener, Command
+from admin_socket import AdminServer
+from recorder import Recorder
+from profiler import ThreadMonitor
+from dedup import DuplicateFilter
+from link_quality import LinkQualityMonitor
+from bundle import BundleAggregator, BundleSendEvent
+from pipeline import ProcessPipeline, FibPublisher, RingListener, RingPacketSender
+from utils.boot_timer import BootTimer
+from supervisor import Supervisor
+from snapshot import NodeTableSnapshot
+from flows import FlowTable
+from responder import NeighbourResponder
+from kernel_neighbours import KernelNeighbourMonitor
+from memory import MemoryBudget
+from console import ConsoleSink
 import configparser
 import os
-import time
+import threading
 import logging
+_IMPORT_FINISHED = time.perf_counter()
 
 
 class Boot(object):
     """
-    Initialize class for bridge application
+    Initialize class for bridge application. Bridge manages one radio (contiki device) per configured serial device,
+    all radios share wifi interface. Wifi address and root role follow the first radio. Bridge requires Python 3.8+
+    (multiprocessing.shared_memory and bytes.hex with separator).
     """
     _pwd = os.getcwd()
     _tech_types = ['wifi', 'rpl']
+    LOADING_PRINT_INTERVAL = 1
+    SHUTDOWN_DEADLINE = 5
 
     def __init__(self):
+        self._boot_timer = BootTimer(_IMPORT_STARTED)
+        self._boot_timer.mark("imports", _IMPORT_FINISHED)
         logging.basicConfig(filename='prod.log', level=logging.DEBUG, format='%(asctime)s [%(levelname)s] %(message)s',
                             datefmt='%m/%d/%Y %I:%M:%S %p')
         logging.info('BRIDGE:starting bridge')
@@ -31,97 +53,363 @@ class Boot(object):
         self._load_services()
         self._boot_event_subscribers()
         self._load_commands()
+        self._boot_timer.mark("services")
 
     def _load_config(self):
         self.configLoader = ConfigurationLoader(configparser.ConfigParser())
 
+    def _get_config_path(self) -> str:
+        return "{0}/configuration/configuration.conf".format(self._pwd)
+
     def _load_services(self):   # todo create service container instead of variables -> create configuration file for loading?
-        self._data = Data(self.configLoader.read_configuration(
-            "{0}/configuration/configuration.conf".format(self._pwd)))
-        self._node_table = NodeTable(self._tech_types)
+        self._data = Data(self.configLoader.read_configuration(self._get_config_path()))
+        recorder_path = self._data.get_configuration()['recorder']['path']
+        self._recorder = Recorder(recorder_path) if recorder_path else None
+        self._node_table = NodeTable(self._tech_types, self._data.get_configuration()['neighbours']['lifetime'])
+        self._snapshot = NodeTableSnapshot(self._data.get_configuration()['snapshot']['path'], self._node_table,
+                                           self._data, self._tech_types)
+        self._snapshot.load()
         self._pending_solicitations = PendingSolicitations()
-        self._slip_sender = SerialSender(self._data.get_configuration()['serial']['device'])
-        self._input_parser = SerialParser(self._data, self._node_table)
-        self._slip_listener = SerialListener(self._data.get_configuration()['serial']['device'], self._input_parser)
-        self._packet_parser = Ipv6PacketParser(self._data, self._node_table)
-        self._interface_listener = InterfaceListener(self._data.get_configuration()['wifi']['device'], self._packet_parser)
-        self._slip_commands = SerialCommands(self._slip_sender, self._data)
-        self._packed_sender = PacketSender(self._data.get_configuration()['wifi']['device'], self._data, self._node_table)
-        self._neighbour_manager = NeighborManager(self._node_table, self._data, self._pending_solicitations, self._packed_sender, self._slip_commands)
-        self._neighbour_request_timer = NeighbourRequestTimer(10, self._slip_commands)
+        self._duplicate_filter = DuplicateFilter(self._data.get_configuration()['buffer']['dedup-capacity'])
+        self._link_monitor = LinkQualityMonitor(self._data, self._node_table)
+        self._flow_table = FlowTable(self._node_table, self._data.get_configuration()['flows']['capacity'],
+                                     self._data.get_configuration()['flows']['idle-timeout'])
+        self._pipeline = None
+        if self._data.get_configuration()['pipeline']['processes']:
+            self._pipeline = ProcessPipeline(self._data.get_configuration()['wifi']['device'],
+                                             self._data.get_configuration()['pipeline']['ring-slots'],
+                                             self._data.get_configuration()['wifi']['receive-buffer'])
+        self._supervisor = Supervisor()
+        wifi_config = self._data.get_configuration()['wifi']
+        self._bundle_aggregator = BundleAggregator(wifi_config['aggregation'] and not self._pipeline,
+                                                   wifi_config['aggregation-delay'] / 1000,
+                                                   wifi_config['aggregation-bytes'])
+        if self._pipeline:
+            self._packed_sender = RingPacketSender(self._pipeline.get_tx_ring(), self._link_monitor,
+                                                   self._flow_table)
+            self._fib_publisher = FibPublisher(self._pipeline.get_fib(), self._data, self._node_table,
+                                               self._link_monitor)
+            self._supervisor.watch("fib-publisher", self._fib_publisher)
+            self._supervisor.watch("wifi-receiver", self._pipeline.create_receiver(), self._pipeline.create_receiver)
+            self._supervisor.watch("wifi-sender", self._pipeline.create_sender(), self._pipeline.create_sender)
+        else:
+            self._packed_sender = PacketSender(wifi_config['device'], self._data, self._node_table, self._recorder,
+                                               self._link_monitor, self._bundle_aggregator, self._flow_table)
+        self._responder = NeighbourResponder(self._packed_sender)
+        console_config = self._data.get_configuration()['console']
+        self._console = ConsoleSink(console_config['output'], console_config['capacity'], console_config['rate'],
+                                    console_config['burst'])
+        self._supervisor.watch("console-sink", self._console)
+        self._radios = self._load_radios()
+        self._packet_parser = RadioDispatcher(self._radios, self._node_table, self._link_monitor,
+                                              self._flow_table)
+        self._supervisor.watch("interface-listener", self._create_interface_listener(),
+                               self._create_interface_listener)
+        self._kernel_neighbours = None
+        if wifi_config['kernel-neighbours']:
+            self._kernel_neighbours = self._create_kernel_neighbour_monitor()
+            self._supervisor.watch("kernel-neighbours", self._kernel_neighbours, self._create_kernel_neighbour_monitor)
         self._ip_configurator = IpConfigurator(self._data, self._data.get_configuration()['wifi']['device'],
-                                               self._data.get_configuration()['wifi']['subnet'],
-                                               self._data.get_configuration()['border-router']['ipv6'])
-        self._purge_timer = PurgeTimer(1, self._node_table)
-        self._command_listener = CommandListener()
-        self._packet_buffer = PacketBuffer()
+                                               self._data.get_configuration()['wifi']['subnet'])
+        self._root_probe_timer = RootProbeTimer(self._data.get_configuration()['border-router']['probe-interval'],
+                                                self._data, self._packed_sender)
+        self._memory_budget = self._create_memory_budget()
+        self._purge_timer = PurgeTimer(self._data.get_configuration()['neighbours']['purge-interval'],
+                                       self._node_table, self._flow_table, self._memory_budget)
+        self._thread_monitor = ThreadMonitor()
+        self._admin_server = self._create_admin_server()
+        self._command_listener = CommandListener(self._data.get_configuration()['admin']['socket'])
+        self._snapshot_timer = SnapshotTimer(self._data.get_configuration()['snapshot']['interval'], self._snapshot)
+        self._supervisor.watch("purge-timer", self._purge_timer)
+        self._supervisor.watch("root-probe-timer", self._root_probe_timer)
+        self._link_quality_timer = LinkQualityTimer(self._data.get_configuration()['metrics']['link-quality-interval'],
+                                                    self._link_monitor,
+                                                    [radio.get_slip_commands() for radio in self._radios])
+        self._supervisor.watch("snapshot-timer", self._snapshot_timer)
+        self._supervisor.watch("link-quality-timer", self._link_quality_timer)
+        self._supervisor.watch("bundle-aggregator", self._bundle_aggregator)
+        self._supervisor.watch("admin-server", self._admin_server, self._create_admin_server)
+        self._reload_lock = threading.Lock()
+        self._apply_configuration()
+
+    def _load_radios(self) -> list:
+        """
+        Radio is created for each serial device, first radio uses Data of bridge, others share its wifi state. Only
+        serial line of first radio is recorded.
+        """
+        radios = []
+        devices = [device.strip() for device in self._data.get_configuration()['serial']['device'].split(",")]
+        for index, device in enumerate(devices):
+            data = self._data if index == 0 else Data(self._data.get_configuration(), self._data)
+            radio = Radio("radio{}".format(index), device, data, self._node_table, self._pending_solicitations,
+                          self._packed_sender, self._duplicate_filter, self._link_monitor,
+                          self._recorder if index == 0 else None, self._responder, self._console)
+            self._supervisor.watch("serial-listener-{}".format(radio.get_name()), radio.create_serial_listener(),
+                                   radio.create_serial_listener)
+            self._supervisor.watch("neighbour-request-timer-{}".format(radio.get_name()),
+                                   radio.get_neighbour_request_timer())
+            radios.append(radio)
+        return radios
+
+    def _create_memory_budget(self) -> MemoryBudget:
+        memory_budget = MemoryBudget(self._data.get_configuration()['memory']['budget'])
+        memory_budget.register("node-table", self._node_table, "node-table")
+        for radio in self._radios:
+            memory_budget.register("buffer-{}".format(radio.get_name()), radio.get_packet_buffer(), "buffer")
+        memory_budget.register("pending", self._pending_solicitations, "pending")
+        memory_budget.register("flows", self._flow_table, "flows")
+        return memory_budget
+
+    def _get_radio(self, name: str = None) -> Radio:
+        if name is None:
+            return self._radios[0]
+        return {radio.get_name(): radio for radio in self._radios}[name]
+
+    def _radio_command(self, function):
+        """
+        Returns admin command, which calls function with SerialCommands of given radio (all radios by default)
+        """
+        def command(radio: str = None):
+            for current in [self._get_radio(radio)] if radio else self._radios:
+                function(current.get_slip_commands())
+        return command
+
+    def _apply_configuration(self):
+        configuration = self._data.get_configuration()
+        for service in [self._node_table, self._pending_solicitations, self._duplicate_filter, self._purge_timer,
+                        self._snapshot_timer, self._link_quality_timer, self._flow_table, self._responder,
+                        self._root_probe_timer, self._data.get_roots(), self._memory_budget,
+                        self._console] + self._radios:
+            service.apply_configuration(configuration)
+        if not self._pipeline:
+            self._supervisor.get_worker("interface-listener").apply_configuration(configuration)
+
+    def reload_configuration(self) -> dict:
+        """
+        Applies changed live options to running services (SIGHUP or reload command)
+        """
+        with self._reload_lock:
+            try:
+                report = self.configLoader.reload_configuration(self._get_config_path(),
+                                                                self._data.get_configuration())
+            except ConfigurationError as e:
+                logging.error('BRIDGE:configuration reload failed: {}'.format(str(e)))
+                return {"errors": e.errors}
+            except (configparser.Error, OSError) as e:
+                logging.error('BRIDGE:configuration reload failed: {}'.format(str(e)))
+                return {"errors": [str(e)]}
+            self._apply_configuration()
+            if [option for option in report["applied"] if option in ["metrics.en", "metrics.bw", "metrics.etx"]]:
+                for radio in self._radios:
+                    radio.get_slip_commands().send_config_to_contiki()
+            logging.info('BRIDGE:configuration reloaded, applied: {}, restart required: {}'.format(
+                report["applied"], report["restart_required"]))
+            return report
+
+    def _create_interface_listener(self):
+        if self._pipeline:
+            return RingListener(self._pipeline.get_rx_ring(), self._packet_parser, self._data)
+        return InterfaceListener(self._data.get_configuration()['wifi']['device'], self._packet_parser, self._data,
+                                 self._recorder, self._data.get_configuration()['wifi']['receive-buffer'])
+
+    def _create_admin_server(self) -> AdminServer:
+        admin_server = AdminServer(self._data.get_configuration()['admin']['socket'])
+        previous = getattr(self, "_admin_server", None)
+        if previous:
+            admin_server.copy_commands(previous)
+        self._admin_server = admin_server
+        return admin_server
+
+    def _create_kernel_neighbour_monitor(self) -> KernelNeighbourMonitor:
+        self._kernel_neighbours = KernelNeighbourMonitor(self._data.get_configuration()['wifi']['device'], self._data,
+                                                         self._node_table)
+        return self._kernel_neighbours
 
     def _boot_event_subscribers(self):
-        self._input_parser.subscribe_event(ContikiBootEvent, self._slip_commands)
-        self._packet_buffer.subscribe_event(SerialPacketToSendEvent, self._packed_sender)
-        self._input_parser.subscribe_event(SerialPacketToSendEvent, self._packed_sender)
-        self._interface_listener.get_ipv6_packet_parser().subscribe_event(PacketSendToSerialEvent,
-                                                                          self._slip_commands)
-        self._interface_listener.get_ipv6_packet_parser().subscribe_event(PacketForwardToSerialEvent,
-                                                                          self._slip_commands)
-        self._node_table.subscribe_event(NewNodeEvent, self._neighbour_manager)
-        self._node_table.subscribe_event(NodeRefreshEvent, self._neighbour_manager)
-        self._packet_parser.subscribe_event(NeighbourSolicitationEvent, self._neighbour_manager)
-        self._packet_parser.subscribe_event(NeighbourAdvertisementEvent, self._neighbour_manager)
-        self._packet_parser.subscribe_event(RootPacketForwardEvent, self._packet_buffer)
-        self._input_parser.subscribe_event(MoteGlobalAddressEvent, self._ip_configurator)
-        self._input_parser.subscribe_event(RequestRouteToMoteEvent, self._neighbour_manager)
+        for radio in self._radios:
+            radio.subscribe_events(self._packed_sender, self._link_monitor, self._bundle_aggregator)
+        self._node_table.subscribe_event(NewNodeEvent, self._radios[0].get_neighbour_manager())
+        self._node_table.subscribe_event(NodeRefreshEvent, self._radios[0].get_neighbour_manager())
+        self._radios[0].get_serial_parser().subscribe_event(MoteGlobalAddressEvent, self._ip_configurator)
         self._data.subscribe_event(ChangeModeEvent, self._ip_configurator)
-        self._packet_buffer.subscribe_event(PacketBuffEvent, self._slip_commands)
-        self._input_parser.subscribe_event(ResponseToPacketRequest, self._packet_buffer)
-        self._input_parser.subscribe_event(HelloBridgeRequestEvent, self._slip_commands)
+        for radio in self._radios:
+            radio.get_serial_parser().subscribe_event(MoteGlobalAddressEvent, self._flow_table)
+            radio.get_data().subscribe_event(ChangeModeEvent, self._flow_table)
+        self._bundle_aggregator.subscribe_event(BundleSendEvent, self._packed_sender)
 
     def _load_commands(self):
-        self._command_listener.add_command(Command("node", self._node_table.print_table, "Shows node table"))
-        self._command_listener.add_command(Command("metric", self._slip_commands.print_metrics_request,
-                                                   "Shows metrics table"))
-        self._command_listener.add_command(Command("flow", self._slip_commands.print_flows_request, "Shows flow table"))
-        self._command_listener.add_command(Command("stats", self._slip_commands.print_statistics, "Prints contiki statistics"))
-        self._command_listener.add_command(Command("data", self._data.print_data, "Prints bridge internal data"))
-        self._command_listener.add_command(Command("pending", self._pending_solicitations.print_pendings,
-                                                   "Prints ICMPv6 pending"))
-        self._command_listener.add_command(Command("buffer", self._packet_buffer.print_buffer_stats,
-                                                   "Shows packet buffer stats"))
+        self._admin_server.add_command(Command("node", self._node_table.get_snapshot,
+                                               "Shows node table (tech, address, stale, offset, limit)"))
+        self._admin_server.add_command(Command("metric", self._radio_command(SerialCommands.print_metrics_request),
+                                               "Shows metrics table (radio)"))
+        self._admin_server.add_command(Command("flow", self._radio_command(SerialCommands.print_flows_request),
+                                               "Shows flow table (radio)"))
+        self._admin_server.add_command(Command("stats", self._radio_command(SerialCommands.print_statistics),
+                                               "Prints contiki statistics (radio)"))
+        self._admin_server.add_command(Command("data",
+                                               lambda radio=None: self._get_radio(radio).get_data().get_snapshot(),
+                                               "Prints bridge internal data (radio)"))
+        self._admin_server.add_command(Command("radios", lambda: {radio.get_name(): radio.get_snapshot()
+                                                                  for radio in self._radios},
+                                               "Shows state of radios"))
+        self._admin_server.add_command(Command("flows", self._flow_table.get_top,
+                                               "Shows top flows of bridge (limit, order, direction)"))
+        self._admin_server.add_command(Command("roots", self._data.get_roots().get_snapshot,
+                                               "Shows roots (border routers) and their liveness"))
+        self._admin_server.add_command(Command("pending", self._pending_solicitations.get_snapshot,
+                                               "Prints ICMPv6 pending"))
+        self._admin_server.add_command(Command("buffer", lambda radio=None, offset=0, limit=100:
+                                               self._get_radio(radio).get_packet_buffer().get_snapshot(offset, limit),
+                                               "Shows packet buffer (radio, offset, limit)"))
+        self._admin_server.add_command(Command("boot", self._boot_timer.get_snapshot, "Shows boot timing"))
+        self._admin_server.add_command(Command("workers", self._supervisor.get_snapshot,
+                                               "Shows state of supervised threads"))
+        self._admin_server.add_command(Command("profile", self._thread_monitor.profile,
+                                               "Sampling profiler (start, stop, path, interval)"))
+        self._admin_server.add_command(Command("threads", self._thread_monitor.get_threads,
+                                               "Shows CPU time and wakeups of threads"))
+        self._admin_server.add_command(Command("links", self._link_monitor.get_snapshot,
+                                               "Shows measured quality of wifi links"))
+        self._admin_server.add_command(Command("memory", self._memory_budget.get_snapshot,
+                                               "Shows estimated memory of tables, their limits and peaks"))
+        self._admin_server.add_command(Command("console", self._console.get_lines,
+                                               "Shows recent console lines of contiki (count, radio)"))
+        self._admin_server.add_command(Command("reload", self.reload_configuration,
+                                               "Reloads configuration file and applies live options"))
+        self._admin_server.add_command(Command("quit", self._supervisor.stop, "Stops bridge"))
+        self._admin_server.add_stats_source("config-metrics", lambda: self._data.get_configuration()['metrics'])
+        self._admin_server.add_stats_source("node-table", self._node_table.get_stats)
+        self._admin_server.add_stats_source("buffer", self._radios[0].get_packet_buffer().get_stats)
+        self._admin_server.add_stats_source("dedup", self._duplicate_filter.get_stats)
+        self._admin_server.add_stats_source("link-quality", self._link_monitor.get_metrics)
+        self._admin_server.add_stats_source("bundle", self._bundle_aggregator.get_stats)
+        self._admin_server.add_stats_source("flows", self._flow_table.get_stats)
+        self._admin_server.add_stats_source("ns-responder", self._responder.get_stats)
+        self._admin_server.add_stats_source("root-probes", self._root_probe_timer.get_stats)
+        self._admin_server.add_stats_source("memory", self._memory_budget.get_stats)
+        self._admin_server.add_stats_source("console", self._console.get_stats)
+        if self._radios[0].get_slip_sender().get_link():
+            self._admin_server.add_stats_source("serial-link", self._radios[0].get_slip_sender().get_link().get_stats)
+        if self._pipeline:
+            self._admin_server.add_stats_source("pipeline", self._pipeline.get_stats)
+        if self._kernel_neighbours:
+            self._admin_server.add_stats_source("kernel-neighbours", lambda: self._kernel_neighbours.get_stats())
 
     """
     At first, serial line listeners starts. That allows to handle communication between Linux and Contiki device. After
     that, wifi l2 address is loaded, default modes is set up, linux sends request for configuration and sets own
     configuration. Then system waits, while wifi_global address is not set up. Finally, last threads are started.
+    Waiting is driven by readiness events set by serial listener, serial parser and ip configurator. Main thread is
+    then blocked by supervisor until SIGTERM/SIGINT or quit command, after that bridge is shut down.
     """
     def run(self):
+        self._supervisor.install_signal_handlers(self.reload_configuration)
         try:
-            self._slip_listener.start()
+            self._admin_server.start()
+            self._console.start()
+            self._bundle_aggregator.start()
+            if self._pipeline:
+                self._fib_publisher.start()
+                self._supervisor.get_worker("wifi-receiver").start()
+                self._supervisor.get_worker("wifi-sender").start()
+            for radio in self._radios:
+                self._supervisor.get_worker("serial-listener-{}".format(radio.get_name())).start()
+            self._supervisor.get_worker("interface-listener").start()
+            if self._kernel_neighbours:
+                self._kernel_neighbours.start()
         except:
             print("Error: unable to start thread")
 
         self._ip_configurator.load_wifi_l2_address()
-        self._data.set_mode(Data.MODE_NODE)
-        self._slip_commands.request_config_from_contiki()
-        self._slip_commands.send_config_to_contiki()
+        for radio in self._radios:
+            radio.get_data().set_mode(Data.MODE_NODE)
+        if not self._wait_ready(Data.READY_SERIAL):
+            return self._shutdown()
+        self._boot_timer.mark(Data.READY_SERIAL)
+        for radio in self._radios:
+            radio.get_slip_commands().request_config_from_contiki()
+            radio.get_slip_commands().send_config_to_contiki()
+            radio.get_slip_commands().request_neighbour_updates()
+            radio.get_slip_commands().send_address_contexts()
 
         print("Loading")
-        while not self._data.get_wifi_global_address():
-            print(".")
-            time.sleep(1)
+        if not self._wait_ready(Data.READY_MOTE_ADDRESS):
+            return self._shutdown()
+        self._boot_timer.mark(Data.READY_MOTE_ADDRESS)
+        if not self._wait_ready(Data.READY_WIFI_ADDRESS):
+            return self._shutdown()
+        self._boot_timer.mark(Data.READY_WIFI_ADDRESS)
         print("Configuration loaded, loading listeners")
         try:
-            self._interface_listener.start()
-            self._neighbour_request_timer.start()
+            for radio in self._radios:
+                radio.get_neighbour_request_timer().start()
             self._purge_timer.start()
+            self._root_probe_timer.start()
+            self._snapshot_timer.start()
+            self._link_quality_timer.start()
             print("Listeners loaded, starting command line")
             self._command_listener.start()
         except:
             print("Error: unable to start thread")
-        if self._data.get_mode() == Data.MODE_NODE:
-            self._pending_solicitations.add_pending(self._data.get_configuration()['border-router']['ipv6'],
-                                                    self._packed_sender.send_icmpv6_ns)
-        while 1:
-            pass
+        self._radios[0].get_neighbour_manager().revalidate_stale_nodes()
+        self._boot_timer.mark("ready")
+        self._boot_timer.print_report()
+        self._supervisor.run()
+        self._shutdown()
+
+    def _wait_ready(self, readiness: str) -> bool:
+        for radio in self._radios:
+            while not radio.get_data().wait_ready(readiness, self.LOADING_PRINT_INTERVAL):
+                if self._supervisor.is_stopped():
+                    return False
+                print(".")
+        return True
+
+    """
+    Stops receiving packets from wifi, waits for routing decisions of buffered packets and for transmission of serial
+    data. Then serial line is closed. Whole shutdown is limited by SHUTDOWN_DEADLINE.
+    """
+    def _shutdown(self):
+        deadline = time.monotonic() + self.SHUTDOWN_DEADLINE
+        logging.info('BRIDGE:stopping bridge')
+        self._supervisor.stop()
+        self._supervisor.stop_worker("interface-listener", deadline - time.monotonic())
+        if self._pipeline:
+            self._supervisor.stop_worker("wifi-receiver", deadline - time.monotonic())
+        for radio in self._radios:
+            radio.get_neighbour_request_timer().stop()
+        self._purge_timer.stop()
+        self._root_probe_timer.stop()
+        self._snapshot_timer.stop()
+        self._link_quality_timer.stop()
+        if self._kernel_neighbours:
+            self._kernel_neighbours.stop()
+        self._pending_solicitations.stop_all()
+        try:
+            self._snapshot.write()
+        except OSError as e:
+            logging.error('BRIDGE:writing of node table snapshot failed: {}'.format(str(e)))
+        for radio in self._radios:
+            left = radio.get_packet_buffer().drain(deadline - time.monotonic())
+            if left:
+                logging.warning('BRIDGE:{} buffered packets of {} dropped during shutdown'.format(left,
+                                                                                               radio.get_name()))
+        self._supervisor.stop_worker("bundle-aggregator", deadline - time.monotonic())
+        if self._pipeline:
+            self._supervisor.stop_worker("wifi-sender", deadline - time.monotonic())
+            self._supervisor.stop_worker("fib-publisher", deadline - time.monotonic())
+        for radio in self._radios:
+            radio.get_slip_sender().drain(deadline - time.monotonic())
+            self._supervisor.stop_worker("serial-listener-{}".format(radio.get_name()), deadline - time.monotonic())
+            radio.get_slip_sender().close()
+        self._supervisor.stop_worker("console-sink", deadline - time.monotonic())
+        self._supervisor.stop_worker("admin-server", deadline - time.monotonic())
+        if self._pipeline:
+            self._pipeline.close()
+        if self._recorder:
+            self._recorder.close()
+        logging.info('BRIDGE:bridge stopped')
+
 
 if __name__ == '__main__':
     Boot().run()
@@ -0,0 +1,162 @@
+from threading import Condition
+from utils.stoppable_thread import StoppableThread
+from event_system import EventListener, EventProducer, Event
+import logging
+import struct
+import time
+
+
+class BundleSendEvent(Event):
+    def __init__(self, data: dict):
+        Event.__init__(self, data)
+        logging.debug('BRIDGE:sending bundle frame to "{}"'.format(data['dst_ip']))
+
+    def __str__(self):
+        return "bundle-send-event"
+
+
+class BundleControlEvent(Event):
+    def __init__(self, data: dict):
+        Event.__init__(self, data)
+        logging.debug('BRIDGE:received bundle control message from "{}"'.format(data['src_ip']))
+
+    def __str__(self):
+        return "bundle-control-event"
+
+
+class BundleAggregator(StoppableThread, EventProducer, EventListener):
+    """
+    Aggregates small inner IPv6 packets bound for the same wifi next hop into one bundle frame (UDP to PORT between
+    wifi addresses of bridges). Bundle payload is HEADER, TYPE_BUNDLE and inner packets prefixed by 2-byte length.
+    Queue of next hop is sent after delay or when it would exceed max_bytes. Bundles are sent only to neighbours which
+    announced support by TYPE_HELLO or TYPE_HELLO_ACK, other neighbours get plain frames. Hello is answered even when
+    aggregation is disabled, because every bridge with this class can unpack bundles.
+    """
+    PORT = 61631
+    HEADER = b'\xbb\x01'
+    TYPE_HELLO = 1
+    TYPE_HELLO_ACK = 2
+    TYPE_BUNDLE = 3
+    LENGTH = struct.Struct("!H")
+    HELLO_INTERVAL = 30
+    DEFAULT_DELAY = 0.005
+    DEFAULT_MAX_BYTES = 1200
+
+    def __init__(self, enabled: bool = False, delay: float = DEFAULT_DELAY, max_bytes: int = DEFAULT_MAX_BYTES):
+        StoppableThread.__init__(self)
+        EventProducer.__init__(self)
+        self.add_event_support(BundleSendEvent)
+        self._enabled = enabled
+        self._delay = delay
+        self._max_bytes = max_bytes
+        self._condition = Condition()
+        self._capable = set()
+        self._hello_sent = {}
+        self._queues = {}
+        self.bundles = 0
+        self.bundled_packets = 0
+
+    @classmethod
+    def unpack(cls, payload: bytes) -> list:
+        """
+        Returns inner packets of bundle payload, empty list for malformed bundle
+        """
+        packets = []
+        offset = len(cls.HEADER) + 1
+        while offset + cls.LENGTH.size <= len(payload):
+            length, = cls.LENGTH.unpack_from(payload, offset)
+            offset += cls.LENGTH.size
+            if offset + length > len(payload):
+                logging.warning('BRIDGE:truncated bundle frame dropped')
+                return []
+            packets.append(payload[offset:offset + length])
+            offset += length
+        return packets
+
+    def _send(self, dst_ip: str, dst_l2: str, message_type: int, packets: list = None):
+        payload = bytearray(self.HEADER)
+        payload.append(message_type)
+        for packet in packets or []:
+            payload += self.LENGTH.pack(len(packet))
+            payload += packet
+        self.notify_listeners(BundleSendEvent({"dst_ip": dst_ip, "dst_l2": dst_l2, "payload": bytes(payload)}))
+
+    def _send_hello(self, dst_ip: str, dst_l2: str):
+        now = time.monotonic()
+        if now - self._hello_sent.get(dst_ip, -self.HELLO_INTERVAL) >= self.HELLO_INTERVAL:
+            self._hello_sent.update({dst_ip: now})
+            self._send(dst_ip, dst_l2, self.TYPE_HELLO)
+
+    def _send_bundle(self, dst_ip: str, queue: list):
+        self.bundles += 1
+        self.bundled_packets += len(queue[2])
+        self._send(dst_ip, queue[0], self.TYPE_BUNDLE, queue[2])
+
+    def add(self, dst_ip: str, dst_l2: str, packet) -> bool:
+        """
+        Queues inner IPv6 packet for next hop, returns False when packet has to be sent as plain frame
+        """
+        if not self._enabled:
+            return False
+        if dst_ip not in self._capable:
+            self._send_hello(dst_ip, dst_l2)
+            return False
+        size = self.LENGTH.size + len(packet)
+        if len(self.HEADER) + 1 + size > self._max_bytes:
+            return False
+        full = None
+        with self._condition:
+            queue = self._queues.get(dst_ip)
+            if queue and queue[3] + size > self._max_bytes:
+                full = self._queues.pop(dst_ip)
+                queue = None
+            if not queue:
+                # queue is [l2 address, deadline, packets, bytes]
+                queue = [dst_l2, time.monotonic() + self._delay, [], len(self.HEADER) + 1]
+                self._queues.update({dst_ip: queue})
+                self._condition.notify()
+            queue[2].append(packet)
+            queue[3] += size
+        if full:
+            self._send_bundle(dst_ip, full)
+        return True
+
+    def notify(self, event: Event):
+        if isinstance(event, BundleControlEvent):
+            src_ip = event.get_event()["src_ip"]
+            if src_ip not in self._capable:
+                logging.info('BRIDGE:neighbour "{}" supports bundle frames'.format(src_ip))
+                self._capable.add(src_ip)
+            if event.get_event()["type"] == self.TYPE_HELLO:
+                self._send(src_ip, event.get_event()["src_l2"], self.TYPE_HELLO_ACK)
+
+    def stop(self):
+        StoppableThread.stop(self)
+        with self._condition:
+            self._condition.notify()
+
+    def _pop_expired(self, now: float) -> list:
+        expired = [(dst_ip, queue) for (dst_ip, queue) in self._queues.items() if queue[1] <= now or self.is_stopped()]
+        for dst_ip, queue in expired:
+            del self._queues[dst_ip]
+        return expired
+
+    def run(self):
+        while True:
+            with self._condition:
+                expired = self._pop_expired(time.monotonic())
+                if not expired:
+                    if self.is_stopped():
+                        return
+                    deadlines = [queue[1] for queue in self._queues.values()]
+                    self._condition.wait(max(min(deadlines) - time.monotonic(), 0) if deadlines else None)
+                    continue
+            for dst_ip, queue in expired:
+                self._send_bundle(dst_ip, queue)
+
+    def get_stats(self) -> dict:
+        return {"enabled": self._enabled, "capable_neighbours": len(self._capable), "bundles": self.bundles,
+                "bundled_packets": self.bundled_packets}
+
+    def __str__(self):
+        return "bundle-aggregator"
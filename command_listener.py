@@ -1,4 +1,7 @@
 from threading import Thread
+import json
+import socket
+import sys
 
 
 class Command:
@@ -16,29 +19,77 @@ class Command:
     def get_help_text(self)->str:
         return self.help_text
 
-    def execute_command(self):
-        self._class_method()
+    def execute_command(self, **args):
+        return self._class_method(**args)
+
+
+class AdminClient:
+    """
+    Client of bridge admin socket
+    """
+    TIMEOUT = 5
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def request(self, cmd: str, args: dict = None) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.TIMEOUT)
+            connection.connect(self._path)
+            connection.sendall(json.dumps({"cmd": cmd, "args": args or {}}).encode("UTF-8") + b'\n')
+            response = b''
+            while not response.endswith(b'\n'):
+                data = connection.recv(65536)
+                if not data:
+                    break
+                response += data
+        return json.loads(response.decode("UTF-8"))
 
 
 class CommandListener(Thread):
     """
-    Thread which listens for commands on command line
+    Thread which listens for commands on command line and sends them to admin socket. Command arguments are written as
+    <name>=<value>, e.g. "node tech=rpl limit=20".
     """
-    def __init__(self):
+    def __init__(self, socket_path: str):
         Thread.__init__(self)
-        self.commands = {}
-        self.add_command(Command("help", self.print_help, "Shows help"))
+        self.daemon = True
+        self._client = AdminClient(socket_path)
 
-    def print_help(self):
-        print("{:<20}{}".format("Command", "Command description"))
-        for key, command in self.commands.items():
-            print("{:<20}{}".format(key, command.get_help_text()))
+    @staticmethod
+    def _parse_value(value: str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
 
-    def add_command(self, command: Command):
-        self.commands.update({command.get_command_string(): command})
+    def execute(self, line: str):
+        words = line.split()
+        if not words:
+            return
+        args = {}
+        for word in words[1:]:
+            name, separator, value = word.partition("=")
+            args.update({name: self._parse_value(value) if separator else True})
+        try:
+            response = self._client.request(words[0], args)
+        except (OSError, ValueError) as e:
+            print("Error: bridge admin socket is not available ({})".format(str(e)))
+            return
+        if response["ok"]:
+            print(json.dumps(response["result"], indent=2, sort_keys=True))
+        else:
+            print("Error: {}".format(response["error"]))
 
     def run(self):
         while True:
-            cmd = input(">> ")
-            if cmd in self.commands:
-                self.commands[cmd].execute_command()
+            try:
+                cmd = input(">> ")
+            except EOFError:
+                # stdin is not available (e.g. running as service)
+                return
+            self.execute(cmd)
+
+
+if __name__ == '__main__':
+    CommandListener(sys.argv[1] if len(sys.argv) > 1 else "bridge.sock").run()
@@ -0,0 +1,106 @@
+from collections import deque
+from utils.stoppable_thread import StoppableThread
+from responder import TokenBucket
+import logging
+import sys
+import time
+
+
+class ConsoleSink(StoppableThread):
+    """
+    Console output of contiki devices (prints, timestamps and unknown lines). Serial reader only appends raw line into
+    bounded ring (oldest line is overwritten when ring is full), lines over rate are dropped, so dump of contiki tables
+    never blocks serial reader. Sink thread decodes lines and writes them to output (stdout, file or none) and keeps
+    recent lines for admin socket. Lines written with log flag (unknown lines) are also logged by sink thread.
+    """
+    OUTPUT_STDOUT = "stdout"
+    OUTPUT_NONE = "none"
+    FLUSH_INTERVAL = 0.1
+    HISTORY = 1000
+    DEFAULT_CAPACITY = 4096
+    DEFAULT_RATE = 200.0
+    DEFAULT_BURST = 500
+
+    def __init__(self, output: str = OUTPUT_STDOUT, capacity: int = DEFAULT_CAPACITY, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST):
+        StoppableThread.__init__(self)
+        self._output = output
+        self._ring = deque(maxlen=capacity)
+        self._history = deque(maxlen=self.HISTORY)
+        self._bucket = TokenBucket(rate, burst)
+        self.received = 0
+        self.written = 0
+        self.overwritten = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def write(self, line, radio: str = None, log: bool = False):
+        """
+        Queues line (bytes from serial line or str) without blocking, returns False when line was rate limited
+        """
+        self.received += 1
+        if not self._bucket.consume():
+            self.rate_limited += 1
+            return False
+        if len(self._ring) == self._ring.maxlen:
+            self.overwritten += 1
+        self._ring.append((time.time(), radio, line, log))
+        return True
+
+    @staticmethod
+    def _decode(line) -> str:
+        if isinstance(line, bytes):
+            line = line.decode("UTF-8", "ignore")
+        return line.rstrip("\n")
+
+    def _open(self):
+        if self._output == self.OUTPUT_NONE:
+            return None
+        if self._output == self.OUTPUT_STDOUT:
+            return sys.stdout
+        return open(self._output, "a")
+
+    def flush(self, stream):
+        lines = []
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        while self._ring:
+            created, radio, line, log = self._ring.popleft()
+            text = self._decode(line)
+            if log and debug:
+                logging.debug('CONTIKI:{}'.format(text))
+            self._history.append((created, radio, text))
+            lines.append("[{}] {}\n".format(radio, text) if radio else text + "\n")
+        if not lines or stream is None:
+            return
+        try:
+            stream.write("".join(lines))
+            stream.flush()
+            self.written += len(lines)
+        except OSError as e:
+            self.errors += 1
+            logging.error('BRIDGE:writing of contiki console failed: {}'.format(str(e)))
+
+    def run(self):
+        stream = self._open()
+        try:
+            while self.wait(self.FLUSH_INTERVAL):
+                self.flush(stream)
+            self.flush(stream)
+        finally:
+            if stream is not None and stream is not sys.stdout:
+                stream.close()
+
+    def get_lines(self, count: int = 100, radio: str = None) -> list:
+        """
+        Returns recent console lines, written by sink
+        """
+        lines = [{"time": created, "radio": line_radio, "line": text}
+                 for (created, line_radio, text) in list(self._history) if radio is None or line_radio == radio]
+        return lines[-count:] if count else []
+
+    def apply_configuration(self, configuration: dict):
+        self._bucket.set_rate(configuration['console']['rate'], configuration['console']['burst'])
+
+    def get_stats(self) -> dict:
+        return {"received": self.received, "written": self.written, "queued": len(self._ring),
+                "overwritten": self.overwritten, "rate_limited": self.rate_limited, "errors": self.errors}
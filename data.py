@@ -1,9 +1,13 @@
 import logging
 import netifaces
-import os
+import threading
+import time
 from ipaddress import IPv6Address, IPv6Network, AddressValueError
 from event_system import EventProducer, Event, EventListener
 from packet import ContikiPacket
+from dedup import DuplicateFilter
+from utils.netlink import RouteNetlink, NetlinkBatch, NetlinkError
+from roots import RootSet
 
 
 class PacketBuffEvent(Event):
@@ -15,16 +19,25 @@ class PacketBuffEvent(Event):
         return "packet-buff-event"
 
 
-class PacketBuffer(EventProducer, EventListener):       # todo create packet buffer maximum limit
+class PacketBuffer(EventProducer, EventListener):
     """
-    Buffer which stores packets, which waits for routing decision received over serial line
+    Buffer which stores packets, which waits for routing decision received over serial line. Packets over capacity are
+    dropped, oldest packets are evicted when buffer is over its memory limit.
     """
-    def __init__(self):
+    DRAIN_CHECK_INTERVAL = 0.05
+    DEFAULT_CAPACITY = 1024
+    MEMORY_ENTRY = 96
+
+    def __init__(self, duplicate_filter: DuplicateFilter = None):
         from serial_connection import SerialPacketToSendEvent
+        self._duplicate_filter = duplicate_filter
         self.counter = 1
         self.rpl_sent = 0
         self.wifi_sent = 0
         self.wrong = 0
+        self.dropped = 0
+        self.evicted = 0
+        self._capacity = self.DEFAULT_CAPACITY
         self._packets = {}
         EventListener.__init__(self)
         EventProducer.__init__(self)
@@ -32,6 +45,10 @@ class PacketBuffer(EventProducer, EventListener):       # todo create packet buf
         self.add_event_support(SerialPacketToSendEvent)
 
     def add_packet(self, packet: ContikiPacket):
+        if len(self._packets) >= self._capacity:
+            self.dropped += 1
+            logging.warning('BRIDGE:packet buffer is full, packet dropped')
+            return
         self._packets.update({
             self.counter: packet
         })
@@ -43,15 +60,46 @@ class PacketBuffer(EventProducer, EventListener):       # todo create packet buf
 
     def handle_packet(self, id: int, response: bool):
         from serial_connection import SerialPacketToSendEvent
-        if id in self._packets:
-            if response:
-                self.notify_listeners(SerialPacketToSendEvent(self._packets[id]))
-                self.wifi_sent += 1
-            else:
-                self.rpl_sent += 1
-            del self._packets[id]
-        else:
+        packet = self._packets.pop(id, None)
+        if packet is None:
             self.wrong += 1
+            return
+        if response:
+            if not self._duplicate_filter or not self._duplicate_filter.is_duplicate(packet.get_key()):
+                self.notify_listeners(SerialPacketToSendEvent(packet))
+            self.wifi_sent += 1
+        else:
+            self.rpl_sent += 1
+
+    def drain(self, timeout: float) -> int:
+        """
+        Waits until routing decisions for buffered packets are received, returns number of packets left in buffer
+        """
+        deadline = time.monotonic() + timeout
+        while self._packets and time.monotonic() < deadline:
+            time.sleep(self.DRAIN_CHECK_INTERVAL)
+        return len(self._packets)
+
+    def get_memory(self) -> dict:
+        packets = list(self._packets.values())
+        return {"entries": len(packets),
+                "bytes": sum([self.MEMORY_ENTRY + packet.get_memory_size() for packet in packets])}
+
+    def evict(self, size: int) -> int:
+        """
+        Drops oldest packets to free estimated bytes, returns number of dropped packets
+        """
+        freed = 0
+        evicted = 0
+        for id in list(self._packets.keys()):
+            if freed >= size:
+                break
+            packet = self._packets.pop(id, None)
+            if packet is not None:
+                freed += self.MEMORY_ENTRY + packet.get_memory_size()
+                evicted += 1
+        self.evicted += evicted
+        return evicted
 
     def notify(self, event: Event):
         from interface_listener import RootPacketForwardEvent
@@ -64,9 +112,20 @@ class PacketBuffer(EventProducer, EventListener):       # todo create packet buf
     def __str__(self):
         return "packet-buffer"
 
-    def print_buffer_stats(self):
-        print("Waiting packets: {}\nSent wifi: {}\nSent rpl: {}\nWrong: {}\n".format(
-            len(self._packets), self.wifi_sent, self.rpl_sent, self.wrong))
+    def get_stats(self) -> dict:
+        return {"waiting": len(self._packets), "capacity": self._capacity, "sent_wifi": self.wifi_sent,
+                "sent_rpl": self.rpl_sent, "wrong": self.wrong, "dropped": self.dropped, "evicted": self.evicted}
+
+    def apply_configuration(self, configuration: dict):
+        self._capacity = configuration['buffer']['capacity']
+
+    def get_snapshot(self, offset: int = 0, limit: int = 100) -> dict:
+        packets = list(self._packets.items())
+        return {
+            "stats": self.get_stats(),
+            "packets": [{"id": key, "packet": packet.get_contiki_format()}
+                        for (key, packet) in packets[offset:offset + limit]]
+        }
 
 
 class ChangeModeEvent(Event):
@@ -80,47 +139,67 @@ class ChangeModeEvent(Event):
 
 class Data(EventProducer):
     """
-    Provides simple place for storing base node data
+    Provides simple place for storing base node data. Every radio has own Data with mote state, wifi state (addresses
+    and their readiness) and roots of site are shared with Data of first radio (wifi_data).
     """
     MODE_ROOT = 1
     MODE_NODE = 2
+    READY_SERIAL = "serial-connected"
+    READY_MOTE_ADDRESS = "mote-address-known"
+    READY_WIFI_ADDRESS = "address-configured"
 
-    def __init__(self, configuration):
+    def __init__(self, configuration, wifi_data=None):
         EventProducer.__init__(self)
         self.add_event_support(ChangeModeEvent)
+        self._readiness = {
+            self.READY_SERIAL: threading.Event(),
+            self.READY_MOTE_ADDRESS: threading.Event(),
+            self.READY_WIFI_ADDRESS: wifi_data._readiness[self.READY_WIFI_ADDRESS] if wifi_data else threading.Event()
+        }
         self._mote_global_address = None
         self._mote_link_local_address = None
-        self._wifi_global_address = None
-        self._wifi_l2_address = None
-        self._border_router_l2_address = None
+        self._wifi = wifi_data._wifi if wifi_data else {"global_address": None, "l2_address": None}
+        self._roots = wifi_data._roots if wifi_data else RootSet(configuration['border-router']['ipv6'],
+                                                                 configuration['border-router']['local'],
+                                                                 configuration['border-router']['failure-timeout'])
         self._mode = None
         self._configuration = configuration
 
-    def set_border_router_l2_address(self, border_router_l2):
-        self._border_router_l2_address = border_router_l2
-
-    def get_border_router_l2_address(self):
-        return self._border_router_l2_address
+    def get_roots(self) -> RootSet:
+        return self._roots
 
     def set_mode(self, mode: int):
         if (mode == self.MODE_NODE or mode == self.MODE_ROOT) and mode != self._mode:
             self._mode = mode
             self.notify_listeners(ChangeModeEvent(mode))
 
+    def set_ready(self, readiness: str):
+        self._readiness[readiness].set()
+
+    def is_ready(self, readiness: str) -> bool:
+        return self._readiness[readiness].is_set()
+
+    def wait_ready(self, readiness: str, timeout=None) -> bool:
+        return self._readiness[readiness].wait(timeout)
+
     def set_wifi_global_address(self, global_address):
-        self._wifi_global_address = global_address
+        self._wifi["global_address"] = global_address
+        if global_address:
+            self.set_ready(self.READY_WIFI_ADDRESS)
 
     def get_wifi_global_address(self):
-        return self._wifi_global_address
+        return self._wifi["global_address"]
 
     def set_wifi_l2_address(self, address):
-        self._wifi_l2_address = address
+        self._wifi["l2_address"] = address
 
     def get_wifi_l2_address(self):
-        return self._wifi_l2_address
+        return self._wifi["l2_address"]
 
     def set_mote_global_address(self, global_address):
         self._mote_global_address = global_address
+        if global_address:
+            self.set_ready(self.READY_MOTE_ADDRESS)
 
     def get_mote_global_address(self):
         return self._mote_global_address
@@ -137,39 +216,60 @@ class Data(EventProducer):
     def get_mode(self):
         return self._mode
 
-    def print_data(self):
-        print('Bridge mode: {}\nMote global IP: {:>30}\nMote local IP: {:>30}\nWifi global IP: {:>30}\nWifi MAC{:>30}\n'
-              'Root MAC{:>30}\n'.format("ROOT" if self._mode == self.MODE_ROOT else "NODE", self._mote_global_address,
-                                        self._mote_link_local_address, self._wifi_global_address, self._wifi_l2_address,
-                                        self._border_router_l2_address if self._border_router_l2_address else "None"))
+    def get_snapshot(self) -> dict:
+        return {
+            "mode": "ROOT" if self._mode == self.MODE_ROOT else "NODE",
+            "mote_global_ip": self._mote_global_address,
+            "mote_local_ip": self._mote_link_local_address,
+            "wifi_global_ip": self._wifi["global_address"],
+            "wifi_mac": self._wifi["l2_address"],
+            "roots": self._roots.get_snapshot(),
+            "ready": [readiness for (readiness, event) in self._readiness.items() if event.is_set()]
+        }
 
 
 class IpConfigurator(EventListener):
     """
-    Class responsible for interface configuration
+    Class responsible for interface configuration. Address and route changes are sent over rtnetlink, changes of one
+    configuration step are sent in one batch. In root mode local root addresses are set on interface, other roots are
+    reached by routes over interface. Address is recorded only after its batch succeeds and mode which failed is
+    applied again with next event, so failed batch is retried.
     """
 
-    def __init__(self, data: Data, iface: str, prefix: str, root_address: str):
+    def __init__(self, data: Data, iface: str, prefix: str):
         self._iface = iface
         self._data = data
-        self._root_address = root_address
+        self._roots = data.get_roots()
         self._prefix = IPv6Network(prefix)
+        self._netlink = RouteNetlink()
+        self._failed_mode = None
 
-    def _add_route(self, address: str):
+    def _add_route(self, batch: NetlinkBatch, address: str):
         logging.debug('BRIDGE:adding route to "{}" via "{}" interface'.format(address, self._iface))
-        os.system("ip -6 route add {} dev {}".format(address, self._iface))
+        batch.add_route(address)
 
-    def _remove_route(self, address: str):
+    def _remove_route(self, batch: NetlinkBatch, address: str):
         logging.debug('BRIDGE:removing route to "{}" via "{}" interface'.format(address, self._iface))
-        os.system("ip -6 route del {} dev {}".format(address, self._iface))
+        batch.remove_route(address)
 
-    def _set_address(self, address: str):
+    def _set_address(self, batch: NetlinkBatch, address: str):
         logging.debug('BRIDGE:adding address "{}" to "{}" interface'.format(address, self._iface))
-        os.system("ifconfig {} add {}".format(self._iface, address))
+        batch.add_address(address)
 
-    def _unset_address(self, address: str):
+    def _unset_address(self, batch: NetlinkBatch, address: str):
         logging.debug('BRIDGE:removing address "{}" from "{}" interface'.format(address, self._iface))
-        os.system("ifconfig {} del {}".format(self._iface, address))
+        batch.remove_address(address)
+
+    def _commit(self, batch: NetlinkBatch) -> bool:
+        try:
+            batch.commit()
+        except NetlinkError as e:
+            logging.error('BRIDGE:configuration of "{}" interface failed: {}'.format(self._iface, str(e)))
+            return False
+        except OSError as e:
+            logging.error('BRIDGE:netlink communication failed: {}'.format(str(e)))
+            return False
+        return True
 
     def _get_wifi_global_addressees(self):
         interface = netifaces.ifaddresses(self._iface)
@@ -179,34 +279,34 @@ class IpConfigurator(EventListener):
             logging.debug('BRIDGE:previous ipv6 address not configured for "{}" interface'.format(self._iface))
         return []
 
-    def _remove_current_addresses_from_prefix(self, current_addresses: list):
+    def _remove_current_addresses_from_prefix(self, batch: NetlinkBatch, current_addresses: list):
         for address in current_addresses:
             try:
                 addr_obj = IPv6Address(address['addr'])
                 if addr_obj in self._prefix:
-                    self._unset_address("{}/{}".format(str(addr_obj), self._prefix.prefixlen))
+                    self._unset_address(batch, "{}/{}".format(str(addr_obj), self._prefix.prefixlen))
             except AddressValueError:
                 logging.warning('BRIDGE:interface "{}" has not valid ipv6 address "{}"'.format(self._iface, address))
 
     """
     Gets last ocet from mote global address and concatenates it with configured prefix (new wifi global IPv6 address).
     If new address is same as previously configured address, ends. Else, removes old global IPv6 address. Result sets
-    up as wifi global IPv6 address, sets up routes.
+    up as wifi global IPv6 address, sets up routes. Address is recorded only when configuration succeeds.
     """
     def set_wifi_ipv6_lobal_address(self, mote_global_address: str):
         last_ocet = mote_global_address.split(":")[-1]
         wifi_global_address = str(self._prefix).replace("::", "::{}".format(last_ocet))
 
-        if wifi_global_address == self._data.get_wifi_global_address():
+        if wifi_global_address.split("/")[0] == self._data.get_wifi_global_address():
             return
 
+        batch = self._netlink.batch(self._iface)
         current_addresses = self._get_wifi_global_addressees()
-        self._remove_current_addresses_from_prefix(current_addresses)
-
-        if wifi_global_address != self._data.get_wifi_global_address():
-            self._set_address(wifi_global_address)
+        self._remove_current_addresses_from_prefix(batch, current_addresses)
+        self._set_address(batch, wifi_global_address)
+        self._add_route(batch, "default")
+        if self._commit(batch):
             self._data.set_wifi_global_address(wifi_global_address.split("/")[0])
-        self._add_route("default")
 
     def load_wifi_l2_address(self):
         l2_addr = netifaces.ifaddresses(self._iface)[netifaces.AF_LINK][0]['addr']
@@ -216,14 +316,25 @@ class IpConfigurator(EventListener):
         from serial_connection import MoteGlobalAddressEvent
         if isinstance(event, MoteGlobalAddressEvent):
             self.set_wifi_ipv6_lobal_address(event.get_event())
+            if self._failed_mode is not None:
+                self.apply_mode(self._failed_mode)
         elif isinstance(event, ChangeModeEvent):
-            mode = event.get_event()
-            if mode == Data.MODE_NODE:
-                self._unset_address(self._root_address)
-                self._add_route(self._root_address)
-            elif mode == Data.MODE_ROOT:
-                self._set_address(self._root_address)
-                self._remove_route(self._root_address)
+            self.apply_mode(event.get_event())
+
+    def apply_mode(self, mode: int):
+        """
+        Sets addresses and routes of roots for mode, mode is kept for retry when configuration fails
+        """
+        batch = self._netlink.batch(self._iface)
+        for root_address in self._roots.get_addresses():
+            if mode == Data.MODE_ROOT and self._roots.is_local(root_address):
+                self._set_address(batch, root_address)
+                self._remove_route(batch, root_address)
+            elif mode == Data.MODE_ROOT or mode == Data.MODE_NODE:
+                if self._roots.is_local(root_address):
+                    self._unset_address(batch, root_address)
+                self._add_route(batch, root_address)
+        self._failed_mode = None if self._commit(batch) else mode
 
     def __str__(self):
         return "ip-configurator"
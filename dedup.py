@@ -0,0 +1,51 @@
+from threading import Lock
+import time
+
+
+class DuplicateFilter:
+    """
+    Time-bounded set of recently forwarded packets with fixed memory. Keys are stored in ring of CAPACITY slots, key
+    overwritten in ring is removed from index, so index never grows over CAPACITY. Packet is duplicate when same key
+    was seen during WINDOW seconds.
+    """
+    DEFAULT_CAPACITY = 4096
+    DEFAULT_WINDOW = 1.0
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, window: float = DEFAULT_WINDOW):
+        self._capacity = capacity
+        self._window = window
+        self._ring = [None] * capacity
+        self._position = 0
+        self._seen = {}
+        self._lock = Lock()
+        self.checked = 0
+        self.hits = 0
+
+    def is_duplicate(self, key: int) -> bool:
+        """
+        Checks key and remembers it when it was not seen
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.checked += 1
+            seen = self._seen.get(key)
+            if seen is not None and now - seen < self._window:
+                self.hits += 1
+                return True
+            old = self._ring[self._position]
+            if old is not None and self._seen.get(old[0]) == old[1]:
+                del self._seen[old[0]]
+            self._ring[self._position] = (key, now)
+            self._seen[key] = now
+            self._position = (self._position + 1) % self._capacity
+            return False
+
+    def set_window(self, window: float):
+        self._window = window
+
+    def apply_configuration(self, configuration: dict):
+        self.set_window(configuration['buffer']['dedup-window'])
+
+    def get_stats(self) -> dict:
+        return {"checked": self.checked, "hits": self.hits, "entries": len(self._seen), "capacity": self._capacity,
+                "window": self._window}
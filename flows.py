@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from threading import Lock
+from itertools import count
+from event_system import EventListener, Event
+from data import ChangeModeEvent
+import logging
+import time
+
+
+class Flow:
+    """
+    Record of FlowTable. Cached path is valid only for version (node table routes and epoch of flow table), in which it
+    was computed.
+    """
+    __slots__ = ("direction", "src", "dst", "sport", "dport", "packets", "bytes", "first_seen", "last_seen", "path",
+                 "route", "version", "seen_version")
+
+    def __init__(self, direction: str, contiki_packet, now: float):
+        self.direction = direction
+        self.src = contiki_packet.get_src_ip()
+        self.dst = contiki_packet.get_dst_ip()
+        self.sport = contiki_packet.get_src_port()
+        self.dport = contiki_packet.get_dst_port()
+        self.packets = 0
+        self.bytes = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.path = None
+        self.route = None
+        self.version = None
+        self.seen_version = None
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "direction": self.direction,
+            "src": self.src,
+            "dst": self.dst,
+            "sport": self.sport,
+            "dport": self.dport,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "age": round(now - self.first_seen, 3),
+            "idle": round(now - self.last_seen, 3),
+            "route": self.route
+        }
+
+
+class FlowTable(EventListener):
+    """
+    Bridge-side table of flows keyed by inner 5-tuple (received flows also by outer addresses). Flow counts packets and
+    bytes and caches classification (path) of its first packet, so next packets skip node table lookups and next hop
+    selection. Table is bounded by capacity (least recently used flow is evicted) and idle flows are expired by purge
+    timer. Paths are invalidated by version of node table and by change of mode or mote address. Flows over memory limit
+    are evicted in same order as over capacity.
+    """
+    DIRECTION_RX = "rx"
+    DIRECTION_TX = "tx"
+    DEFAULT_CAPACITY = 4096
+    DEFAULT_IDLE_TIMEOUT = 60
+    MEMORY_FLOW = 640
+
+    def __init__(self, node_table, capacity: int = DEFAULT_CAPACITY, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self._node_table = node_table
+        self._capacity = capacity
+        self._idle_timeout = idle_timeout
+        self._flows = OrderedDict()
+        self._lock = Lock()
+        self._epochs = count(1)
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _get_version(self) -> tuple:
+        return self._node_table.get_version(), self._epoch
+
+    def update(self, direction: str, key, contiki_packet, size: int) -> Flow:
+        """
+        Counts packet into its flow, flow is created for first packet
+        """
+        now = time.monotonic()
+        key = (direction, key)
+        with self._lock:
+            flow = self._flows.get(key)
+            if flow:
+                self._flows.move_to_end(key)
+            else:
+                flow = Flow(direction, contiki_packet, now)
+                self._flows[key] = flow
+                while len(self._flows) > self._capacity:
+                    self._flows.popitem(last=False)
+                    self.evicted += 1
+            flow.packets += 1
+            flow.bytes += size
+            flow.last_seen = now
+        flow.seen_version = self._get_version()
+        return flow
+
+    def get_path(self, flow: Flow):
+        """
+        Returns cached path of flow, None when path is not known or routes changed since it was cached
+        """
+        if flow.path is not None and flow.version == flow.seen_version:
+            self.hits += 1
+            return flow.path
+        self.misses += 1
+        return None
+
+    def set_path(self, flow: Flow, path, route: str):
+        """
+        Caches path computed after update of flow, it is valid for version seen by update
+        """
+        flow.path = path
+        flow.route = route
+        flow.version = flow.seen_version
+
+    def invalidate(self):
+        self._epoch = next(self._epochs)
+
+    def expire(self):
+        """
+        Removes idle flows, flows are ordered by last use, so only idle ones are visited
+        """
+        deadline = time.monotonic() - self._idle_timeout
+        with self._lock:
+            while self._flows:
+                key, flow = next(iter(self._flows.items()))
+                if flow.last_seen > deadline:
+                    break
+                del self._flows[key]
+                self.expired += 1
+
+    def get_memory(self) -> dict:
+        return {"entries": len(self._flows), "bytes": len(self._flows) * self.MEMORY_FLOW}
+
+    def evict(self, size: int) -> int:
+        """
+        Removes least recently used flows to free estimated bytes, returns number of removed flows
+        """
+        evicted = 0
+        with self._lock:
+            while self._flows and evicted * self.MEMORY_FLOW < size:
+                self._flows.popitem(last=False)
+                evicted += 1
+            self.evicted += evicted
+        return evicted
+
+    def notify(self, event: Event):
+        from serial_connection import MoteGlobalAddressEvent
+        if isinstance(event, ChangeModeEvent) or isinstance(event, MoteGlobalAddressEvent):
+            logging.debug('BRIDGE:flow paths invalidated by "{}"'.format(event))
+            self.invalidate()
+
+    def get_top(self, limit: int = 10, order: str = "bytes", direction: str = None) -> list:
+        """
+        Returns flows with most bytes or packets
+        """
+        if order not in ["bytes", "packets"]:
+            raise ValueError('order has to be "bytes" or "packets"')
+        now = time.monotonic()
+        with self._lock:
+            flows = [flow for flow in self._flows.values() if direction is None or flow.direction == direction]
+        flows.sort(key=lambda flow: getattr(flow, order), reverse=True)
+        return [flow.to_dict(now) for flow in flows[:limit]]
+
+    def apply_configuration(self, configuration: dict):
+        self._capacity = configuration['flows']['capacity']
+        self._idle_timeout = configuration['flows']['idle-timeout']
+
+    def get_stats(self) -> dict:
+        return {"flows": len(self._flows), "capacity": self._capacity, "hits": self.hits, "misses": self.misses,
+                "evicted": self.evicted, "expired": self.expired}
+
+    def __str__(self):
+        return "flow-table"
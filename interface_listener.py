@@ -1,9 +1,19 @@
-from threading import Thread
-from scapy.all import *
+from utils.stoppable_thread import StoppableThread
+from scapy.data import ETH_P_ALL, MTU
+from scapy.layers.l2 import Ether
+from scapy.layers.inet6 import IPv6, ICMPv6ND_NS, ICMPv6ND_NA
 from data import Data
 from event_system import EventListener, Event, EventProducer
-from packet import ContikiPacket
+from packet import ContikiPacket, NeighbourAdvertisementCache, parse_frame, build_udp, write_ether_header, \
+    IPPROTO_IPV6, IPPROTO_UDP, UDP_HEADER, ETHER_HEADER
+from recorder import Recorder
+from dedup import DuplicateFilter
+from link_quality import LinkQualityMonitor
+from bundle import BundleAggregator, BundleControlEvent, BundleSendEvent
+from flows import FlowTable
+from utils.rendezvous import select_rendezvous
 import logging
+import socket
 
 
 class PacketSendToSerialEvent(Event):
@@ -46,7 +56,7 @@ class NeighbourAdvertisementEvent(Event):
 class RootPacketForwardEvent(Event):
     def __init__(self, data: ContikiPacket):
         Event.__init__(self, data)
-        logging.debug('BRIDGE:Asking for forward decision for packet "{}"'.format(data.get_contiki_format()))
+        logging.debug('BRIDGE:Asking for forward decision for packet "{}"'.format(data))
 
     def __str__(self):
         return "root-packet-forward"
@@ -54,52 +64,119 @@ class RootPacketForwardEvent(Event):
 
 class Ipv6PacketParser(EventProducer):
     """
-    Class responsible for parsing some kind of packet formats
+    Class responsible for parsing some kind of packet formats. Tunnelled packets are classified once per flow, when flow
+    table is given.
     """
-    def __init__(self, data: Data, node_table):
+    ACTION_DROP = "drop"
+    ACTION_ASK = "ask"
+    ACTION_FORWARD = "forward"
+    ACTION_SEND = "send"
+
+    def __init__(self, data: Data, node_table, duplicate_filter: DuplicateFilter = None,
+                 link_monitor: LinkQualityMonitor = None, flow_table: FlowTable = None):
         EventProducer.__init__(self)
         self._data = data
         self._node_table = node_table
+        self._duplicate_filter = duplicate_filter
+        self._link_monitor = link_monitor
+        self._flow_table = flow_table
         self.add_event_support(PacketSendToSerialEvent)
         self.add_event_support(NeighbourSolicitationEvent)
         self.add_event_support(NeighbourAdvertisementEvent)
         self.add_event_support(RootPacketForwardEvent)
         self.add_event_support(PacketForwardToSerialEvent)
+        self.add_event_support(BundleControlEvent)
+
+    def _is_duplicate(self, contiki_packet: ContikiPacket) -> bool:
+        if self._duplicate_filter and self._duplicate_filter.is_duplicate(contiki_packet.get_key()):
+            logging.debug('BRIDGE:duplicate packet dropped')
+            return True
+        return False
 
     """
     Packed sent from another mote via WIFI must contains two IP headers, first one is used by internal WIFI, but second
-    one contains motes global IPv6 address
+    one contains motes global IPv6 address. Inner packet is kept as memoryview of frame.
     """
-    def _parse_udp(self, packet: Ether):
+    def _parse_udp(self, inner, outer_src: str, outer_dst: str):
         contiki_packet = ContikiPacket()
-        contiki_packet.set_scapy_format(packet)
-
-        ip = packet[IPv6]
-
-        if self._data.get_mode() == Data.MODE_ROOT and ip[0].dst == self._data.get_configuration()['border-router']['ipv6']:
-            ask = False
-            node_address = self._node_table.get_node_address(ip[1].dst, 'rpl')
+        if contiki_packet.set_wire_format(inner):
+            self.handle_udp(contiki_packet, outer_src, outer_dst, contiki_packet.get_dst_ip(),
+                            contiki_packet.get_payload_size())
+
+    def handle_udp(self, contiki_packet: ContikiPacket, outer_src: str, outer_dst: str, inner_dst: str, size: int):
+        if self._link_monitor:
+            self._link_monitor.packet_received(outer_src, size)
+
+        if self._flow_table:
+            key = (outer_src, outer_dst, contiki_packet.get_flow_key())
+            flow = self._flow_table.update(FlowTable.DIRECTION_RX, key, contiki_packet, size)
+            path = self._flow_table.get_path(flow)
+            if path is None:
+                path = self.classify_udp(outer_dst, inner_dst)
+                self._flow_table.set_path(flow, path, path[1])
+        else:
+            path = self.classify_udp(outer_dst, inner_dst)
+        parser, action = path
+        parser.deliver_udp(action, contiki_packet)
+
+    def classify_udp(self, outer_dst: str, inner_dst: str) -> tuple:
+        """
+        Decides what to do with packet of flow, returns parser which delivers packet and action. Decision depends only
+        on addresses, mode and node table, so it is cached for next packets of flow.
+        """
+        if self._data.get_mode() == Data.MODE_ROOT and self._data.get_roots().is_local(outer_dst):
+            node_address = self._node_table.get_node_address(inner_dst, 'rpl')
             if not node_address:
-                logging.warning('BRIDGE:Mote not exists "{}"'.format(ip[1].dst))
+                logging.warning('BRIDGE:Mote not exists "{}"'.format(inner_dst))
+                return self, self.ACTION_DROP
             next_nodes = node_address.get_node_addresses()
             for key in next_nodes:
                 if next_nodes[key].get_tech_type() == "wifi":
-                    ask = True
                     # ask for forward decision (I have route to mote using wifi too)
-                    self.notify_listeners(RootPacketForwardEvent(contiki_packet))
-            if not ask:
-                # forwarding packet using RPL (I don't have route to mote using wifi)
+                    return self, self.ACTION_ASK
+            # forwarding packet using RPL (I don't have route to mote using wifi)
+            return self, self.ACTION_FORWARD
+        elif outer_dst == self._data.get_wifi_global_address():
+            if inner_dst == self._data.get_mote_global_address():
+                return self, self.ACTION_SEND
+        return self, self.ACTION_DROP
+
+    def deliver_udp(self, action: str, contiki_packet: ContikiPacket):
+        if action == self.ACTION_ASK:
+            self.notify_listeners(RootPacketForwardEvent(contiki_packet))
+        elif action == self.ACTION_FORWARD:
+            if not self._is_duplicate(contiki_packet):
                 self.notify_listeners(PacketForwardToSerialEvent(contiki_packet))
-        elif ip[0].dst == self._data.get_wifi_global_address():
-            if ip[1].dst == self._data.get_mote_global_address():
+        elif action == self.ACTION_SEND:
+            if not self._is_duplicate(contiki_packet):
                 self.notify_listeners(PacketSendToSerialEvent(contiki_packet))
 
-    def _parse_icmpv6_ns(self, packet: Ether):      # refactor - add this to neighbour manager
-        target_ip = packet[ICMPv6ND_NS].tgt
-        src_ip = packet[IPv6].src
-        src_l2 = packet.src
+    """
+    Bundle frame from another bridge carries several inner IPv6 packets, each of them is parsed as if it was received
+    in its own frame
+    """
+    def _parse_bundle(self, udp, outer_src: str, outer_dst: str, src_l2: str):
+        payload = udp[UDP_HEADER.size:]
+        if bytes(payload[:len(BundleAggregator.HEADER)]) != BundleAggregator.HEADER or \
+                len(payload) <= len(BundleAggregator.HEADER):
+            return
+        message_type = payload[len(BundleAggregator.HEADER)]
+        if message_type == BundleAggregator.TYPE_BUNDLE:
+            for inner in BundleAggregator.unpack(payload):
+                self._parse_udp(inner, outer_src, outer_dst)
+        else:
+            self.handle_bundle_control(message_type, outer_src, src_l2)
+
+    def handle_bundle_control(self, message_type: int, src_ip: str, src_l2: str):
+        self.notify_listeners(BundleControlEvent({
+            "type": message_type,
+            "src_ip": src_ip,
+            "src_l2": src_l2
+        }))
+
+    def handle_icmpv6_ns(self, src_l2: str, src_ip: str, target_ip: str):      # refactor - add this to neighbour manager
         # i I am root and solicitation wants to get root address or solicitation wants my mote address
-        if (self._data.get_mode() == Data.MODE_ROOT and self._data.get_configuration()['border-router']['ipv6'] == target_ip)\
+        if (self._data.get_mode() == Data.MODE_ROOT and self._data.get_roots().is_local(target_ip))\
                 or (str(self._data.get_mote_global_address()) == target_ip or str(self._data.get_mote_link_local_address()) == target_ip):
             self.notify_listeners(NeighbourSolicitationEvent({
                 "src_l2": src_l2,
@@ -107,124 +184,210 @@ class Ipv6PacketParser(EventProducer):
                 "target_ip": target_ip
             }))
 
-    def _parse_icmpv6_na(self, packet: Ether):
-        target_ip = packet[ICMPv6ND_NA].tgt
-        src_ip = packet[IPv6].src
+    def handle_icmpv6_na(self, src_ip: str, target_ip: str, src_l2: str):
         self.notify_listeners(NeighbourAdvertisementEvent({
             "src_ip": src_ip,
             "target_ip": target_ip,
-            "src_l2_addr": packet.src
+            "src_l2_addr": src_l2
         }))
 
-    def parse(self, packet: Ether):
+    """
+    Data packets (tunnelled UDP and bundle frames) are parsed directly from frame bytes, scapy is used only for other
+    frames (neighbour discovery)
+    """
+    def parse(self, frame: bytes):
         if not self._data.get_mote_global_address():
             logging.warning('BRIDGE:Src IPv6 address of contiki device is unknown can not compare incoming packet')
             return
-        if IPv6 in packet and UDP in packet:
+        parsed = parse_frame(frame)
+        if not parsed:
+            return
+        outer_src, outer_dst, next_header, payload = parsed
+        if next_header == IPPROTO_IPV6:
             try:
-                packet[IPv6][1].dst     # stupid solution for checking dst packet address
-                self._parse_udp(packet)
+                self._parse_udp(payload, outer_src, outer_dst)
             except Exception as e:
                 logging.error('BRIDGE:{}'.format(str(e)))
-        if ICMPv6ND_NS in packet:
-            self._parse_icmpv6_ns(packet)
-        if ICMPv6ND_NA in packet:
-            self._parse_icmpv6_na(packet)
+        elif next_header == IPPROTO_UDP and len(payload) >= UDP_HEADER.size and \
+                UDP_HEADER.unpack_from(payload)[1] == BundleAggregator.PORT:
+            try:
+                self._parse_bundle(payload, outer_src, outer_dst, bytes(frame[6:12]).hex(":"))
+            except Exception as e:
+                logging.error('BRIDGE:{}'.format(str(e)))
+        else:
+            packet = Ether(frame)
+            if ICMPv6ND_NS in packet:
+                self.handle_icmpv6_ns(packet.src, packet[IPv6].src, packet[ICMPv6ND_NS].tgt)
+            if ICMPv6ND_NA in packet:
+                self.handle_icmpv6_na(packet[IPv6].src, packet[ICMPv6ND_NA].tgt, packet.src)
 
 
 class PacketSender(EventListener):
     """
-    Class is reponsible for sending packet over WiFi interface, sending ICMPv6 NS,NA
+    Class is reponsible for sending packet over WiFi interface, sending ICMPv6 NS,NA. Flows to mote with several wifi
+    next hops are spread by weighted rendezvous hashing of inner 5-tuple, so packets of one flow keep the same next hop
+    while it lives and only flows of expired next hop are moved. Inner packets are handed over to bundle aggregator,
+    when it is given. Data frames are built without scapy and sent by raw socket. Selected next hop is cached in flow
+    table, so it is kept for the flow until routes change.
     """
-    def __init__(self, iface, data: Data, node_table):
+    def __init__(self, iface, data: Data, node_table, recorder: Recorder = None,
+                 link_monitor: LinkQualityMonitor = None, aggregator: BundleAggregator = None,
+                 flow_table: FlowTable = None):
         self.iface = iface
         self._data = data
         self._node_table = node_table
+        self._recorder = recorder
+        self._link_monitor = link_monitor
+        self._aggregator = aggregator
+        self._flow_table = flow_table
+        self._advertisements = NeighbourAdvertisementCache()
+        self._socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self._socket.bind((iface, 0))
+
+    def _send(self, frame):
+        if self._recorder:
+            self._recorder.record(Recorder.CHANNEL_WIFI, Recorder.DIRECTION_TX, bytes(frame))
+        self._socket.send(frame)
+
+    def _select_next_hop(self, node, contiki_packet: ContikiPacket):
+        candidates = [next_node for next_node in node.get_node_addresses().values()
+                      if next_node.get_tech_type() == "wifi" and next_node.get_lifetime() > 0]
+        if len(candidates) < 2:
+            return candidates[0] if candidates else None
+        flow = "{};{};{};{}".format(contiki_packet.get_src_ip(), contiki_packet.get_dst_ip(),
+                                    contiki_packet.get_src_port(), contiki_packet.get_dst_port())
+        nodes = {str(next_node.get_ip_address()): next_node for next_node in candidates}
+        weights = [(address, self._link_monitor.get_weight(address) if self._link_monitor else 1.0) for address in nodes]
+        return nodes[select_rendezvous(flow, weights)]
+
+    def _select_path(self, contiki_packet: ContikiPacket) -> tuple:
+        """
+        Returns destination addresses of packet and record of mote with selected next node (in root mode)
+        """
+        if self._data.get_mode() == Data.MODE_NODE:
+            # root of destination mote, multicast L2 address is used while root is not known
+            dst_ip, dst_l2 = self._data.get_roots().select(contiki_packet.get_dst_ip())
+            return dst_ip, dst_l2, None, None
+        node = self._node_table.get_node_address(contiki_packet.get_dst_ip(), 'rpl')
+        if node:
+            next_node = self._select_next_hop(node, contiki_packet)
+            if next_node:
+                return str(next_node.get_ip_address()), next_node.get_l2_address(), node, next_node
+        return None, None, None, None
 
     def send_packet(self, contiki_packet: ContikiPacket):
-        packet = contiki_packet.get_scapy_format()
-        dst_ip = None
-        dst_l2 = None
-        if self._data.get_mode() == Data.MODE_NODE:
-            dst_ip = self._data.get_configuration()['border-router']['ipv6']
-            if self._data.get_border_router_l2_address():
-                dst_l2 = self._data.get_border_router_l2_address()
-            else:
-                dst_l2 = "33:33:00:00:00:fb"        # todo check if it is correct
+        size = contiki_packet.get_payload_size()
+        if self._flow_table:
+            # only next hop selected in root mode is cached, address of border router may be learnt later
+            flow = self._flow_table.update(FlowTable.DIRECTION_TX, contiki_packet.get_flow_key(), contiki_packet, size)
+            path = self._flow_table.get_path(flow)
+            if path is None:
+                path = self._select_path(contiki_packet)
+                if path[3]:
+                    self._flow_table.set_path(flow, path, path[0])
         else:
-            node = self._node_table.get_node_address(packet[IPv6][1].dst, 'rpl')
-            if node:
-                next_nodes = node.get_node_addresses()
-                for addr in next_nodes:
-                    if next_nodes[addr].get_tech_type() == "wifi":
-                        dst_ip = addr
-                        dst_l2 = next_nodes[addr].get_l2_address()
+            path = self._select_path(contiki_packet)
+        dst_ip, dst_l2, node, next_node = path
 
         if dst_ip and dst_l2:
-            packet[Ether].src = self._data.get_wifi_l2_address()
-            packet[Ether].dst = dst_l2
-            packet[IPv6][0].src = self._data.get_wifi_global_address()
-            packet[IPv6][0].dst = dst_ip
-            try:
-                sendp(packet, verbose=False, iface=self.iface)
-            except Exception:
-                print(packet.show())
-                raise Exception("end bitch")
+            if not self._aggregator or not self._aggregator.add(dst_ip, dst_l2, contiki_packet.get_wire_format()):
+                self._send(contiki_packet.get_frame(self._data.get_wifi_l2_address(), dst_l2,
+                                                    self._data.get_wifi_global_address(), dst_ip))
+            if next_node:
+                node.count_forwarded(next_node, size)
+            if self._link_monitor:
+                self._link_monitor.packet_sent(dst_ip, size)
             logging.debug('BRIDGE:sending packet using "{}"'.format(self.iface))
         else:
             print("Unknown destination address while packet sending")
 
-    def send_icmpv6_ns(self, ip_addr: str):
+    def send_bundle(self, dst_ip: str, dst_l2: str, payload: bytes):
+        frame = build_udp(self._data.get_wifi_global_address(), dst_ip, BundleAggregator.PORT, BundleAggregator.PORT,
+                          payload, ETHER_HEADER.size)
+        write_ether_header(frame, self._data.get_wifi_l2_address(), dst_l2)
+        self._send(frame)
+
+    def send_icmpv6_ns(self, ip_addr: str, dst_l2: str = None):
+        """
+        Sends solicitation to all nodes, it is sent as unicast when L2 address of target is known (liveness probe)
+        """
         ether = Ether()
         ether.src = self._data.get_wifi_l2_address()
         ip = IPv6()
         ip.src = self._data.get_wifi_global_address()
         ip.dst = "ff02::1"
+        if dst_l2:
+            ether.dst = dst_l2
+            ip.dst = ip_addr
         icmp = ICMPv6ND_NS()
         icmp.tgt = ip_addr
-        sendp(ether / ip / icmp, verbose=False, iface=self.iface)
+        self._send(bytes(ether / ip / icmp))
+        if self._link_monitor:
+            self._link_monitor.ns_sent(ip_addr)
         logging.debug('BRIDGE:sending neighbour solicitation for target ip "{}"'.format(ip_addr))
 
     def send_icmpv6_na(self, src_l2: str, src_ip: str, target_ip: str):
-        ether = Ether()
-        ether.src = self._data.get_wifi_l2_address()
-        ether.dst = src_l2
-        ip = IPv6()
-        ip.src = self._data.get_wifi_global_address()
-        ip.dst = src_ip
-        icmp = ICMPv6ND_NA()
-        icmp.tgt = target_ip
-        sendp(ether / ip / icmp, verbose=False, iface=self.iface)
+        self._send(self._advertisements.get_frame(self._data.get_wifi_l2_address(),
+                                                  self._data.get_wifi_global_address(), src_l2, src_ip, target_ip))
 
     def notify(self, event: Event):
         from serial_connection import SerialPacketToSendEvent
         if isinstance(event, SerialPacketToSendEvent):
             self.send_packet(event.get_event())
+        elif isinstance(event, BundleSendEvent):
+            self.send_bundle(event.get_event()["dst_ip"], event.get_event()["dst_l2"], event.get_event()["payload"])
 
     def __str__(self):
         return "packet-sender"
 
 
-class InterfaceListener(Thread):
+class InterfaceListener(StoppableThread):
     """
-    Thread which listens for incoming packet on WiFi interface
+    Thread which listens for incoming packet on WiFi interface. Socket is opened immediately, packets are parsed after
+    wifi global address is configured.
     """
-    def __init__(self, iface, packet_parser: Ipv6PacketParser):
-        Thread.__init__(self)
+    RECEIVE_TIMEOUT = 0.5
+    DEFAULT_RECEIVE_BUFFER = 2 ** 30
+
+    def __init__(self, iface, packet_parser: Ipv6PacketParser, data: Data, recorder: Recorder = None,
+                 receive_buffer: int = DEFAULT_RECEIVE_BUFFER):
+        StoppableThread.__init__(self)
         self.iface = iface
         self._packetParser = packet_parser
+        self._data = data
+        self._recorder = recorder
+        self._receive_buffer = receive_buffer
+        self._socket = None
 
     def get_ipv6_packet_parser(self):
         return self._packetParser
 
+    def apply_configuration(self, configuration: dict):
+        self._receive_buffer = configuration['wifi']['receive-buffer']
+        socks = self._socket
+        if socks:
+            socks.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._receive_buffer)
+
     def run(self):
-        time.sleep(5)
         socks = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
-        socks.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2 ** 30)
+        socks.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._receive_buffer)
+        self._socket = socks
         socks.bind((self.iface, ETH_P_ALL))
-        while True:
-            packet, info = socks.recvfrom(MTU)
-            ether_packet = Ether(packet)
-            if info[2] != socket.PACKET_OUTGOING:
-                if IPv6 in ether_packet:
-                    self._packetParser.parse(ether_packet)
+        socks.settimeout(self.RECEIVE_TIMEOUT)
+        try:
+            while not self._data.wait_ready(Data.READY_WIFI_ADDRESS, self.RECEIVE_TIMEOUT):
+                if self.is_stopped():
+                    return
+            while not self.is_stopped():
+                try:
+                    packet, info = socks.recvfrom(MTU)
+                except socket.timeout:
+                    continue
+                if self._recorder and info[2] != socket.PACKET_OUTGOING:
+                    self._recorder.record(Recorder.CHANNEL_WIFI, Recorder.DIRECTION_RX, packet)
+                if info[2] != socket.PACKET_OUTGOING:
+                    self._packetParser.parse(packet)
+        finally:
+            self._socket = None
+            socks.close()
+            logging.info('BRIDGE:closed raw socket on "{}"'.format(self.iface))
@@ -0,0 +1,88 @@
+from ipaddress import IPv6Address, IPv6Network
+from threading import Lock
+from utils.stoppable_thread import StoppableThread
+from utils.netlink import NeighbourNetlink, NUD_REACHABLE, NUD_STALE, NUD_DELAY, NUD_PROBE, NUD_NOARP, NUD_PERMANENT
+from neighbors import NodeTable, NodeAddress
+from data import Data
+import errno
+import logging
+import socket
+
+
+class KernelNeighbourMonitor(StoppableThread):
+    """
+    Thread which follows IPv6 neighbour cache of kernel for wifi interface. Neighbours from wifi subnet seed wifi
+    records of node table and entries of roots set their L2 addresses, reachable entry confirms unknown root before its
+    first NA (liveness of known roots is left to their probes, kernel keeps entry reachable long after root failed).
+    Socket is opened immediately, so current cache is dumped before thread starts.
+    """
+    FRESH_STATES = NUD_REACHABLE | NUD_NOARP | NUD_PERMANENT
+    VALID_STATES = FRESH_STATES | NUD_STALE | NUD_DELAY | NUD_PROBE
+
+    def __init__(self, iface: str, data: Data, node_table: NodeTable):
+        StoppableThread.__init__(self)
+        self._ifindex = socket.if_nametoindex(iface)
+        self._data = data
+        self._node_table = node_table
+        self._subnet = IPv6Network(data.get_configuration()['wifi']['subnet'], strict=False)
+        self._entries = {}
+        self._lock = Lock()
+        self.updates = 0
+        self.seeded = 0
+        self.resyncs = 0
+        self._netlink = NeighbourNetlink()
+        self._netlink.request_dump()
+
+    def get_fresh_l2_address(self, address: str):
+        """
+        Returns L2 address of neighbour, which is reachable according to kernel, None otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(IPv6Address(address).compressed)
+        if entry and entry[1] & self.FRESH_STATES:
+            return entry[0]
+        return None
+
+    def handle_update(self, deleted: bool, state: int, address: str, l2_address: str):
+        address = IPv6Address(address).compressed
+        if deleted or not state & self.VALID_STATES or not l2_address:
+            with self._lock:
+                self._entries.pop(address, None)
+            return
+        with self._lock:
+            self._entries.update({address: (l2_address, state)})
+        self.updates += 1
+        if self._data.get_roots().is_root(address):
+            if state & self.FRESH_STATES and not self._data.get_roots().get_l2_address(address):
+                self._data.get_roots().confirm(address, l2_address)
+            elif self._data.get_roots().get_l2_address(address) != l2_address:
+                logging.info('BRIDGE:L2 address "{}" of root "{}" learnt from kernel'.format(l2_address, address))
+                self._data.get_roots().set_l2_address(address, l2_address)
+        elif IPv6Address(address) in self._subnet:
+            node = self._node_table.get_node_address(address, 'wifi')
+            if not node:
+                self._node_table.add_node_address(NodeAddress(address, 'wifi', l2_address))
+                self.seeded += 1
+            elif node.get_l2_address() != l2_address:
+                self._node_table.update_l2_address(node, l2_address)
+
+    def run(self):
+        try:
+            while not self.is_stopped():
+                try:
+                    updates = self._netlink.receive()
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    logging.warning('BRIDGE:kernel neighbour updates lost, requesting neighbour cache again')
+                    self.resyncs += 1
+                    self._netlink.request_dump()
+                    continue
+                for (deleted, ifindex, state, address, l2_address) in updates:
+                    if ifindex == self._ifindex:
+                        self.handle_update(deleted, state, address, l2_address)
+        finally:
+            self._netlink.close()
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._entries), "updates": self.updates, "seeded": self.seeded, "resyncs": self.resyncs}
@@ -0,0 +1,210 @@
+from threading import Lock
+from event_system import EventListener, Event
+import logging
+import time
+
+
+class LinkStats:
+    """
+    Smoothed measurements of single wifi neighbour, times of last RTT sample and of last activity are kept for expiry
+    """
+    __slots__ = ["rtt", "rtt_at", "updated", "delivery", "tx_rate", "rx_rate", "tx_bytes", "rx_bytes", "tx_packets",
+                 "rx_packets", "_window_tx_bytes", "_window_rx_bytes"]
+
+    def __init__(self, now: float):
+        self.rtt = None
+        self.rtt_at = None
+        self.updated = now
+        self.delivery = 1.0
+        self.tx_rate = 0.0
+        self.rx_rate = 0.0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.tx_packets = 0
+        self.rx_packets = 0
+        self._window_tx_bytes = 0
+        self._window_rx_bytes = 0
+
+    def add_rtt(self, rtt: float, alpha: float, now: float):
+        self.rtt = rtt if self.rtt is None else self.rtt + alpha * (rtt - self.rtt)
+        self.rtt_at = now
+
+    def has_rtt(self, now: float, max_age: float) -> bool:
+        return self.rtt is not None and now - self.rtt_at <= max_age
+
+    def add_tx(self, size: int):
+        self.tx_packets += 1
+        self.tx_bytes += size
+        self._window_tx_bytes += size
+
+    def add_rx(self, size: int):
+        self.rx_packets += 1
+        self.rx_bytes += size
+        self._window_rx_bytes += size
+
+    def close_window(self, interval: float, alpha: float):
+        self.tx_rate += alpha * (self._window_tx_bytes / interval - self.tx_rate)
+        self.rx_rate += alpha * (self._window_rx_bytes / interval - self.rx_rate)
+        self._window_tx_bytes = 0
+        self._window_rx_bytes = 0
+
+    def to_dict(self) -> dict:
+        return {"rtt_ms": round(self.rtt * 1000, 2) if self.rtt is not None else None,
+                "delivery": round(self.delivery, 3), "tx_rate": round(self.tx_rate, 1),
+                "rx_rate": round(self.rx_rate, 1), "tx_packets": self.tx_packets, "tx_bytes": self.tx_bytes,
+                "rx_packets": self.rx_packets, "rx_bytes": self.rx_bytes}
+
+
+class LinkQualityMonitor(EventListener):
+    """
+    Measures wifi links from traffic which bridge already sends and receives: RTT and delivery ratio from NS/NA
+    exchanges, throughput from forwarded packets. Measurements are smoothed by EWMA. Metrics sent to contiki are
+    derived from configured metrics: etx is divided by delivery ratio, bw is scaled by REFERENCE_RTT / rtt. Metrics are
+    reported only when they differ from the last reported ones by more than CHANGE_THRESHOLD. RTT samples older than
+    RTT_MAX_AGE are not used, links without activity for LINK_TIMEOUT and unanswered NS are removed by evaluate.
+    Throughput lowers weight of busy neighbour, so load balancing moves new flows to less loaded links.
+    """
+    ALPHA = 0.25
+    REFERENCE_RTT = 0.01
+    REFERENCE_RATE = 125000.0
+    MIN_DELIVERY = 0.1
+    CHANGE_THRESHOLD = 0.2
+    RTT_MAX_AGE = 60
+    LINK_TIMEOUT = 300
+
+    def __init__(self, data, node_table):
+        EventListener.__init__(self)
+        self._data = data
+        self._node_table = node_table
+        self._links = {}
+        self._pending_ns = {}
+        self._lock = Lock()
+        self._evaluated_at = time.monotonic()
+        self._last_sent = None
+
+    def _get_link(self, address: str, now: float = None) -> LinkStats:
+        now = time.monotonic() if now is None else now
+        link = self._links.get(address)
+        if not link:
+            link = LinkStats(now)
+            self._links.update({address: link})
+        link.updated = now
+        return link
+
+    def _wifi_neighbours(self, mote_address: str) -> list:
+        node = self._node_table.get_node_address(mote_address, 'rpl')
+        if not node:
+            return []
+        return [str(next_node.get_ip_address()) for next_node in node.get_node_addresses().values()
+                if next_node.get_tech_type() == "wifi"]
+
+    def ns_sent(self, target_ip: str):
+        """
+        Previous NS for same target without NA is counted as loss on wifi links to target
+        """
+        now = time.monotonic()
+        with self._lock:
+            if target_ip in self._pending_ns:
+                for address in self._wifi_neighbours(target_ip):
+                    link = self._links.get(address)
+                    if link:
+                        link.delivery += self.ALPHA * (0.0 - link.delivery)
+            self._pending_ns.update({target_ip: now})
+
+    def packet_sent(self, next_hop: str, size: int):
+        with self._lock:
+            self._get_link(next_hop).add_tx(size)
+
+    def packet_received(self, previous_hop: str, size: int):
+        with self._lock:
+            self._get_link(previous_hop).add_rx(size)
+
+    def notify(self, event: Event):
+        from interface_listener import NeighbourAdvertisementEvent
+        from serial_connection import ContikiBootEvent
+        if isinstance(event, NeighbourAdvertisementEvent):
+            now = time.monotonic()
+            with self._lock:
+                sent_at = self._pending_ns.pop(event.get_event()["target_ip"], None)
+                if sent_at is not None:
+                    link = self._get_link(event.get_event()["src_ip"], now)
+                    link.add_rtt(now - sent_at, self.ALPHA, now)
+                    link.delivery += self.ALPHA * (1.0 - link.delivery)
+        elif isinstance(event, ContikiBootEvent):
+            # contiki receives configured metrics after boot
+            self._last_sent = None
+
+    def get_metrics(self) -> dict:
+        configured = self._data.get_configuration()['metrics']
+        metrics = {key: int(configured[key]) for key in ["en", "bw", "etx"]}
+        now = time.monotonic()
+        with self._lock:
+            links = [link for link in self._links.values() if link.has_rtt(now, self.RTT_MAX_AGE)]
+            if not links:
+                return metrics
+            rtt = sum([link.rtt for link in links]) / len(links)
+            delivery = sum([link.delivery for link in links]) / len(links)
+        metrics["etx"] = max(1, int(round(metrics["etx"] / max(delivery, self.MIN_DELIVERY))))
+        metrics["bw"] = max(1, int(round(metrics["bw"] * self.REFERENCE_RTT / max(rtt, 1e-4))))
+        return metrics
+
+    def _is_changed(self, metrics: dict) -> bool:
+        if self._last_sent is None:
+            return True
+        for key, value in metrics.items():
+            if abs(value - self._last_sent[key]) > self.CHANGE_THRESHOLD * max(self._last_sent[key], 1):
+                return True
+        return False
+
+    def evaluate(self):
+        """
+        Closes throughput window and removes idle links and unanswered NS, returns metrics when they changed
+        significantly since last call, None otherwise
+        """
+        now = time.monotonic()
+        with self._lock:
+            interval = max(now - self._evaluated_at, 1e-3)
+            for link in self._links.values():
+                link.close_window(interval, self.ALPHA)
+            self._links = {address: link for (address, link) in self._links.items()
+                           if now - link.updated <= self.LINK_TIMEOUT}
+            self._pending_ns = {address: sent_at for (address, sent_at) in self._pending_ns.items()
+                                if now - sent_at <= self.LINK_TIMEOUT}
+            self._evaluated_at = now
+        metrics = self.get_metrics()
+        if not self._is_changed(metrics):
+            return None
+        logging.info('BRIDGE:wifi link metrics changed to {}'.format(metrics))
+        self._last_sent = metrics
+        return metrics
+
+    def get_link_quality(self, address: str):
+        """
+        Returns (rtt, delivery) of neighbour, None when neighbour was not measured
+        """
+        link = self._links.get(address)
+        if not link or not link.has_rtt(time.monotonic(), self.RTT_MAX_AGE):
+            return None
+        return link.rtt, link.delivery
+
+    def get_weight(self, address: str) -> float:
+        """
+        Returns weight of neighbour for load balancing (delivery / rtt lowered by throughput sent to neighbour).
+        Neighbour which was not measured recently gets mean weight of measured neighbours.
+        """
+        now = time.monotonic()
+        link = self._links.get(address)
+        if link and link.has_rtt(now, self.RTT_MAX_AGE):
+            return self._weight(link)
+        weights = [self._weight(link) for link in list(self._links.values()) if link.has_rtt(now, self.RTT_MAX_AGE)]
+        return sum(weights) / len(weights) if weights else 1.0
+
+    def _weight(self, link: LinkStats) -> float:
+        return link.delivery / max(link.rtt, 1e-4) / (1 + link.tx_rate / self.REFERENCE_RATE)
+
+    def get_snapshot(self) -> dict:
+        with self._lock:
+            return {address: link.to_dict() for (address, link) in self._links.items()}
+
+    def __str__(self):
+        return "link-quality-monitor"
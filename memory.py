@@ -0,0 +1,106 @@
+from threading import Lock
+import logging
+import resource
+
+
+class MemoryBudget:
+    """
+    Memory accounting of bridge tables. Every table reports its entries and estimated bytes (get_memory) and evicts
+    entries by its own policy (evict). Tables are registered into groups (node-table, buffer, pending, flows), every
+    group has share of budget split evenly among its tables. Shares are enforced only when all tables together exceed
+    budget, then every table over its limit evicts down to it. Peaks are kept since start of bridge.
+    """
+    DEFAULT_BUDGET = 32 * 2 ** 20
+    DEFAULT_SHARES = {"node-table": 0.4, "buffer": 0.3, "pending": 0.05, "flows": 0.25}
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        self._budget = budget
+        self._shares = dict(self.DEFAULT_SHARES)
+        self._tables = []
+        self._peaks = {}
+        self._evicted = {}
+        self._peak_total = 0
+        self._last = {}
+        self._lock = Lock()
+        self.enforced = 0
+
+    def register(self, name: str, table, group: str):
+        if group not in self._shares:
+            raise ValueError('unknown memory group "{}"'.format(group))
+        self._tables.append((name, table, group))
+        self._peaks.update({name: {"entries": 0, "bytes": 0}})
+        self._evicted.update({name: 0})
+
+    def _get_limit(self, group: str) -> int:
+        tables = len([table for table in self._tables if table[2] == group])
+        return int(self._budget * self._shares[group] / tables)
+
+    def _measure(self) -> dict:
+        usage = {}
+        for (name, table, group) in self._tables:
+            usage.update({name: table.get_memory()})
+        return usage
+
+    def check(self) -> dict:
+        """
+        Measures tables, updates peaks and evicts entries of tables over their limits when budget is exceeded
+        """
+        with self._lock:
+            usage = self._measure()
+            total = sum([memory["bytes"] for memory in usage.values()])
+            for (name, memory) in usage.items():
+                peak = self._peaks[name]
+                peak.update({"entries": max(peak["entries"], memory["entries"]),
+                             "bytes": max(peak["bytes"], memory["bytes"])})
+            self._peak_total = max(self._peak_total, total)
+            if total > self._budget:
+                self.enforced += 1
+                logging.warning('BRIDGE:memory of tables {} B exceeds budget {} B'.format(total, self._budget))
+                for (name, table, group) in self._tables:
+                    excess = usage[name]["bytes"] - self._get_limit(group)
+                    if excess > 0:
+                        evicted = table.evict(excess)
+                        self._evicted.update({name: self._evicted[name] + evicted})
+                        logging.warning('BRIDGE:{} entries evicted from "{}"'.format(evicted, name))
+                usage = self._measure()
+            self._last = usage
+            return usage
+
+    def apply_configuration(self, configuration: dict):
+        self._budget = configuration['memory']['budget']
+        for group in self._shares:
+            self._shares.update({group: configuration['memory']['{}-share'.format(group)]})
+        if sum(self._shares.values()) > 1:
+            logging.warning('BRIDGE:memory shares of tables are over 1, budget can be exceeded')
+
+    @staticmethod
+    def _get_rss() -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * resource.getpagesize()
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def get_stats(self) -> dict:
+        return {"budget": self._budget, "bytes": sum([memory["bytes"] for memory in self._last.values()]),
+                "peak_bytes": self._peak_total, "enforced": self.enforced}
+
+    def get_snapshot(self) -> dict:
+        """
+        Returns current estimates, limits and peaks of tables and resident memory of process (current and peak)
+        """
+        usage = self._measure()
+        tables = {}
+        for (name, table, group) in self._tables:
+            tables.update({name: {"group": group, "entries": usage[name]["entries"], "bytes": usage[name]["bytes"],
+                                  "limit": self._get_limit(group), "peak_entries": self._peaks[name]["entries"],
+                                  "peak_bytes": self._peaks[name]["bytes"], "evicted": self._evicted[name]}})
+        return {
+            "budget": self._budget,
+            "bytes": sum([memory["bytes"] for memory in usage.values()]),
+            "peak_bytes": self._peak_total,
+            "enforced": self.enforced,
+            "rss": self._get_rss(),
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "tables": tables
+        }
@@ -1,10 +1,11 @@
 import logging
 from ipaddress import IPv6Address
 from interface_listener import PacketSender, NeighbourSolicitationEvent, NeighbourAdvertisementEvent
-from threading import Thread
+from utils.stoppable_thread import StoppableThread
 from event_system import EventListener, Event, EventProducer
 from data import Data
-import time
+from itertools import count
+from threading import Lock
 import math
 
 
@@ -16,37 +17,60 @@ def none_to_str(s):
 
 class NodeAddress:
     """
-    single record for NODE_TABLE
+    single record for NODE_TABLE. Stale record is restored from snapshot and waits for confirmation (refresh). Packets
+    and bytes forwarded over each next node are counted. RPL record knows radio, which reported it. Next nodes and
+    counters are copied on write, so returned dict of next nodes is never changed.
     """
     DEFAULT_LIFETIME = 255
+    STALE_LIFETIME = 30
 
-    def __init__(self, ip_address: IPv6Address, tech_type, l2_address=None):
+    def __init__(self, ip_address: IPv6Address, tech_type, l2_address=None, lifetime: int = DEFAULT_LIFETIME):
         self._ip_address = ip_address
-        self._lifetime = self.DEFAULT_LIFETIME
+        self._lifetime = lifetime
+        self._stale = False
         self._type = tech_type
         self._l2_address = l2_address
         self._next_address = {}
+        self._forwarded = {}
+        self._radio = None
 
     def get_ip_address(self) -> IPv6Address:
         return self._ip_address
 
     def has_neighbor_with_tech(self, tech_type: str):
-        for key in self._next_address:
-            if self._next_address[key].get_tech_type() == tech_type:
+        for next_node in self._next_address.values():
+            if next_node.get_tech_type() == tech_type:
                 return True
         return False
 
     def get_l2_address(self) -> str:
         return self._l2_address
 
+    def set_l2_address(self, l2_address: str):
+        self._l2_address = l2_address
+
     def get_tech_type(self) -> str:
         return self._type
 
+    def get_radio(self) -> str:
+        return self._radio
+
+    def set_radio(self, radio: str):
+        self._radio = radio
+
     def get_lifetime(self) -> int:
         return self._lifetime
 
-    def reset_lifetime(self):
-        self._lifetime = self.DEFAULT_LIFETIME
+    def reset_lifetime(self, lifetime: int = DEFAULT_LIFETIME):
+        self._lifetime = lifetime
+        self._stale = False
+
+    def set_stale(self, lifetime: int):
+        self._stale = True
+        self._lifetime = max(min(lifetime, self.STALE_LIFETIME), 1)
+
+    def is_stale(self) -> bool:
+        return self._stale
 
     def decrease_lifetime(self):
         self._lifetime -= 1
@@ -54,21 +78,51 @@ class NodeAddress:
 
     def add_next_node_address(self, node_address):
         if str(node_address.get_ip_address()) not in self._next_address:
-            self._next_address.update({
+            next_address = dict(self._next_address)
+            next_address.update({
                 str(node_address.get_ip_address()): node_address
             })
+            self._next_address = next_address
             node_address.add_next_node_address(self)
 
     def remove_next_node_address(self, node_address):
-        if str(node_address.get_ip_address()) in self._next_address:
-            del self._next_address[str(node_address.get_ip_address())]
+        key = str(node_address.get_ip_address())
+        if key in self._next_address:
+            self._next_address = {address: value for (address, value) in self._next_address.items() if address != key}
+            if key in self._forwarded:
+                self._forwarded = {address: value for (address, value) in self._forwarded.items() if address != key}
             node_address.remove_next_node_address(self)
 
     def get_node_addresses(self):
         return self._next_address
 
+    def count_forwarded(self, node_address, size: int):
+        counters = self._forwarded.get(str(node_address.get_ip_address()))
+        if counters is None:
+            counters = [0, 0]
+            forwarded = dict(self._forwarded)
+            forwarded.update({str(node_address.get_ip_address()): counters})
+            self._forwarded = forwarded
+        counters[0] += 1
+        counters[1] += size
+
+    def to_dict(self) -> dict:
+        forwarded = self._forwarded
+        return {
+            "ip": str(self._ip_address),
+            "tech": self._type,
+            "lifetime": self._lifetime,
+            "stale": self._stale,
+            "l2": self._l2_address,
+            "radio": self._radio,
+            "next": [{"ip": key, "tech": value.get_tech_type(), "packets": forwarded.get(key, [0, 0])[0],
+                      "bytes": forwarded.get(key, [0, 0])[1]}
+                     for (key, value) in self._next_address.items()]
+        }
+
     def __str__(self):
-        return "{:<30}{:<10}{:<25}[{}]".format(str(self._ip_address), self._lifetime, none_to_str(self._l2_address), "".join(
+        lifetime = "{}{}".format(self._lifetime, "*" if self._stale else "")
+        return "{:<30}{:<10}{:<25}[{}]".format(str(self._ip_address), lifetime, none_to_str(self._l2_address), "".join(
             ["{}({});".format(str(value.get_ip_address()), value.get_tech_type()) for (key, value) in self._next_address.items()]
         ))
 
@@ -91,76 +145,364 @@ class NodeRefreshEvent(Event):
         return "node-refresh-event"
 
 
+class NeighbourEvictionEvent(Event):
+    def __init__(self, data: str):
+        Event.__init__(self, data)
+        logging.warning('BRIDGE:RPL neighbours of radio "{}" evicted, requesting full list'.format(data))
+
+    def __str__(self):
+        return "neighbour-eviction-event"
+
+
 class NodeTable(EventProducer):
     """
-    Class which is represents NODE_TABLE
+    Class which is represents NODE_TABLE. RPL neighbours are either refreshed by full neighbour list or updated
+    incrementally by numbered neighbour deltas pushed by contiki. Every radio has own neighbour generation and full
+    list of radio removes only records reported by that radio (or restored ones). Version is changed by every change of
+    routes (record added or removed, next node linked), so cached paths of flows can be validated by single comparison.
+    Records are copied on write: writers are serialized by lock and publish new dicts of records by single assignment,
+    readers take current dict without lock and it never changes under them. Listeners are notified outside of lock.
     """
-    WIFI_NODE_REFRESH_INTERVAL = math.floor(NodeAddress.DEFAULT_LIFETIME / 2)
-
-    def __init__(self, types: list):
+    NEIGHBOUR_GENERATION_MODULO = 65536
+    DELTA_APPLIED = 1
+    DELTA_GAP = 2
+    DELTA_IGNORED = 3
+    MEMORY_RECORD = 512
+    MEMORY_LINK = 288
+
+    def __init__(self, types: list, lifetime: int = NodeAddress.DEFAULT_LIFETIME):
         EventProducer.__init__(self)
         self.add_event_support(NewNodeEvent)
         self.add_event_support(NodeRefreshEvent)
-        self._nodes = {}
+        self.add_event_support(NeighbourEvictionEvent)
+        self._nodes = {tech_type: {} for tech_type in types}
         self._types = types
-        for tech_type in types:
-            self._nodes.update({
-                tech_type: {}
-            })
+        self._neighbour_generation = {}
+        self._neighbour_resync_pending = {}
+        self._lifetime = lifetime
+        self._refresh_interval = math.floor(lifetime / 2)
+        self._versions = count(1)
+        self._version = 0
+        self._write_lock = Lock()
+        self.evicted = 0
+
+    def _publish(self, changed: dict):
+        """
+        Replaces dicts of records of changed technologies, it has to be called with write lock
+        """
+        nodes = dict(self._nodes)
+        nodes.update(changed)
+        self._nodes = nodes
+        self._version = next(self._versions)
+
+    def _unlink(self, node_address: NodeAddress):
+        for next_node in node_address.get_node_addresses().values():
+            next_node.remove_next_node_address(node_address)
 
     def has_node(self, address: str):
+        nodes = self._nodes
         for node_type in self._types:
-            if address in self._nodes[node_type]:
+            if address in nodes[node_type]:
                 return True
         return False
 
     def get_node_address(self, address: str, type: str):
         addr = IPv6Address(address).compressed      # todo make another solution
-        if addr in self._nodes[type]:
-            return self._nodes[type][addr]
-        return None
-
-    def add_node_address(self, node_address: NodeAddress):
-        if str(node_address.get_ip_address()) not in self._nodes[node_address.get_tech_type()]:
-            self._nodes[node_address.get_tech_type()].update({
-                str(node_address.get_ip_address()): node_address
-            })
+        return self._nodes[type].get(addr)
+
+    def get_node_addresses(self, tech_type: str) -> list:
+        return list(self._nodes[tech_type].values())
+
+    def get_tech_types(self) -> list:
+        return list(self._types)
+
+    def restore_node_address(self, node_address: NodeAddress) -> NodeAddress:
+        """
+        Inserts record without notifications, existing record is kept. Restored stale records are solicited by
+        NeighborManager.revalidate_stale_nodes instead of NewNodeEvent.
+        """
+        tech_type = node_address.get_tech_type()
+        with self._write_lock:
+            current = self._nodes[tech_type].get(str(node_address.get_ip_address()))
+            if current:
+                return current
+            records = dict(self._nodes[tech_type])
+            records.update({str(node_address.get_ip_address()): node_address})
+            self._publish({tech_type: records})
+        return node_address
+
+    def add_node_address(self, node_address: NodeAddress) -> NodeAddress:
+        """
+        Inserts record or resets lifetime of existing one, returns record which is in table
+        """
+        tech_type = node_address.get_tech_type()
+        with self._write_lock:
+            current = self._nodes[tech_type].get(str(node_address.get_ip_address()))
+            if not current:
+                node_address.reset_lifetime(self._lifetime)
+                records = dict(self._nodes[tech_type])
+                records.update({str(node_address.get_ip_address()): node_address})
+                self._publish({tech_type: records})
+        if not current:
             self.notify_listeners(NewNodeEvent(node_address))
-        else:
-            self._nodes[node_address.get_tech_type()][str(node_address.get_ip_address())].reset_lifetime()
-            logging.debug('BRIDGE:refreshed node lifetime "{}"'.format(node_address))
+            return node_address
+        current.reset_lifetime(self._lifetime)
+        logging.debug('BRIDGE:refreshed node lifetime "{}"'.format(node_address))
+        return current
+
+    def _refresh_records(self, records: dict, addresses: list, tech_type: str, radio: str) -> tuple:
+        """
+        Resets lifetime of known nodes, returns copy of records with new nodes (or None when no node is new), new nodes
+        and flag of changed radio. It has to be called with write lock.
+        """
+        changed = None
+        new_nodes = []
+        radio_changed = False
+        for ip_address in addresses:
+            node = records.get(str(ip_address))
+            if node:
+                node.reset_lifetime(self._lifetime)
+                if radio is not None and node.get_radio() != radio:
+                    node.set_radio(radio)
+                    radio_changed = True
+            else:
+                node = NodeAddress(ip_address, tech_type, lifetime=self._lifetime)
+                node.set_radio(radio)
+                if changed is None:
+                    changed = dict(records)
+                changed.update({str(ip_address): node})
+                new_nodes.append(node)
+        return changed, new_nodes, radio_changed
+
+    def _remove_records(self, records: dict, changed: dict, keys: list) -> dict:
+        """
+        Removes records with keys and unlinks them from their next nodes, it has to be called with write lock
+        """
+        for key in keys:
+            if changed is None:
+                changed = dict(records)
+            self._unlink(changed.pop(key))
+        return changed
+
+    def _apply_records(self, tech_type: str, changed: dict, radio_changed: bool):
+        if changed is not None:
+            self._publish({tech_type: changed})
+        elif radio_changed:
+            self._version = next(self._versions)
+
+    def _notify_new_nodes(self, new_nodes: list):
+        for node in new_nodes:
+            self.notify_listeners(NewNodeEvent(node))
+
+    def refresh_node_address(self, ip_address: IPv6Address, tech_type: str, radio: str = None):
+        """
+        Resets lifetime of known node, new record is created only for unknown node
+        """
+        with self._write_lock:
+            changed, new_nodes, radio_changed = self._refresh_records(self._nodes[tech_type], [ip_address], tech_type,
+                                                                      radio)
+            self._apply_records(tech_type, changed, radio_changed)
+        self._notify_new_nodes(new_nodes)
+
+    def is_neighbour_delta_synced(self, radio: str = None) -> bool:
+        return self._neighbour_generation.get(radio) is not None
+
+    def sync_neighbours(self, addresses: list, generation=None, radio: str = None):
+        """
+        Applies full list of RPL neighbours. List with generation number is complete, so missing neighbours are removed
+        and generation is synced. Legacy list without generation only refreshes neighbours, generation is kept.
+        """
+        with self._write_lock:
+            records = self._nodes['rpl']
+            changed, new_nodes, radio_changed = self._refresh_records(records, addresses, 'rpl', radio)
+            if generation is not None:
+                current = set([str(address) for address in addresses])
+                changed = self._remove_records(records, changed, [
+                    key for (key, node) in records.items() if key not in current and node.get_radio() in [radio, None]
+                ])
+                self._neighbour_generation.update({radio: generation})
+                self._neighbour_resync_pending.update({radio: False})
+            self._apply_records('rpl', changed, radio_changed)
+        self._notify_new_nodes(new_nodes)
+
+    def apply_neighbour_delta(self, generation: int, added: list, removed: list, radio: str = None) -> int:
+        """
+        Applies neighbour changes if generation follows previous one. Otherwise deltas are ignored until next full
+        neighbour list is received (DELTA_GAP is returned only for the first missed generation).
+        """
+        with self._write_lock:
+            previous = self._neighbour_generation.get(radio)
+            if previous is None or generation != (previous + 1) % self.NEIGHBOUR_GENERATION_MODULO:
+                self._neighbour_generation.update({radio: None})
+                if self._neighbour_resync_pending.get(radio):
+                    return self.DELTA_IGNORED
+                self._neighbour_resync_pending.update({radio: True})
+                logging.info('BRIDGE:neighbour generation gap, received {}'.format(generation))
+                return self.DELTA_GAP
+            records = self._nodes['rpl']
+            changed, new_nodes, radio_changed = self._refresh_records(records, added, 'rpl', radio)
+            current = changed if changed is not None else records
+            changed = self._remove_records(records, changed, [
+                str(address) for address in set(removed) if str(address) in current and
+                current[str(address)].get_radio() in [radio, None]
+            ])
+            self._apply_records('rpl', changed, radio_changed)
+            self._neighbour_generation.update({radio: generation})
+        self._notify_new_nodes(new_nodes)
+        return self.DELTA_APPLIED
 
     def remove_node_address_record(self, node_address: NodeAddress):
-        if str(node_address.get_ip_address()) in self._nodes[node_address.get_tech_type()]:
-            next_node_addresses = self._nodes[node_address.get_tech_type()][str(node_address.get_ip_address())].get_node_addresses()
-            for key in list(next_node_addresses):
-                next_node_addresses[key].remove_next_node_address(node_address)
-            del self._nodes[node_address.get_tech_type()][str(node_address.get_ip_address())]
+        tech_type = node_address.get_tech_type()
+        with self._write_lock:
+            records = self._nodes[tech_type]
+            if str(node_address.get_ip_address()) in records:
+                self._apply_records(tech_type, self._remove_records(records, None,
+                                                                    [str(node_address.get_ip_address())]), False)
+
+    def add_next_node_address(self, node_address: NodeAddress, next_node_address: NodeAddress):
+        """
+        Links record with its next node (route to mote over wifi node)
+        """
+        with self._write_lock:
+            if str(next_node_address.get_ip_address()) not in node_address.get_node_addresses():
+                node_address.add_next_node_address(next_node_address)
+                self._version = next(self._versions)
+
+    def update_l2_address(self, node_address: NodeAddress, l2_address: str):
+        with self._write_lock:
+            node_address.set_l2_address(l2_address)
+            self._version = next(self._versions)
+
+    def get_version(self) -> int:
+        return self._version
 
     def decrease_lifetime(self):
-        for tech_type in self._types:
-            for node_key in list(self._nodes[tech_type]):
-                node = self._nodes[tech_type][node_key]
-                node.decrease_lifetime()
-                if tech_type == "wifi" and node.get_lifetime() == self.WIFI_NODE_REFRESH_INTERVAL:
-                    self.notify_listeners(NodeRefreshEvent(node))
-                if node.get_lifetime() <= 0:
-                    self.remove_node_address_record(node)
+        refreshed = []
+        with self._write_lock:
+            changed = {}
+            for tech_type in self._types:
+                records = self._nodes[tech_type]
+                expired = []
+                for (key, node) in records.items():
+                    node.decrease_lifetime()
+                    if tech_type == "wifi" and node.get_lifetime() == self._refresh_interval:
+                        refreshed.append(node)
+                    if node.get_lifetime() <= 0:
+                        expired.append(key)
+                if expired:
+                    changed.update({tech_type: self._remove_records(records, None, expired)})
+            if changed:
+                self._publish(changed)
+        for node in refreshed:
+            self.notify_listeners(NodeRefreshEvent(node))
 
     def __str__(self):
-        result = "Node Table\n{:<30}{:<10}{:<25}[{}]\n".format("Dst IP", "Lifetime", "MAC address",
+        nodes = self._nodes
+        result = "Node Table (* stale)\n{:<30}{:<10}{:<25}[{}]\n".format("Dst IP", "Lifetime", "MAC address",
                                                                "next Ip address(technology);")
         for tech_type in self._types:
             result += "Technology {}: \n{}\n".format(tech_type, "\n".join(
-                ["{}".format(value) for (key, value) in self._nodes[tech_type].items()]
+                ["{}".format(value) for (key, value) in nodes[tech_type].items()]
             ))
         return result
 
-    def print_table(self):
-        print(str(self))
+    def get_snapshot(self, tech: str = None, address: str = None, stale: bool = None, offset: int = 0,
+                     limit: int = 100) -> dict:
+        """
+        Returns copy of records filtered by technology, address substring and stale flag
+        """
+        nodes = []
+        records = self._nodes
+        for tech_type in self._types:
+            if tech is None or tech == tech_type:
+                nodes.extend(records[tech_type].values())
+        if address is not None:
+            nodes = [node for node in nodes if address in str(node.get_ip_address())]
+        if stale is not None:
+            nodes = [node for node in nodes if node.is_stale() == stale]
+        return {
+            "total": len(nodes),
+            "offset": offset,
+            "nodes": [node.to_dict() for node in nodes[offset:offset + limit]]
+        }
+
+    def get_stats(self) -> dict:
+        nodes = self._nodes
+        stats = {tech_type: len(nodes[tech_type]) for tech_type in self._types}
+        stats.update({"evicted": self.evicted})
+        return stats
+
+    def get_memory(self) -> dict:
+        """
+        Returns number of records and their estimated bytes (record and its links to next nodes)
+        """
+        nodes = self._nodes
+        records = [node for tech_type in self._types for node in nodes[tech_type].values()]
+        return {"entries": len(records), "bytes": sum([self._get_record_memory(node) for node in records])}
+
+    def _get_record_memory(self, node: NodeAddress) -> int:
+        """
+        Estimated bytes of record and its links, removal frees at least this (links of next nodes go too)
+        """
+        return self.MEMORY_RECORD + len(node.get_node_addresses()) * self.MEMORY_LINK
+
+    @staticmethod
+    def _get_eviction_order(node: NodeAddress) -> tuple:
+        """
+        Stale records go first, then wifi records (unlinked ones before next hops of motes) and RPL neighbours last
+        """
+        return (not node.is_stale(), node.get_tech_type() == 'rpl', len(node.get_node_addresses()) > 0,
+                node.get_lifetime())
+
+    def evict(self, size: int) -> int:
+        """
+        Removes records to free estimated bytes, returns number of removed records. When live RPL neighbour is removed,
+        neighbour generation of its radio is reset, so contiki is asked for full list (NeighbourEvictionEvent) and
+        deltas are ignored until the list comes.
+        """
+        resync = set()
+        with self._write_lock:
+            candidates = sorted([node for tech_type in self._types for node in self._nodes[tech_type].values()],
+                                key=self._get_eviction_order)
+            victims = {tech_type: [] for tech_type in self._types}
+            freed = 0
+            for node in candidates:
+                if freed >= size:
+                    break
+                victims[node.get_tech_type()].append(str(node.get_ip_address()))
+                freed += self._get_record_memory(node)
+                if node.get_tech_type() == 'rpl' and not node.is_stale():
+                    resync.add(node.get_radio())
+            changed = {tech_type: self._remove_records(self._nodes[tech_type], None, keys)
+                       for (tech_type, keys) in victims.items() if keys}
+            if changed:
+                self._publish(changed)
+            for radio in resync:
+                radios = list(self._neighbour_generation.keys()) if radio is None else [radio]
+                for current in radios:
+                    self._neighbour_generation.update({current: None})
+                    self._neighbour_resync_pending.update({current: True})
+            evicted = sum([len(keys) for keys in victims.values()])
+            self.evicted += evicted
+        for radio in resync:
+            self.notify_listeners(NeighbourEvictionEvent(radio))
+        return evicted
+
+    def get_refresh_interval(self) -> int:
+        return self._refresh_interval
+
+    def get_lifetime(self) -> int:
+        return self._lifetime
+
+    def apply_configuration(self, configuration: dict):
+        """
+        New lifetime is used for records created or refreshed from now on
+        """
+        self._lifetime = configuration['neighbours']['lifetime']
+        self._refresh_interval = math.floor(self._lifetime / 2)
 
 
-class PendingEntry(Thread):
+class PendingEntry(StoppableThread):
     """
     Record in PendingSolicitations table. Runs as thread and dies after attempts exceeds
     """
@@ -170,10 +512,13 @@ class PendingEntry(Thread):
     STATUS_SUCCESS = 2
     STATUS_FAILED = 3
 
-    def __init__(self, address: str, sender_function):
-        Thread.__init__(self)
+    def __init__(self, address: str, sender_function, max_attempts: int = MAX_ATTEMPTS,
+                 attempt_delay: int = ATTEMPT_DELAY_MULTIPLICATION):
+        StoppableThread.__init__(self)
         self._address = address
         self._sender_function = sender_function
+        self._max_attempts = max_attempts
+        self._attempt_delay = attempt_delay
         self._attempt = 0
         self._status = self.STATUS_PENDING
 
@@ -188,48 +533,81 @@ class PendingEntry(Thread):
             self._status = status
 
     def run(self):
-        while self._status == self.STATUS_PENDING and self._attempt <= PendingEntry.MAX_ATTEMPTS:
+        while self._status == self.STATUS_PENDING and self._attempt <= self._max_attempts:
             self._sender_function(self._address)
             self.inc_attempt()
-            time.sleep(self._attempt * PendingEntry.ATTEMPT_DELAY_MULTIPLICATION)
+            self.wait(self._attempt * self._attempt_delay)
         if self._status == self.STATUS_PENDING:
             self._status = PendingEntry.STATUS_FAILED
 
     def finish(self):
-        self._attempt = PendingEntry.MAX_ATTEMPTS + 1
+        self._attempt = self._max_attempts + 1
+        self.stop()
 
     def __str__(self):
         return "{:<30}{:5}{:15}".format(self._address, self._attempt, self._status)
 
+    def to_dict(self) -> dict:
+        return {"address": self._address, "attempt": self._attempt, "status": self._status}
+
 
 class PendingSolicitations:
     """
-    Table which manages ICMPv6 neighbor solicitations
+    Table which manages ICMPv6 neighbor solicitations. Table is copied on write (writers are serialized by lock), so
+    readers never lock. Every entry runs own thread, which dominates estimated memory of entry.
     """
+    MEMORY_ENTRY = 16384
+
     def __init__(self):
         self._pendings = {}
+        self._write_lock = Lock()
+        self._max_attempts = PendingEntry.MAX_ATTEMPTS
+        self._attempt_delay = PendingEntry.ATTEMPT_DELAY_MULTIPLICATION
 
     def add_pending(self, address: str, sender_function):
-        if address not in self._pendings:
-            pending = PendingEntry(address, sender_function)
-            self._pendings.update({address: pending})
-            pending.start()
+        with self._write_lock:
+            if address in self._pendings:
+                return
+            pending = PendingEntry(address, sender_function, self._max_attempts, self._attempt_delay)
+            pendings = dict(self._pendings)
+            pendings.update({address: pending})
+            self._pendings = pendings
+        pending.start()
 
     def remove_pending(self, address: str):
-        if address in self._pendings:
-            self._pendings[address].finish()
-            del self._pendings[address]
+        with self._write_lock:
+            pending = self._pendings.get(address)
+            if not pending:
+                return
+            self._pendings = {key: value for (key, value) in self._pendings.items() if key != address}
+        pending.finish()
 
     def get_pending(self, address: str):
-        if address in self._pendings:
-            return self._pendings[address]
+        return self._pendings.get(address)
 
     def has_pending(self, address: str):
         return address in self._pendings
 
     def inc_pending(self, address: str):
-        if address in self._pendings:
-            self._pendings[address].inc_attempt()
+        pending = self._pendings.get(address)
+        if pending:
+            pending.inc_attempt()
+
+    def stop_all(self):
+        for pending in self._pendings.values():
+            pending.stop()
+
+    def get_memory(self) -> dict:
+        return {"entries": len(self._pendings), "bytes": len(self._pendings) * self.MEMORY_ENTRY}
+
+    def evict(self, size: int) -> int:
+        """
+        Finishes oldest solicitations to free estimated bytes, returns number of finished solicitations
+        """
+        addresses = list(self._pendings.keys())[:-(-size // self.MEMORY_ENTRY)]
+        for address in addresses:
+            self.remove_pending(address)
+        return len(addresses)
 
     def __str__(self):
         header = "{:<30}{:10}{:15}\n".format("Ip address", "Attempt", "Status({}-pending/{}-success/{}-failed)".format(
@@ -237,28 +615,53 @@ class PendingSolicitations:
         ))
         return header + "".join(["{}\n".format(value) for (key, value) in self._pendings.items()])
 
-    def print_pendings(self):
-        print(self)
+    def get_snapshot(self) -> list:
+        return [pending.to_dict() for pending in self._pendings.values()]
+
+    def apply_configuration(self, configuration: dict):
+        """
+        New settings are used for solicitations added from now on
+        """
+        self._max_attempts = configuration['neighbours']['pending-attempts']
+        self._attempt_delay = configuration['neighbours']['pending-delay']
 
 
 class NeighborManager(EventListener):
     """
-    Service for management neighbor in NodeTable
+    Service for management neighbor in NodeTable. Solicitations are answered by responder, when it is given.
     """
     def __init__(self, node_table: NodeTable, data: Data, pendings: PendingSolicitations, packet_sender: PacketSender,
-                 slip_commands):
+                 slip_commands, responder=None):
         EventListener.__init__(self)
         self._pendings = pendings
         self._sender = packet_sender
+        self._responder = responder
         self._data = data
         self._node_table = node_table
         self._slip_commands = slip_commands
 
+    def revalidate_stale_nodes(self):
+        """
+        Sends NS for motes restored from snapshot (they were not announced by NewNodeEvent) and for motes, which have
+        wifi route restored from snapshot
+        """
+        for tech_type in self._node_table.get_tech_types():
+            if tech_type == 'wifi':
+                continue
+            for node in self._node_table.get_node_addresses(tech_type):
+                if node.is_stale() or any([next_node.is_stale() for next_node in node.get_node_addresses().values()]):
+                    self._pendings.add_pending(str(node.get_ip_address()), self._sender.send_icmpv6_ns)
+
     def notify(self, event: Event):
         from serial_connection import RequestRouteToMoteEvent
         if isinstance(event, NeighbourSolicitationEvent):
-            self._sender.send_icmpv6_na(src_l2=event.get_event()["src_l2"], src_ip=event.get_event()["src_ip"],
-                                        target_ip=event.get_event()["target_ip"])
+            if self._responder:
+                self._responder.respond(event.get_event()["src_l2"], event.get_event()["src_ip"],
+                                        event.get_event()["target_ip"],
+                                        self._data.get_roots().is_root(event.get_event()["target_ip"]))
+            else:
+                self._sender.send_icmpv6_na(src_l2=event.get_event()["src_l2"], src_ip=event.get_event()["src_ip"],
+                                            target_ip=event.get_event()["target_ip"])
 
         elif isinstance(event, NewNodeEvent):
             technology = event.get_event().get_tech_type()
@@ -281,22 +684,21 @@ class NeighborManager(EventListener):
             target_ip = event.get_event()["target_ip"]
             src_l2_addr = event.get_event()["src_l2_addr"]
 
-            if self._pendings.has_pending(target_ip):
+            if self._data.get_roots().is_root(target_ip):
+                # response to NS for root (border router), answers are liveness of root
+                self._data.get_roots().confirm(target_ip, src_l2_addr)
+            elif self._pendings.has_pending(target_ip):
                 pending = self._pendings.get_pending(target_ip)
                 if pending:
                     pending.set_status(PendingEntry.STATUS_SUCCESS)
-                # response to NS for border router
-                if self._data.get_configuration()['border-router']['ipv6'] == target_ip:
-                    self._data.set_border_router_l2_address(src_l2_addr)
-                else:
-                    wifi_node_address = self._node_table.get_node_address(src_ip, 'wifi')
-                    if not wifi_node_address:
-                        wifi_node_address = NodeAddress(src_ip, 'wifi', src_l2_addr)
-                    self._node_table.add_node_address(wifi_node_address)
-
-                    mote_node_address = self._node_table.get_node_address(target_ip, 'rpl')
-                    if mote_node_address:
-                        mote_node_address.add_next_node_address(wifi_node_address)
+                wifi_node_address = self._node_table.get_node_address(src_ip, 'wifi')
+                if not wifi_node_address:
+                    wifi_node_address = NodeAddress(src_ip, 'wifi', src_l2_addr)
+                wifi_node_address = self._node_table.add_node_address(wifi_node_address)
+
+                mote_node_address = self._node_table.get_node_address(target_ip, 'rpl')
+                if mote_node_address:
+                    self._node_table.add_next_node_address(mote_node_address, wifi_node_address)
         elif isinstance(event, RequestRouteToMoteEvent):
             node = self._node_table.get_node_address(event.get_event()["ip_addr"], 'rpl')
             if node and node.has_neighbor_with_tech('wifi'):
@@ -1,50 +1,357 @@
-from scapy.all import *
 import ipaddress
+import socket
+import struct
+from threading import Lock
+
+ETHER_HEADER = struct.Struct("!6s6sH")
+IPV6_HEADER = struct.Struct("!IHBB16s16s")
+UDP_HEADER = struct.Struct("!HHHH")
+ETH_P_IPV6 = 0x86dd
+IPPROTO_IPV6 = 41
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+ICMPV6_NA = struct.Struct("!BBHI16s")
+ND_NEIGHBOR_ADVERT = 136
+ND_NA_FLAGS = 0xa0000000       # router and override flags (defaults of scapy)
+IPV6_VERSION = 0x60000000
+HOP_LIMIT = 64
+TUNNEL_HEADROOM = ETHER_HEADER.size + IPV6_HEADER.size
+
+
+def _checksum(data) -> int:
+    """
+    Internet checksum, one's complement sum of 16-bit words is equal to value of data modulo 0xffff
+    """
+    if len(data) % 2:
+        data = bytes(data) + b'\x00'
+    return 0xffff - int.from_bytes(data, "big") % 0xffff
+
+
+def write_ether_header(frame: bytearray, src_l2: str, dst_l2: str):
+    ETHER_HEADER.pack_into(frame, 0, bytes.fromhex(dst_l2.replace(":", "")), bytes.fromhex(src_l2.replace(":", "")),
+                           ETH_P_IPV6)
+
+
+def write_ipv6_header(frame: bytearray, offset: int, src_ip: str, dst_ip: str, next_header: int):
+    """
+    Writes IPv6 header at offset, rest of frame is its payload
+    """
+    IPV6_HEADER.pack_into(frame, offset, IPV6_VERSION, len(frame) - offset - IPV6_HEADER.size, next_header, HOP_LIMIT,
+                          socket.inet_pton(socket.AF_INET6, src_ip), socket.inet_pton(socket.AF_INET6, dst_ip))
+
+
+def build_udp(src_ip: str, dst_ip: str, sport: int, dport: int, payload, headroom: int = 0) -> bytearray:
+    """
+    Returns IPv6 packet with UDP datagram placed after headroom (free space for outer headers), so payload is copied
+    only once into frame
+    """
+    src = socket.inet_pton(socket.AF_INET6, src_ip)
+    dst = socket.inet_pton(socket.AF_INET6, dst_ip)
+    length = UDP_HEADER.size + len(payload)
+    udp_offset = headroom + IPV6_HEADER.size
+    packet = bytearray(udp_offset + length)
+    IPV6_HEADER.pack_into(packet, headroom, IPV6_VERSION, length, IPPROTO_UDP, HOP_LIMIT, src, dst)
+    UDP_HEADER.pack_into(packet, udp_offset, sport, dport, length, 0)
+    packet[udp_offset + UDP_HEADER.size:] = payload
+    checksum = _checksum(src + dst + struct.pack("!I3xB", length, IPPROTO_UDP) + packet[udp_offset:])
+    struct.pack_into("!H", packet, udp_offset + 6, checksum)
+    return packet
+
+
+def parse_frame(frame):
+    """
+    Returns (outer src, outer dst, next header, memoryview of IPv6 payload) of ethernet frame, None for other frames
+    """
+    view = memoryview(frame)
+    if len(view) < ETHER_HEADER.size + IPV6_HEADER.size or view[12:14] != b'\x86\xdd':
+        return None
+    version, length, next_header, hop_limit, src_ip, dst_ip = IPV6_HEADER.unpack_from(view, ETHER_HEADER.size)
+    start = ETHER_HEADER.size + IPV6_HEADER.size
+    return socket.inet_ntop(socket.AF_INET6, src_ip), socket.inet_ntop(socket.AF_INET6, dst_ip), next_header, \
+        view[start:start + length]
+
+
+class NeighbourAdvertisementCache:
+    """
+    Prebuilt neighbour advertisement frames per target and own addresses. Copy of template gets only destination
+    addresses and checksum, which is completed from sum of constant part (value of data modulo 0xffff is equal to sum
+    of its 16-bit words).
+    """
+    MAX_TEMPLATES = 64
+
+    def __init__(self):
+        self._templates = {}
+
+    def _build_template(self, src_l2: str, src_ip: str, target_ip: str) -> tuple:
+        frame = bytearray(TUNNEL_HEADROOM + ICMPV6_NA.size)
+        write_ether_header(frame, src_l2, "00:00:00:00:00:00")
+        write_ipv6_header(frame, ETHER_HEADER.size, src_ip, "::", IPPROTO_ICMPV6)
+        ICMPV6_NA.pack_into(frame, TUNNEL_HEADROOM, ND_NEIGHBOR_ADVERT, 0, 0, ND_NA_FLAGS,
+                            socket.inet_pton(socket.AF_INET6, target_ip))
+        constant = int.from_bytes(frame[ETHER_HEADER.size + 8:ETHER_HEADER.size + 24] + frame[TUNNEL_HEADROOM:], "big")
+        return bytes(frame), (constant + ICMPV6_NA.size + IPPROTO_ICMPV6) % 0xffff
+
+    def get_frame(self, src_l2: str, src_ip: str, dst_l2: str, dst_ip: str, target_ip: str) -> bytearray:
+        key = (src_l2, src_ip, target_ip)
+        template = self._templates.get(key)
+        if template is None:
+            if len(self._templates) >= self.MAX_TEMPLATES:
+                self._templates.clear()
+            template = self._build_template(src_l2, src_ip, target_ip)
+            self._templates[key] = template
+        frame = bytearray(template[0])
+        dst = socket.inet_pton(socket.AF_INET6, dst_ip)
+        frame[0:6] = bytes.fromhex(dst_l2.replace(":", ""))
+        frame[ETHER_HEADER.size + 24:TUNNEL_HEADROOM] = dst
+        struct.pack_into("!H", frame, TUNNEL_HEADROOM + 2, 0xffff - (template[1] + int.from_bytes(dst, "big")) % 0xffff)
+        return frame
 
 
 class ContikiPacket:
     """
+    UDP packet of mote. It keeps form in which it came, either contiki format from serial line or inner IPv6 packet
+    of wifi frame (memoryview, not copied). Addresses, ports and payload are decoded on first access and other form is
+    made only when it is needed, packet is never converted through scapy.
     Valid contiki_packet format is: <src_ip>;<dst_ip>;<src_port>;<dst_port>;<payload>
     """
     COAP_PORT = 5683
+    MEMORY_OVERHEAD = 384
+    __slots__ = ("_contiki_format", "_wire_format", "_fields", "_payload")
 
     def __init__(self):
         self._contiki_format = None
-        self._scapy_format = None
-
-    @staticmethod
-    def contiki_to_scapy(contiki_format: str):
-        values = contiki_format.split(";")
-        packet = Ether() / IPv6() / IPv6() / UDP()
-        packet[IPv6][1].src = values[0]
-        packet[IPv6][1].dst = values[1]
-        # packet[UDP].sport = int(values[2])
-        # packet[UDP].dport = int(values[3])
-        packet[UDP].sport = ContikiPacket.COAP_PORT
-        packet[UDP].dport = ContikiPacket.COAP_PORT
-        packet[UDP].payload = bytes.fromhex(values[4])
-        return packet
-
-    @staticmethod
-    def scapy_to_contiki(scapy_format):
-        udp = scapy_format[UDP]
-        raw = ''.join('{:02x}'.format(x) for x in bytes(scapy_format[UDP].payload))
-        src_addr = ipaddress.ip_address(scapy_format[IPv6][1].src)
-        dst_addr = ipaddress.ip_address(scapy_format[IPv6][1].dst)
-        return "{};{};{};{};{}".format(src_addr, dst_addr, udp.sport, udp.dport, raw)
+        self._wire_format = None
+        self._fields = None
+        self._payload = None
 
     def set_contiki_format(self, raw_str: str):
         self._contiki_format = raw_str
+        self._wire_format = None
+        self._fields = None
+        self._payload = None
 
-    def set_scapy_format(self, packet):
-        self._scapy_format = packet
+    def set_wire_format(self, packet):
+        """
+        Sets inner IPv6 packet with UDP datagram, returns False when packet is not UDP
+        """
+        view = memoryview(packet)
+        if len(view) < IPV6_HEADER.size + UDP_HEADER.size or view[6] != IPPROTO_UDP:
+            return False
+        self._contiki_format = None
+        self._wire_format = view[:IPV6_HEADER.size + int.from_bytes(view[4:6], "big")]
+        self._fields = None
+        self._payload = None
+        return True
+
+    def _get_fields(self) -> tuple:
+        if not self._fields:
+            if self._wire_format is not None:
+                wire = self._wire_format
+                sport, dport, length, checksum = UDP_HEADER.unpack_from(wire, IPV6_HEADER.size)
+                self._fields = (socket.inet_ntop(socket.AF_INET6, wire[8:24]),
+                                socket.inet_ntop(socket.AF_INET6, wire[24:40]), sport, dport)
+            else:
+                values = self._contiki_format.split(";", 4)
+                self._fields = (values[0], values[1], int(values[2] or self.COAP_PORT),
+                                int(values[3] or self.COAP_PORT))
+        return self._fields
+
+    def get_src_ip(self) -> str:
+        return self._get_fields()[0]
+
+    def get_dst_ip(self) -> str:
+        return self._get_fields()[1]
+
+    def get_src_port(self) -> int:
+        return self._get_fields()[2]
+
+    def get_dst_port(self) -> int:
+        return self._get_fields()[3]
+
+    def get_payload(self):
+        """
+        Returns bytes or memoryview of wifi frame
+        """
+        if self._payload is None:
+            if self._wire_format is not None:
+                self._payload = self._wire_format[IPV6_HEADER.size + UDP_HEADER.size:]
+            else:
+                self._payload = bytes.fromhex(self._contiki_format[self._contiki_format.rfind(";") + 1:])
+        return self._payload
 
-    def get_contiki_format(self):
+    def get_payload_size(self) -> int:
+        if self._payload is None and self._wire_format is None:
+            return (len(self._contiki_format) - self._contiki_format.rfind(";") - 1) // 2
+        return len(self.get_payload())
+
+    def get_memory_size(self) -> int:
+        """
+        Returns estimated bytes held by packet, packet from wifi holds whole buffer (frame), from which it was parsed
+        """
+        size = self.MEMORY_OVERHEAD
+        if self._contiki_format:
+            size += len(self._contiki_format)
+        if self._wire_format is not None:
+            size += len(self._wire_format.obj)
+        if isinstance(self._payload, bytes):
+            size += len(self._payload)
+        return size
+
+    def get_contiki_format(self) -> str:
         if not self._contiki_format:
-            self._contiki_format = self.scapy_to_contiki(self._scapy_format)
+            src_ip, dst_ip, sport, dport = self._get_fields()
+            self._contiki_format = "{};{};{};{};{}".format(src_ip, dst_ip, sport, dport, self.get_payload().hex())
         return self._contiki_format
 
-    def get_scapy_format(self):
-        if not self._scapy_format:
-            self._scapy_format = self.contiki_to_scapy(self._contiki_format)
-        return self._scapy_format
\ No newline at end of file
+    def get_wire_format(self):
+        """
+        Returns inner IPv6 packet, ports from contiki format are replaced by CoAP port (as motes use it over wifi)
+        """
+        if self._wire_format is None:
+            src_ip, dst_ip, sport, dport = self._get_fields()
+            self._wire_format = memoryview(build_udp(src_ip, dst_ip, self.COAP_PORT, self.COAP_PORT,
+                                                     self.get_payload()))
+        return self._wire_format
+
+    def get_frame(self, src_l2: str, dst_l2: str, outer_src: str, outer_dst: str) -> bytearray:
+        """
+        Returns wifi frame, packet is tunnelled in outer IPv6 header between wifi addresses
+        """
+        if self._wire_format is None:
+            src_ip, dst_ip, sport, dport = self._get_fields()
+            frame = build_udp(src_ip, dst_ip, self.COAP_PORT, self.COAP_PORT, self.get_payload(), TUNNEL_HEADROOM)
+        else:
+            frame = bytearray(TUNNEL_HEADROOM + len(self._wire_format))
+            frame[TUNNEL_HEADROOM:] = self._wire_format
+        write_ether_header(frame, src_l2, dst_l2)
+        write_ipv6_header(frame, ETHER_HEADER.size, outer_src, outer_dst, IPPROTO_IPV6)
+        return frame
+
+    def get_key(self) -> int:
+        """
+        Hash of inner addresses, ports and payload, same for both formats of packet
+        """
+        if self._wire_format is not None:
+            wire = self._wire_format
+            return hash((bytes(wire[8:24]), bytes(wire[24:40]), self.get_src_port(), self.get_dst_port(),
+                         bytes(self.get_payload())))
+        src_ip, dst_ip, sport, dport = self._get_fields()
+        return hash((socket.inet_pton(socket.AF_INET6, src_ip), socket.inet_pton(socket.AF_INET6, dst_ip),
+                     sport, dport, self.get_payload()))
+
+    def get_flow_key(self) -> bytes:
+        """
+        Inner addresses and ports of packet (without payload), same for both formats of packet
+        """
+        if self._wire_format is not None:
+            return bytes(self._wire_format[8:44])
+        src_ip, dst_ip, sport, dport = self._get_fields()
+        return socket.inet_pton(socket.AF_INET6, src_ip) + socket.inet_pton(socket.AF_INET6, dst_ip) + \
+            UDP_HEADER.pack(sport, dport, 0, 0)[:4]
+
+    def __str__(self):
+        return "{};{};{};{}".format(*self._get_fields())
+
+
+class AddressContextTable:
+    """
+    Address contexts (similar to 6LoWPAN IPHC contexts) shared by bridge and contiki. Address from context prefix is
+    sent over serial line as "*<context id:1 hex><interface identifier hex>", other addresses are sent unchanged.
+    Context is used for compression after contiki confirms it ("$x<context id>"). CoAP port is sent as empty field.
+    Table is shared by serial reader and senders, contexts and compression cache are changed under lock.
+    """
+    WIFI_CONTEXT = 0
+    MOTE_CONTEXT = 1
+    COMPRESSED_MARK = "*"
+    CACHE_SIZE = 1024
+
+    def __init__(self):
+        self._contexts = {}
+        self._confirmed = set()
+        self._cache = {}
+        self._lock = Lock()
+
+    def set_context(self, context_id: int, prefix: str) -> bool:
+        """
+        Returns True when context was changed and has to be sent to contiki
+        """
+        network = ipaddress.IPv6Network(prefix, strict=False)
+        with self._lock:
+            if self._contexts.get(context_id) == network:
+                return False
+            self._contexts.update({context_id: network})
+            self._confirmed.discard(context_id)
+            self._cache = {}
+        return True
+
+    def get_contexts(self) -> dict:
+        with self._lock:
+            return dict(self._contexts)
+
+    def confirm(self, context_id: int):
+        with self._lock:
+            if context_id in self._contexts:
+                self._confirmed.add(context_id)
+                self._cache = {}
+
+    def reset_confirmations(self):
+        with self._lock:
+            self._confirmed = set()
+            self._cache = {}
+
+    def compress_address(self, address: str) -> str:
+        with self._lock:
+            compressed = self._cache.get(address)
+            if compressed:
+                return compressed
+            compressed = address
+            try:
+                ip = ipaddress.IPv6Address(address)
+                for context_id in self._confirmed:
+                    network = self._contexts[context_id]
+                    if ip in network:
+                        compressed = "{}{:x}{:x}".format(self.COMPRESSED_MARK, context_id,
+                                                         int(ip) & int(network.hostmask))
+                        break
+            except ValueError:
+                pass
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache = {}
+            self._cache.update({address: compressed})
+            return compressed
+
+    def expand_address(self, address: str):
+        """
+        Returns full address or None for unknown context
+        """
+        if address[:1] != self.COMPRESSED_MARK:
+            return address
+        try:
+            with self._lock:
+                network = self._contexts[int(address[1], 16)]
+            return str(ipaddress.IPv6Address(int(network.network_address) + int(address[2:], 16)))
+        except (KeyError, ValueError, IndexError):
+            return None
+
+    def compress(self, contiki_format: str) -> str:
+        values = contiki_format.split(";", 4)
+        if not self._confirmed or len(values) < 5:
+            return contiki_format
+        coap_port = str(ContikiPacket.COAP_PORT)
+        return "{};{};{};{};{}".format(self.compress_address(values[0]), self.compress_address(values[1]),
+                                       "" if values[2] == coap_port else values[2],
+                                       "" if values[3] == coap_port else values[3], values[4])
+
+    def expand(self, contiki_format: str):
+        """
+        Returns contiki format with full addresses or None when context is unknown
+        """
+        values = contiki_format.split(";", 4)
+        if len(values) < 5:
+            return contiki_format
+        src = self.expand_address(values[0])
+        dst = self.expand_address(values[1])
+        if src is None or dst is None:
+            return None
+        return "{};{};{};{};{}".format(src, dst, values[2] or ContikiPacket.COAP_PORT,
+                                       values[3] or ContikiPacket.COAP_PORT, values[4])
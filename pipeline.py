@@ -0,0 +1,418 @@
+from multiprocessing import get_context
+from scapy.data import ETH_P_ALL, MTU
+from scapy.layers.l2 import Ether
+from scapy.layers.inet6 import IPv6, ICMPv6ND_NS, ICMPv6ND_NA
+from ipaddress import IPv6Address
+from threading import Lock
+from utils.shared_ring import SharedRing, SeqlockRegion
+from utils.stoppable_thread import StoppableThread
+from event_system import EventListener, Event
+from packet import ContikiPacket, NeighbourAdvertisementCache, parse_frame, build_udp, write_ether_header, \
+    IPPROTO_IPV6, IPPROTO_UDP, UDP_HEADER, ETHER_HEADER
+from utils.rendezvous import select_rendezvous
+from roots import select_root
+from bundle import BundleAggregator, BundleSendEvent
+from flows import FlowTable
+from data import Data
+import json
+import logging
+import socket
+
+"""
+Descriptors exchanged by rings are "<kind><field>;<field>;...;<payload>", payload is last, so it can contain ";"
+"""
+KIND_UDP = b'U'                 # outer src, outer dst; inner IPv6 packet
+KIND_NS = b'S'                  # src l2, src ip, target ip
+KIND_NA = b'A'                  # src ip, target ip, src l2
+KIND_BUNDLE_CONTROL = b'C'      # message type, src ip, src l2
+KIND_SEND_PACKET = b'P'         # inner IPv6 packet
+KIND_SEND_NS = b'N'             # target ip, dst l2 (empty for multicast)
+KIND_SEND_NA = b'R'             # dst l2, dst ip, target ip
+KIND_SEND_BUNDLE = b'B'         # dst ip, dst l2; bundle payload
+
+RECEIVE_TIMEOUT = 0.5
+
+
+def encode_descriptor(kind: bytes, fields: list, payload: bytes = b'') -> bytes:
+    return kind + b';'.join([str.encode(str(field)) for field in fields] + [payload])
+
+
+def decode_descriptor(descriptor: bytes, count: int):
+    """
+    Returns list of count fields and payload
+    """
+    parts = descriptor[1:].split(b';', count)
+    return [part.decode() for part in parts[:count]], parts[count]
+
+
+def _configure_process_logging():
+    logging.basicConfig(filename='prod.log', level=logging.DEBUG, format='%(asctime)s [%(levelname)s] %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    logging.getLogger("scapy.runtime").setLevel(logging.CRITICAL)
+
+
+def describe_frame(frame: bytes) -> list:
+    """
+    Converts received wifi frame into descriptors, bundle frame is unpacked into one descriptor per inner packet.
+    Inner packets are copied from frame as they are, scapy decodes only neighbour discovery.
+    """
+    parsed = parse_frame(frame)
+    if not parsed:
+        return []
+    outer_src, outer_dst, next_header, payload = parsed
+    if next_header == IPPROTO_IPV6:
+        return [encode_descriptor(KIND_UDP, [outer_src, outer_dst], payload)]
+    if next_header == IPPROTO_UDP and len(payload) >= UDP_HEADER.size and \
+            UDP_HEADER.unpack_from(payload)[1] == BundleAggregator.PORT:
+        payload = payload[UDP_HEADER.size:]
+        if bytes(payload[:len(BundleAggregator.HEADER)]) != BundleAggregator.HEADER or \
+                len(payload) <= len(BundleAggregator.HEADER):
+            return []
+        message_type = payload[len(BundleAggregator.HEADER)]
+        if message_type == BundleAggregator.TYPE_BUNDLE:
+            return [encode_descriptor(KIND_UDP, [outer_src, outer_dst], inner)
+                    for inner in BundleAggregator.unpack(payload)]
+        return [encode_descriptor(KIND_BUNDLE_CONTROL, [message_type, outer_src, bytes(frame[6:12]).hex(":")])]
+    descriptors = []
+    packet = Ether(frame)
+    if ICMPv6ND_NS in packet:
+        descriptors.append(encode_descriptor(KIND_NS, [packet.src, packet[IPv6].src, packet[ICMPv6ND_NS].tgt]))
+    if ICMPv6ND_NA in packet:
+        descriptors.append(encode_descriptor(KIND_NA, [packet[IPv6].src, packet[ICMPv6ND_NA].tgt, packet.src]))
+    return descriptors
+
+
+def run_wifi_receiver(iface: str, receive_buffer: int, ring_name: str, ring_slots: int, doorbell, stop_event):
+    """
+    Entry point of wifi receiver process: owns raw socket, decodes frames and passes descriptors to bridge process
+    """
+    _configure_process_logging()
+    ring = SharedRing(doorbell, ring_name, ring_slots)
+    socks = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    socks.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    socks.bind((iface, ETH_P_ALL))
+    socks.settimeout(RECEIVE_TIMEOUT)
+    try:
+        while not stop_event.is_set():
+            try:
+                frame, info = socks.recvfrom(MTU)
+            except socket.timeout:
+                continue
+            if info[2] == socket.PACKET_OUTGOING:
+                continue
+            try:
+                descriptors = describe_frame(frame)
+            except Exception as e:
+                logging.error('BRIDGE:{}'.format(str(e)))
+                continue
+            for descriptor in descriptors:
+                if not ring.put(descriptor):
+                    logging.warning('BRIDGE:wifi receiver ring is full or record is oversized, packet dropped')
+    finally:
+        socks.close()
+        ring.close()
+
+
+class WifiFrameSender:
+    """
+    Builds and sends wifi frames in wifi sender process. Addresses and routes to motes are taken from FIB snapshot
+    published by bridge process, next hop is selected same way as in PacketSender.
+    """
+
+    def __init__(self, iface: str, fib: SeqlockRegion):
+        self._socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self._socket.bind((iface, 0))
+        self._fib = fib
+        self._advertisements = NeighbourAdvertisementCache()
+        self._sequence = None
+        self._state = None
+
+    def _get_state(self) -> dict:
+        if self._fib.get_sequence() != self._sequence:
+            self._sequence, data = self._fib.read()
+            self._state = json.loads(data.decode()) if data else None
+        return self._state
+
+    def _route(self, state: dict, contiki_packet: ContikiPacket):
+        if state["mode"] == Data.MODE_NODE:
+            return select_root(state["roots"], contiki_packet.get_dst_ip())
+        next_hops = state["routes"].get(IPv6Address(contiki_packet.get_dst_ip()).compressed)
+        if not next_hops:
+            return None, None
+        flow = "{};{};{};{}".format(contiki_packet.get_src_ip(), contiki_packet.get_dst_ip(),
+                                    contiki_packet.get_src_port(), contiki_packet.get_dst_port())
+        address = select_rendezvous(flow, [(next_hop[0], next_hop[2]) for next_hop in next_hops])
+        return address, [next_hop[1] for next_hop in next_hops if next_hop[0] == address][0]
+
+    def send(self, descriptor: bytes):
+        state = self._get_state()
+        if not state:
+            logging.warning('BRIDGE:FIB snapshot is not published yet, frame dropped')
+            return
+        kind = descriptor[:1]
+        if kind == KIND_SEND_PACKET:
+            fields, payload = decode_descriptor(descriptor, 0)
+            contiki_packet = ContikiPacket()
+            if not contiki_packet.set_wire_format(payload):
+                return
+            dst_ip, dst_l2 = self._route(state, contiki_packet)
+            if not dst_ip or not dst_l2:
+                logging.warning('BRIDGE:unknown destination address while packet sending')
+                return
+            frame = contiki_packet.get_frame(state["wifi_l2"], dst_l2, state["wifi_ip"], dst_ip)
+        elif kind == KIND_SEND_NS:
+            fields, payload = decode_descriptor(descriptor, 2)
+            if fields[1]:
+                frame = bytes(Ether(src=state["wifi_l2"], dst=fields[1]) / IPv6(src=state["wifi_ip"], dst=fields[0]) /
+                              ICMPv6ND_NS(tgt=fields[0]))
+            else:
+                frame = bytes(Ether(src=state["wifi_l2"]) / IPv6(src=state["wifi_ip"], dst="ff02::1") /
+                              ICMPv6ND_NS(tgt=fields[0]))
+        elif kind == KIND_SEND_NA:
+            fields, payload = decode_descriptor(descriptor, 3)
+            frame = self._advertisements.get_frame(state["wifi_l2"], state["wifi_ip"], fields[0], fields[1], fields[2])
+        elif kind == KIND_SEND_BUNDLE:
+            fields, payload = decode_descriptor(descriptor, 2)
+            frame = build_udp(state["wifi_ip"], fields[0], BundleAggregator.PORT, BundleAggregator.PORT, payload,
+                              ETHER_HEADER.size)
+            write_ether_header(frame, state["wifi_l2"], fields[1])
+        else:
+            logging.warning('BRIDGE:unknown descriptor "{}"'.format(kind))
+            return
+        self._socket.send(frame)
+
+    def close(self):
+        self._socket.close()
+
+
+def run_wifi_sender(iface: str, ring_name: str, ring_slots: int, doorbell, fib_name: str, fib_size: int, stop_event):
+    """
+    Entry point of wifi sender process, ring is drained before process exits
+    """
+    _configure_process_logging()
+    ring = SharedRing(doorbell, ring_name, ring_slots)
+    fib = SeqlockRegion(fib_name, fib_size)
+    sender = WifiFrameSender(iface, fib)
+    try:
+        while True:
+            descriptor = ring.get(RECEIVE_TIMEOUT)
+            if descriptor is None:
+                if stop_event.is_set():
+                    break
+                continue
+            try:
+                sender.send(descriptor)
+            except Exception as e:
+                logging.error('BRIDGE:{}'.format(str(e)))
+    finally:
+        sender.close()
+        fib.close()
+        ring.close()
+
+
+class ProcessWorker:
+    """
+    Worker process with interface of StoppableThread, so it can be supervised
+    """
+    def __init__(self, context, target, args: tuple):
+        self._stop_event = context.Event()
+        self._process = context.Process(target=target, args=args + (self._stop_event,), daemon=True)
+
+    def start(self):
+        self._process.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def join(self, timeout: float = None):
+        self._process.join(timeout)
+
+
+class ProcessPipeline:
+    """
+    Shared memory of process mode. Wifi receiver process passes descriptors of received frames by one ring, wifi sender
+    process gets descriptors of frames to send by another ring. FIB snapshot is written only by bridge process.
+    Processes are spawned (not forked), because bridge process already runs threads.
+    """
+    def __init__(self, iface: str, ring_slots: int = SharedRing.DEFAULT_SLOTS, receive_buffer: int = 2 ** 30):
+        self._context = get_context("spawn")
+        self._iface = iface
+        self._receive_buffer = receive_buffer
+        self._rx_ring = SharedRing(self._context.Event(), slots=ring_slots)
+        self._tx_ring = SharedRing(self._context.Event(), slots=ring_slots)
+        self._fib = SeqlockRegion()
+
+    def get_rx_ring(self) -> SharedRing:
+        return self._rx_ring
+
+    def get_tx_ring(self) -> SharedRing:
+        return self._tx_ring
+
+    def get_fib(self) -> SeqlockRegion:
+        return self._fib
+
+    def create_receiver(self) -> ProcessWorker:
+        return ProcessWorker(self._context, run_wifi_receiver, (self._iface, self._receive_buffer,
+                                                                self._rx_ring.get_name(), self._rx_ring.get_slots(),
+                                                                self._rx_ring.get_doorbell()))
+
+    def create_sender(self) -> ProcessWorker:
+        return ProcessWorker(self._context, run_wifi_sender, (self._iface, self._tx_ring.get_name(),
+                                                              self._tx_ring.get_slots(), self._tx_ring.get_doorbell(),
+                                                              self._fib.get_name(), self._fib.get_size()))
+
+    def get_stats(self) -> dict:
+        return {"rx_queued": len(self._rx_ring), "tx_queued": len(self._tx_ring),
+                "rx_dropped": self._rx_ring.get_dropped(), "tx_dropped": self._tx_ring.get_dropped(),
+                "rx_oversized": self._rx_ring.get_oversized(), "tx_oversized": self._tx_ring.get_oversized(),
+                "fib_sequence": self._fib.get_sequence()}
+
+    def close(self):
+        self._rx_ring.close()
+        self._tx_ring.close()
+        self._fib.close()
+
+
+class FibPublisher(StoppableThread):
+    """
+    Single writer of FIB snapshot for wifi sender process: own addresses, roots with their liveness and wifi next hops
+    of motes with their weights. Snapshot is written only when it changed.
+    """
+    PUBLISH_INTERVAL = 0.1
+
+    def __init__(self, fib: SeqlockRegion, data: Data, node_table, link_monitor=None):
+        StoppableThread.__init__(self)
+        self._fib = fib
+        self._data = data
+        self._node_table = node_table
+        self._link_monitor = link_monitor
+        self._published = None
+
+    def _build(self) -> bytes:
+        routes = {}
+        for node in self._node_table.get_node_addresses('rpl'):
+            next_hops = [[str(next_node.get_ip_address()), next_node.get_l2_address(),
+                          round(self._link_monitor.get_weight(str(next_node.get_ip_address())), 1)
+                          if self._link_monitor else 1.0]
+                         for next_node in node.get_node_addresses().values()
+                         if next_node.get_tech_type() == "wifi" and next_node.get_lifetime() > 0]
+            if next_hops:
+                routes.update({str(node.get_ip_address()): next_hops})
+        return str.encode(json.dumps({
+            "mode": self._data.get_mode(),
+            "wifi_l2": self._data.get_wifi_l2_address(),
+            "wifi_ip": str(self._data.get_wifi_global_address()),
+            "roots": self._data.get_roots().to_list(),
+            "routes": routes
+        }, sort_keys=True))
+
+    def publish(self):
+        snapshot = self._build()
+        if snapshot != self._published:
+            self._fib.write(snapshot)
+            self._published = snapshot
+
+    def run(self):
+        while not self.is_stopped():
+            try:
+                self.publish()
+            except ValueError as e:
+                logging.error('BRIDGE:publishing of FIB snapshot failed: {}'.format(str(e)))
+            self.wait(self.PUBLISH_INTERVAL)
+
+
+class RingListener(StoppableThread):
+    """
+    Thread which feeds descriptors from wifi receiver process into Ipv6PacketParser, replaces InterfaceListener in
+    process mode
+    """
+    def __init__(self, ring: SharedRing, packet_parser, data: Data):
+        StoppableThread.__init__(self)
+        self._ring = ring
+        self._packet_parser = packet_parser
+        self._data = data
+
+    def _dispatch(self, descriptor: bytes):
+        kind = descriptor[:1]
+        if kind == KIND_UDP:
+            fields, payload = decode_descriptor(descriptor, 2)
+            contiki_packet = ContikiPacket()
+            if contiki_packet.set_wire_format(payload):
+                self._packet_parser.handle_udp(contiki_packet, fields[0], fields[1], contiki_packet.get_dst_ip(),
+                                               contiki_packet.get_payload_size())
+        elif kind == KIND_NS:
+            fields, payload = decode_descriptor(descriptor, 3)
+            self._packet_parser.handle_icmpv6_ns(fields[0], fields[1], fields[2])
+        elif kind == KIND_NA:
+            fields, payload = decode_descriptor(descriptor, 3)
+            self._packet_parser.handle_icmpv6_na(fields[0], fields[1], fields[2])
+        elif kind == KIND_BUNDLE_CONTROL:
+            fields, payload = decode_descriptor(descriptor, 3)
+            self._packet_parser.handle_bundle_control(int(fields[0]), fields[1], fields[2])
+
+    def run(self):
+        while not self._data.wait_ready(Data.READY_WIFI_ADDRESS, RECEIVE_TIMEOUT):
+            if self.is_stopped():
+                return
+        while not self.is_stopped():
+            descriptor = self._ring.get(RECEIVE_TIMEOUT)
+            if descriptor is None:
+                continue
+            if not self._data.get_mote_global_address():
+                logging.warning('BRIDGE:Src IPv6 address of contiki device is unknown can not compare incoming packet')
+                continue
+            try:
+                self._dispatch(descriptor)
+            except Exception as e:
+                logging.error('BRIDGE:{}'.format(str(e)))
+
+
+class RingPacketSender(EventListener):
+    """
+    Replaces PacketSender in process mode, frames are built and sent by wifi sender process. Ring has single producer,
+    so bridge threads are serialized by lock. Flows are only counted, next hop is selected by wifi sender process.
+    """
+    def __init__(self, ring: SharedRing, link_monitor=None, flow_table=None):
+        self._ring = ring
+        self._link_monitor = link_monitor
+        self._flow_table = flow_table
+        self._lock = Lock()
+
+    def _put(self, descriptor: bytes):
+        with self._lock:
+            if not self._ring.put(descriptor):
+                logging.warning('BRIDGE:wifi sender ring is full or record is oversized, frame dropped')
+
+    def send_packet(self, contiki_packet: ContikiPacket):
+        if self._flow_table:
+            self._flow_table.update(FlowTable.DIRECTION_TX, contiki_packet.get_flow_key(), contiki_packet,
+                                    contiki_packet.get_payload_size())
+        self._put(encode_descriptor(KIND_SEND_PACKET, [], contiki_packet.get_wire_format()))
+
+    def send_icmpv6_ns(self, ip_addr: str, dst_l2: str = None):
+        self._put(encode_descriptor(KIND_SEND_NS, [ip_addr, dst_l2 or ""]))
+        if self._link_monitor:
+            self._link_monitor.ns_sent(ip_addr)
+        logging.debug('BRIDGE:sending neighbour solicitation for target ip "{}"'.format(ip_addr))
+
+    def send_icmpv6_na(self, src_l2: str, src_ip: str, target_ip: str):
+        self._put(encode_descriptor(KIND_SEND_NA, [src_l2, src_ip, target_ip]))
+
+    def send_bundle(self, dst_ip: str, dst_l2: str, payload: bytes):
+        self._put(encode_descriptor(KIND_SEND_BUNDLE, [dst_ip, dst_l2], payload))
+
+    def notify(self, event: Event):
+        from serial_connection import SerialPacketToSendEvent
+        if isinstance(event, SerialPacketToSendEvent):
+            self.send_packet(event.get_event())
+        elif isinstance(event, BundleSendEvent):
+            self.send_bundle(event.get_event()["dst_ip"], event.get_event()["dst_l2"], event.get_event()["payload"])
+
+    def __str__(self):
+        return "ring-packet-sender"
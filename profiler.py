@@ -0,0 +1,122 @@
+from utils.stoppable_thread import StoppableThread
+import logging
+import sys
+import threading
+import time
+
+
+def thread_label(thread: threading.Thread) -> str:
+    return "{}({})".format(type(thread).__name__, thread.name)
+
+
+class SamplingProfiler(StoppableThread):
+    """
+    Periodically samples stacks of all threads (sys._current_frames) and counts them in collapsed format
+    "<thread>;<frame>;<frame> <count>", which is input format of flame graph tools
+    """
+    DEFAULT_INTERVAL = 0.005
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        StoppableThread.__init__(self)
+        self._interval = interval
+        self._stacks = {}
+        self._samples = 0
+
+    def _sample(self):
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack = []
+            while frame:
+                stack.append("{} ({})".format(frame.f_code.co_name, frame.f_code.co_filename.split("/")[-1]))
+                frame = frame.f_back
+            stack.append(thread_label(threads[ident]) if ident in threads else str(ident))
+            key = ";".join(reversed(stack))
+            self._stacks[key] = self._stacks.get(key, 0) + 1
+        self._samples += 1
+
+    def run(self):
+        while self.wait(self._interval):
+            self._sample()
+
+    def get_samples(self) -> int:
+        return self._samples
+
+    def write(self, path: str):
+        with open(path, "w") as profile_file:
+            for stack, count in sorted(self._stacks.items()):
+                profile_file.write("{} {}\n".format(stack, count))
+
+
+class ThreadMonitor:
+    """
+    Controls sampling profiler and reports CPU time and wakeups (context switches) of bridge threads
+    """
+    def __init__(self):
+        self._profiler = None
+        self._previous = {}
+
+    def profile(self, start: bool = False, stop: bool = False, path: str = None,
+                interval: float = SamplingProfiler.DEFAULT_INTERVAL) -> dict:
+        if start:
+            if self._profiler and self._profiler.is_alive():
+                return {"status": "running", "samples": self._profiler.get_samples()}
+            self._profiler = SamplingProfiler(interval)
+            self._profiler.start()
+            logging.info('BRIDGE:sampling profiler started')
+            return {"status": "started"}
+        if stop and self._profiler:
+            self._profiler.stop()
+            self._profiler.join()
+            path = path or "profile-{}.folded".format(time.strftime("%Y%m%d-%H%M%S"))
+            self._profiler.write(path)
+            samples = self._profiler.get_samples()
+            self._profiler = None
+            logging.info('BRIDGE:sampling profiler stopped, {} samples written to "{}"'.format(samples, path))
+            return {"status": "stopped", "samples": samples, "path": path}
+        if self._profiler:
+            return {"status": "running", "samples": self._profiler.get_samples()}
+        return {"status": "stopped"}
+
+    @staticmethod
+    def _get_context_switches(native_id: int) -> int:
+        switches = 0
+        try:
+            with open("/proc/self/task/{}/status".format(native_id)) as status:
+                for line in status:
+                    if line.startswith("voluntary_ctxt_switches") or line.startswith("nonvoluntary_ctxt_switches"):
+                        switches += int(line.split()[1])
+        except OSError:
+            pass
+        return switches
+
+    @staticmethod
+    def _get_cpu_time(thread: threading.Thread) -> float:
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (OSError, TypeError):
+            return 0.0
+
+    def get_threads(self) -> list:
+        """
+        Returns CPU time of each thread, CPU usage and wakeups per second since previous call
+        """
+        now = time.monotonic()
+        result = []
+        current = {}
+        for thread in threading.enumerate():
+            cpu_time = self._get_cpu_time(thread)
+            switches = self._get_context_switches(thread.native_id)
+            current.update({thread.ident: (now, cpu_time, switches)})
+            record = {"name": thread.name, "class": type(thread).__name__, "cpu_time": round(cpu_time, 3)}
+            if thread.ident in self._previous:
+                then, previous_cpu_time, previous_switches = self._previous[thread.ident]
+                elapsed = max(now - then, 1e-6)
+                record.update({
+                    "cpu_percent": round((cpu_time - previous_cpu_time) / elapsed * 100, 1),
+                    "wakeups_per_second": round((switches - previous_switches) / elapsed, 1)
+                })
+            result.append(record)
+        self._previous = current
+        return sorted(result, key=lambda record: record["cpu_time"], reverse=True)
@@ -0,0 +1,154 @@
+from serial_connection import SerialListener, SerialSender, ContikiBootEvent, SerialPacketToSendEvent, SerialCommands, \
+    SerialParser, MoteGlobalAddressEvent, RequestRouteToMoteEvent, ResponseToPacketRequest, HelloBridgeRequestEvent, \
+    NeighbourResyncEvent
+from interface_listener import Ipv6PacketParser, PacketSendToSerialEvent, NeighbourSolicitationEvent, \
+    NeighbourAdvertisementEvent, RootPacketForwardEvent, PacketForwardToSerialEvent
+from neighbors import NeighborManager, NodeTable, PendingSolicitations, NeighbourEvictionEvent
+from data import Data, PacketBuffer, PacketBuffEvent
+from timers import NeighbourRequestTimer
+from bundle import BundleControlEvent
+from serial_link import BaudRateProbe
+from packet import AddressContextTable
+from recorder import Recorder
+
+
+class Radio:
+    """
+    Contiki device connected over serial line. Radio has own mote state (Data), serial pipeline, address contexts,
+    packet buffer and parser of wifi packets. Wifi side (socket, node table, FIB, pending solicitations) is shared by
+    all radios of bridge.
+    """
+    def __init__(self, name: str, device: str, data: Data, node_table: NodeTable, pendings: PendingSolicitations,
+                 packet_sender, duplicate_filter=None, link_monitor=None, recorder: Recorder = None, responder=None,
+                 console=None):
+        serial_config = data.get_configuration()['serial']
+        self._name = name
+        self._device = device
+        self._data = data
+        self._node_table = node_table
+        self._recorder = recorder
+        self._baudrate = serial_config['baudrate']
+        self._rtscts = serial_config['rtscts']
+        if serial_config['probe-baudrates']:
+            self._baudrate = BaudRateProbe(device, self._baudrate,
+                                           [int(baudrate) for baudrate in serial_config['probe-baudrates'].split(",")],
+                                           self._rtscts).probe()
+        self._slip_sender = SerialSender(device, self._baudrate, self._rtscts, serial_config['framing'], recorder)
+        self._contexts = AddressContextTable()
+        self._contexts.set_context(AddressContextTable.WIFI_CONTEXT, data.get_configuration()['wifi']['subnet'])
+        self._serial_parser = SerialParser(data, node_table, self._contexts, duplicate_filter, name, console)
+        self._slip_commands = SerialCommands(self._slip_sender, data, self._contexts, name)
+        self._packet_parser = Ipv6PacketParser(data, node_table, duplicate_filter, link_monitor)
+        self._packet_buffer = PacketBuffer(duplicate_filter)
+        self._neighbour_manager = NeighborManager(node_table, data, pendings, packet_sender, self._slip_commands,
+                                                 responder)
+        self._neighbour_request_timer = NeighbourRequestTimer(
+            data.get_configuration()['neighbours']['request-interval'], self._slip_commands, data, node_table, name)
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_data(self) -> Data:
+        return self._data
+
+    def get_slip_sender(self) -> SerialSender:
+        return self._slip_sender
+
+    def get_slip_commands(self) -> SerialCommands:
+        return self._slip_commands
+
+    def get_serial_parser(self) -> SerialParser:
+        return self._serial_parser
+
+    def get_packet_parser(self) -> Ipv6PacketParser:
+        return self._packet_parser
+
+    def get_packet_buffer(self) -> PacketBuffer:
+        return self._packet_buffer
+
+    def get_neighbour_manager(self) -> NeighborManager:
+        return self._neighbour_manager
+
+    def get_neighbour_request_timer(self) -> NeighbourRequestTimer:
+        return self._neighbour_request_timer
+
+    def has_mote_address(self, address: str) -> bool:
+        return address in [self._data.get_mote_global_address(), self._data.get_mote_link_local_address()]
+
+    def create_serial_listener(self) -> SerialListener:
+        return SerialListener(self._device, self._serial_parser, self._data, self._baudrate, self._rtscts,
+                              self._slip_sender.get_link(), self._recorder)
+
+    def subscribe_events(self, packet_sender, link_monitor, aggregator):
+        """
+        Connects events inside of radio and to shared wifi services. Services of first radio only (ip configurator,
+        node table listeners) are connected by Boot.
+        """
+        self._serial_parser.subscribe_event(ContikiBootEvent, self._slip_commands)
+        self._packet_buffer.subscribe_event(SerialPacketToSendEvent, packet_sender)
+        self._serial_parser.subscribe_event(SerialPacketToSendEvent, packet_sender)
+        self._packet_parser.subscribe_event(PacketSendToSerialEvent, self._slip_commands)
+        self._packet_parser.subscribe_event(PacketForwardToSerialEvent, self._slip_commands)
+        self._packet_parser.subscribe_event(NeighbourSolicitationEvent, self._neighbour_manager)
+        self._packet_parser.subscribe_event(NeighbourAdvertisementEvent, self._neighbour_manager)
+        self._packet_parser.subscribe_event(RootPacketForwardEvent, self._packet_buffer)
+        self._serial_parser.subscribe_event(MoteGlobalAddressEvent, self._slip_commands)
+        self._serial_parser.subscribe_event(RequestRouteToMoteEvent, self._neighbour_manager)
+        self._packet_buffer.subscribe_event(PacketBuffEvent, self._slip_commands)
+        self._serial_parser.subscribe_event(ResponseToPacketRequest, self._packet_buffer)
+        self._serial_parser.subscribe_event(HelloBridgeRequestEvent, self._slip_commands)
+        self._serial_parser.subscribe_event(NeighbourResyncEvent, self._slip_commands)
+        self._serial_parser.subscribe_event(NeighbourResyncEvent, self._neighbour_request_timer)
+        self._node_table.subscribe_event(NeighbourEvictionEvent, self._slip_commands)
+        self._node_table.subscribe_event(NeighbourEvictionEvent, self._neighbour_request_timer)
+        self._packet_parser.subscribe_event(NeighbourAdvertisementEvent, link_monitor)
+        self._serial_parser.subscribe_event(ContikiBootEvent, link_monitor)
+        self._packet_parser.subscribe_event(BundleControlEvent, aggregator)
+
+    def apply_configuration(self, configuration: dict):
+        self._packet_buffer.apply_configuration(configuration)
+        self._neighbour_request_timer.apply_configuration(configuration)
+
+    def get_snapshot(self) -> dict:
+        return {
+            "device": self._device,
+            "baudrate": self._baudrate,
+            "data": self._data.get_snapshot(),
+            "buffer": self._packet_buffer.get_stats(),
+            "serial_link": self._slip_sender.get_link().get_stats() if self._slip_sender.get_link() else None
+        }
+
+
+class RadioDispatcher(Ipv6PacketParser):
+    """
+    Parses wifi frames once and hands packets over to parser of radio by destination: radio of mote with that address,
+    radio which reported destination as RPL neighbour, otherwise first radio. Neighbour advertisements and bundle
+    control messages go to first radio, because pending solicitations and bundle aggregator are shared. Selected radio
+    is part of path cached for flow.
+    """
+    def __init__(self, radios: list, node_table: NodeTable, link_monitor=None, flow_table=None):
+        Ipv6PacketParser.__init__(self, radios[0].get_data(), node_table, None, link_monitor, flow_table)
+        self._radios = radios
+        self._radios_by_name = {radio.get_name(): radio for radio in radios}
+
+    def _select_radio(self, address: str) -> Radio:
+        if len(self._radios) > 1:
+            for radio in self._radios:
+                if radio.has_mote_address(address):
+                    return radio
+            node = self._node_table.get_node_address(address, 'rpl')
+            if node and node.get_radio() in self._radios_by_name:
+                return self._radios_by_name[node.get_radio()]
+        return self._radios[0]
+
+    def classify_udp(self, outer_dst: str, inner_dst: str) -> tuple:
+        return self._select_radio(inner_dst).get_packet_parser().classify_udp(outer_dst, inner_dst)
+
+    def handle_icmpv6_ns(self, src_l2: str, src_ip: str, target_ip: str):
+        self._select_radio(target_ip).get_packet_parser().handle_icmpv6_ns(src_l2, src_ip, target_ip)
+
+    def handle_icmpv6_na(self, src_ip: str, target_ip: str, src_l2: str):
+        self._radios[0].get_packet_parser().handle_icmpv6_na(src_ip, target_ip, src_l2)
+
+    def handle_bundle_control(self, message_type: int, src_ip: str, src_l2: str):
+        self._radios[0].get_packet_parser().handle_bundle_control(message_type, src_ip, src_l2)
@@ -0,0 +1,153 @@
+from threading import Lock
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+
+class Recorder:
+    """
+    Append-only binary log of serial lines and wifi frames. File starts with MAGIC, each record is RECORD_HEADER
+    (monotonic timestamp in ns, channel, direction, length) followed by raw data. Records are written into buffered
+    file, so recording on the hot path costs one struct.pack and one memory copy. Buffer is flushed when record comes
+    after FLUSH_INTERVAL, so recording survives crash of bridge.
+    """
+    MAGIC = b'BRREC01\n'
+    RECORD_HEADER = struct.Struct("<QBBI")
+    CHANNEL_SERIAL = 0
+    CHANNEL_WIFI = 1
+    DIRECTION_RX = 0
+    DIRECTION_TX = 1
+    BUFFER_SIZE = 65536
+    FLUSH_INTERVAL = 1000000000     # ns
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = Lock()
+        self._file = open(path, "ab", buffering=self.BUFFER_SIZE)
+        if self._file.tell() == 0:
+            self._file.write(self.MAGIC)
+        self._flushed_at = time.monotonic_ns()
+        logging.info('BRIDGE:recording serial lines and wifi frames to "{}"'.format(path))
+
+    def record(self, channel: int, direction: int, data: bytes):
+        timestamp = time.monotonic_ns()
+        with self._lock:
+            self._file.write(self.RECORD_HEADER.pack(timestamp, channel, direction, len(data)))
+            self._file.write(data)
+            if timestamp - self._flushed_at > self.FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed_at = timestamp
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingReader:
+    """
+    Reads records of recording file using mmap
+    """
+    def __init__(self, path: str):
+        self._path = path
+
+    def __iter__(self):
+        if os.path.getsize(self._path) <= len(Recorder.MAGIC):
+            return
+        with open(self._path, "rb") as recording_file:
+            with mmap.mmap(recording_file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                if content[:len(Recorder.MAGIC)] != Recorder.MAGIC:
+                    raise ValueError('file "{}" is not bridge recording'.format(self._path))
+                offset = len(Recorder.MAGIC)
+                while offset + Recorder.RECORD_HEADER.size <= len(content):
+                    timestamp, channel, direction, length = Recorder.RECORD_HEADER.unpack_from(content, offset)
+                    offset += Recorder.RECORD_HEADER.size
+                    if offset + length > len(content):
+                        break   # last record was not written completely
+                    yield timestamp, channel, direction, content[offset:offset + length]
+                    offset += length
+
+
+class Replayer:
+    """
+    Feeds received serial lines into SerialParser and received wifi frames into Ipv6PacketParser with original timing
+    (speed 1), faster (speed > 1) or as fast as possible (speed 0). Serial lines are recorded as they came over wire,
+    so frames of serial link are unwrapped (and duplicates skipped) same way as by serial listener.
+    """
+    def __init__(self, path: str, serial_parser=None, packet_parser=None, speed: float = 1):
+        from serial_link import SerialLink
+        self._reader = RecordingReader(path)
+        self._serial_parser = serial_parser
+        self._packet_parser = packet_parser
+        self._speed = speed
+        self._link = SerialLink(lambda frame: None)
+
+    def run(self) -> int:
+        replayed = 0
+        first_timestamp = None
+        started = time.monotonic()
+        for timestamp, channel, direction, data in self._reader:
+            if direction != Recorder.DIRECTION_RX:
+                continue
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            if self._speed:
+                delay = (timestamp - first_timestamp) / 1e9 / self._speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            if channel == Recorder.CHANNEL_SERIAL and self._serial_parser:
+                line = bytes(data)
+                if line[:1] == self._link.FRAME_START:
+                    line = self._link.receive(line)
+                if line:
+                    self._serial_parser.parse(line)
+            elif channel == Recorder.CHANNEL_WIFI and self._packet_parser:
+                self._packet_parser.parse(data)
+            replayed += 1
+        return replayed
+
+
+def _dump(path: str):
+    channels = {Recorder.CHANNEL_SERIAL: "serial", Recorder.CHANNEL_WIFI: "wifi"}
+    directions = {Recorder.DIRECTION_RX: "rx", Recorder.DIRECTION_TX: "tx"}
+    first_timestamp = None
+    for timestamp, channel, direction, data in RecordingReader(path):
+        first_timestamp = first_timestamp or timestamp
+        print("{:>12.6f} {:<7}{:<3}{:>6} {}".format((timestamp - first_timestamp) / 1e9, channels[channel],
+                                                    directions[direction], len(data),
+                                                    data if channel == Recorder.CHANNEL_SERIAL else data.hex()))
+
+
+def _replay(path: str, speed: float):
+    from utils.configuration_loader import ConfigurationLoader
+    from data import Data
+    from neighbors import NodeTable
+    from packet import AddressContextTable
+    from serial_connection import SerialParser
+    from interface_listener import Ipv6PacketParser
+    import configparser
+    configuration = ConfigurationLoader(configparser.ConfigParser()).read_configuration(
+        "{0}/configuration/configuration.conf".format(os.getcwd()))
+    data = Data(configuration)
+    node_table = NodeTable(['wifi', 'rpl'])
+    contexts = AddressContextTable()
+    contexts.set_context(AddressContextTable.WIFI_CONTEXT, configuration['wifi']['subnet'])
+    started = time.monotonic()
+    replayed = Replayer(path, SerialParser(data, node_table, contexts), Ipv6PacketParser(data, node_table),
+                        speed).run()
+    print("Replayed {} records in {:.3f}s".format(replayed, time.monotonic() - started))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ["dump", "replay"]:
+        print("Usage: recorder.py dump <file> | recorder.py replay <file> [speed, 0 = maximum]")
+    elif sys.argv[1] == "dump":
+        _dump(sys.argv[2])
+    else:
+        _replay(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 1)
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from threading import Lock
+from dedup import DuplicateFilter
+import logging
+import time
+
+
+class TokenBucket:
+    """
+    Allows RATE events per second on average and BURST events at once
+    """
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def consume(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def set_rate(self, rate: float, burst: int):
+        with self._lock:
+            self._rate = rate
+            self._burst = burst
+            self._tokens = min(self._tokens, burst)
+
+
+class NeighbourResponder:
+    """
+    Answers neighbour solicitations for addresses of bridge. Same solicitation (requester and target) is answered once
+    per window and advertisements are limited by token bucket, so storm of solicitations (bridges rebooting after power
+    cut) can not take all CPU of bridge. Advertisement frames are prebuilt by sender. Liveness probes of roots skip
+    window and shared bucket, they are limited per source instead, so storm of other solicitations can not fail over
+    healthy root.
+    """
+    DEFAULT_WINDOW = 1.0
+    DEFAULT_RATE = 50.0
+    DEFAULT_BURST = 20
+    PROBE_RATE = 5.0
+    PROBE_BURST = 5
+    CAPACITY = 1024
+
+    def __init__(self, sender, window: float = DEFAULT_WINDOW, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self._sender = sender
+        self._recent = DuplicateFilter(self.CAPACITY, window)
+        self._bucket = TokenBucket(rate, burst)
+        self._probe_buckets = OrderedDict()
+        self._lock = Lock()
+        self.received = 0
+        self.answered = 0
+        self.suppressed = 0
+        self.rate_limited = 0
+        self.probes = 0
+        self.probes_rate_limited = 0
+
+    def _get_probe_bucket(self, src_ip: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._probe_buckets.get(src_ip)
+            if bucket:
+                self._probe_buckets.move_to_end(src_ip)
+            else:
+                bucket = TokenBucket(self.PROBE_RATE, self.PROBE_BURST)
+                self._probe_buckets[src_ip] = bucket
+                while len(self._probe_buckets) > self.CAPACITY:
+                    self._probe_buckets.popitem(last=False)
+            return bucket
+
+    def respond(self, src_l2: str, src_ip: str, target_ip: str, probe: bool = False) -> bool:
+        """
+        Sends advertisement, returns False when solicitation was suppressed or rate limited. Probe is solicitation of
+        root address.
+        """
+        self.received += 1
+        if probe:
+            self.probes += 1
+            if not self._get_probe_bucket(src_ip).consume():
+                self.probes_rate_limited += 1
+                return False
+            self._sender.send_icmpv6_na(src_l2=src_l2, src_ip=src_ip, target_ip=target_ip)
+            self.answered += 1
+            return True
+        if self._recent.is_duplicate(hash((src_l2, src_ip, target_ip))):
+            self.suppressed += 1
+            return False
+        if not self._bucket.consume():
+            self.rate_limited += 1
+            logging.debug('BRIDGE:neighbour advertisement for "{}" rate limited'.format(src_ip))
+            return False
+        self._sender.send_icmpv6_na(src_l2=src_l2, src_ip=src_ip, target_ip=target_ip)
+        self.answered += 1
+        return True
+
+    def apply_configuration(self, configuration: dict):
+        self._recent.set_window(configuration['neighbours']['ns-window'])
+        self._bucket.set_rate(configuration['neighbours']['na-rate'], configuration['neighbours']['na-burst'])
+
+    def get_stats(self) -> dict:
+        return {"received": self.received, "answered": self.answered, "suppressed": self.suppressed,
+                "rate_limited": self.rate_limited, "probes": self.probes,
+                "probes_rate_limited": self.probes_rate_limited}
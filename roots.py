@@ -0,0 +1,114 @@
+from ipaddress import IPv6Address
+from threading import Lock
+from utils.rendezvous import select_rendezvous
+import logging
+import time
+
+MULTICAST_L2 = "33:33:00:00:00:fb"
+
+
+def select_root(roots: list, mote_address: str) -> tuple:
+    """
+    Returns (address, l2 address) of root for mote from [address, l2 address, alive] records, roots are selected by
+    rendezvous hashing of mote address among alive roots (among all roots, when no root is alive)
+    """
+    candidates = [root for root in roots if root[2]] or roots
+    address = select_rendezvous(mote_address, [(root[0], 1.0) for root in candidates])
+    l2_address = [root[1] for root in candidates if root[0] == address][0]
+    return address, l2_address or MULTICAST_L2
+
+
+class RootSet:
+    """
+    Root (border router) addresses of site. Motes are sharded across roots by rendezvous hashing of mote address, so
+    when root fails, only motes of that root are moved to other roots. Root is alive while it answers neighbour
+    solicitations, root without answer for failure timeout is skipped until it answers again. Local roots are addresses
+    which this bridge takes in root mode (all roots by default).
+    """
+    DEFAULT_FAILURE_TIMEOUT = 3.0
+
+    def __init__(self, addresses: str, local: str = "", failure_timeout: float = DEFAULT_FAILURE_TIMEOUT):
+        self._addresses = self._parse(addresses)
+        self._local = self._parse(local) if local else list(self._addresses)
+        self._failure_timeout = failure_timeout
+        self._l2_addresses = {}
+        self._last_seen = {}
+        self._alive = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _parse(addresses: str) -> list:
+        return [IPv6Address(address.strip()).compressed for address in addresses.split(",") if address.strip()]
+
+    def get_addresses(self) -> list:
+        return self._addresses
+
+    def get_local_addresses(self) -> list:
+        return self._local
+
+    def is_root(self, address: str) -> bool:
+        return address in self._addresses
+
+    def is_local(self, address: str) -> bool:
+        return address in self._local
+
+    def get_l2_address(self, address: str):
+        return self._l2_addresses.get(address)
+
+    def set_l2_address(self, address: str, l2_address: str, keep_known: bool = False):
+        """
+        Sets L2 address without confirmation of liveness (e.g. restored from snapshot), known address is kept when
+        keep_known is set
+        """
+        if not self.is_root(address):
+            return
+        with self._lock:
+            if not (keep_known and self._l2_addresses.get(address)):
+                self._l2_addresses.update({address: l2_address})
+
+    def confirm(self, address: str, l2_address: str):
+        """
+        Root answered (or kernel knows it as reachable)
+        """
+        if not self.is_root(address):
+            return
+        with self._lock:
+            self._l2_addresses.update({address: l2_address})
+            self._last_seen.update({address: time.monotonic()})
+            if not self._alive.get(address):
+                self._alive.update({address: True})
+                logging.info('BRIDGE:root "{}" ({}) is alive'.format(address, l2_address))
+
+    def is_alive(self, address: str) -> bool:
+        last_seen = self._last_seen.get(address)
+        return last_seen is not None and time.monotonic() - last_seen <= self._failure_timeout
+
+    def check(self) -> list:
+        """
+        Returns roots, which failed since last check
+        """
+        failed = []
+        with self._lock:
+            for address in self._addresses:
+                if self._alive.get(address) and not self.is_alive(address):
+                    self._alive.update({address: False})
+                    failed.append(address)
+                    logging.warning('BRIDGE:root "{}" does not answer, its motes are moved to other roots'.format(
+                        address))
+        return failed
+
+    def to_list(self) -> list:
+        return [[address, self._l2_addresses.get(address), self.is_alive(address)] for address in self._addresses]
+
+    def select(self, mote_address: str) -> tuple:
+        """
+        Returns (address, l2 address) of root for mote, multicast L2 address is used for root with unknown L2
+        """
+        return select_root(self.to_list(), mote_address)
+
+    def apply_configuration(self, configuration: dict):
+        self._failure_timeout = configuration['border-router']['failure-timeout']
+
+    def get_snapshot(self) -> list:
+        return [{"ip": address, "l2": l2_address, "alive": alive, "local": self.is_local(address)}
+                for (address, l2_address, alive) in self.to_list()]
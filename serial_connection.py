@@ -1,8 +1,12 @@
-from threading import Thread
+from utils.stoppable_thread import StoppableThread
 from data import Data
-from neighbors import NodeAddress, NodeTable
+from neighbors import NodeTable, NeighbourEvictionEvent
 from event_system import EventProducer, Event, EventListener
-from packet import ContikiPacket
+from packet import ContikiPacket, AddressContextTable
+from serial_link import SerialLink
+from recorder import Recorder
+from dedup import DuplicateFilter
+from threading import Lock
 import logging
 import serial
 import ipaddress
@@ -54,6 +58,15 @@ class ResponseToPacketRequest(Event):
         return "response-to-packet-request-event"
 
 
+class NeighbourResyncEvent(Event):
+    def __init__(self, data: int):
+        Event.__init__(self, data)
+        logging.debug('BRIDGE: neighbour delta generation "{}" does not follow, requesting full list'.format(data))
+
+    def __str__(self):
+        return "neighbour-resync-event"
+
+
 class HelloBridgeRequestEvent(Event):
     def __init__(self):
         Event.__init__(self, None)
@@ -70,46 +83,71 @@ class SerialParser(EventProducer):
     commands: !<command>
     requests: ?<request>
     responses: $<response>
-    Each message type (except prints) throws different system event
+    Each message type (except prints) throws different system event.
+    Neighbours are received as full list "!n[@<generation>;]<ip>;<ip>;..." or as delta
+    "!d<generation>;+<added ip>;-<removed ip>;..." and they are stored in node table under name of radio.
+    Prints, timestamps and unknown lines are passed to console sink, when it is given, so serial reader never waits for
+    console output.
     """
-    def __init__(self, data: Data, node_table: NodeTable):
+    TIMESTAMPS = {
+        b'!t1': "sent rpl",
+        b'!t2': "sent wifi",
+        b'!t3': "R forwarded rpl",
+        b'!t4': "R forwarded wifi",
+        b'!t5': "W forwarded rpl",
+        b'!t6': "W forwarded wifi",
+        b'!t7': "received over wifi",
+        b'!t8': "received over rpl"
+    }
+
+    def __init__(self, data: Data, node_table: NodeTable, contexts: AddressContextTable,
+                 duplicate_filter: DuplicateFilter = None, radio: str = None, console=None):
         EventProducer.__init__(self)
         self._data = data
         self._node_table = node_table
+        self._contexts = contexts
+        self._duplicate_filter = duplicate_filter
+        self._radio = radio
+        self._console = console
         self.add_event_support(ContikiBootEvent)
         self.add_event_support(SerialPacketToSendEvent)
         self.add_event_support(MoteGlobalAddressEvent)
         self.add_event_support(RequestRouteToMoteEvent)
         self.add_event_support(ResponseToPacketRequest)
         self.add_event_support(HelloBridgeRequestEvent)
+        self.add_event_support(NeighbourResyncEvent)
         self._reading_print = False
 
+    @staticmethod
+    def _parse_neighbour_addresses(nodes: list) -> list:
+        addresses = []
+        for node in nodes:
+            if node != "":
+                try:
+                    addresses.append(ipaddress.ip_address(node))
+                except ValueError:
+                    logging.error('BRIDGE:neighbour ip address "{} is not valid'.format(node))
+        return addresses
+
+    def _print(self, line, log: bool = False):
+        if self._console:
+            self._console.write(line, self._radio, log)
+            return
+        print(line.decode("UTF-8", "ignore")[:-1] if isinstance(line, bytes) else line)
+        if log:
+            logging.debug('CONTIKI:{}'.format(line))
+
     def parse(self, line):
         if line[:2] == b'<-':
             self._reading_print = True
-            print("\n")
+            self._print("")
         elif line[:2] == b'->':
             self._reading_print = False
         elif self._reading_print:
-            print(line.decode("UTF-8", "ignore")[:-1])
+            self._print(line)
         elif line[:2] == b'!t':
-            measured_time = int(round(time.time() * 1000))
-            if line[:3] == b'!t1':
-                print("sent rpl '{}'\n".format(measured_time))
-            elif line[:3] == b'!t2':
-                print("sent wifi '{}'\n".format(measured_time))
-            elif line[:3] == b'!t3':
-                print("R forwarded rpl '{}'\n".format(measured_time))
-            elif line[:3] == b'!t4':
-                print("R forwarded wifi '{}'\n".format(measured_time))
-            elif line[:3] == b'!t5':
-                print("W forwarded rpl '{}'\n".format(measured_time))
-            elif line[:3] == b'!t6':
-                print("W forwarded wifi '{}'\n".format(measured_time))
-            elif line[:3] == b'!t7':
-                print("received over wifi '{}'\n".format(measured_time))
-            elif line[:3] == b'!t8':
-                print("received over rpl '{}'\n".format(measured_time))
+            if line[:3] in self.TIMESTAMPS:
+                self._print("{} '{}'".format(self.TIMESTAMPS[line[:3]], int(round(time.time() * 1000))))
         elif line[:2] == b'?w':
             self.notify_listeners(HelloBridgeRequestEvent())
         # sends contiki addresses
@@ -128,6 +166,10 @@ class SerialParser(EventProducer):
         elif line[:2] == b'?p':
             line = line.decode("UTF-8", "ignore")
             (question_id, ip_addr) = line[3:-1].split(";")
+            ip_addr = self._contexts.expand_address(ip_addr)
+            if ip_addr is None:
+                logging.warning('BRIDGE:unknown address context in route request "{}"'.format(line))
+                return
             self.notify_listeners(RequestRouteToMoteEvent({
                 "question_id": question_id,
                 "ip_addr": ip_addr
@@ -137,17 +179,34 @@ class SerialParser(EventProducer):
             try:
                 values = line[3:].split(";")
             except ValueError:
-                print("Error in line split\n", (line[3:].split(";")))
-                print("Line {}\n".format(line))
+                self._print("Error in line split {}".format(line))
                 return
             self.notify_listeners(ResponseToPacketRequest({
                 "question_id": int(values[0]),
                 "response": True if values[1] == "1" else False
             }))
         elif line[:2] == b'!p':
+            contiki_format = self._contexts.expand(line[3:-1].decode("UTF-8"))
+            if contiki_format is None:
+                logging.warning('BRIDGE:unknown address context in packet "{}"'.format(line))
+                return
             contiki_packet = ContikiPacket()
-            contiki_packet.set_contiki_format(line[3:-1].decode("UTF-8"))
+            contiki_packet.set_contiki_format(contiki_format)
+            try:
+                key = contiki_packet.get_key()
+            except (ValueError, OSError, IndexError) as e:
+                logging.warning('BRIDGE:malformed packet "{}" dropped: {}'.format(line, str(e)))
+                return
+            if self._duplicate_filter and self._duplicate_filter.is_duplicate(key):
+                logging.debug('BRIDGE:duplicate packet from contiki dropped')
+                return
             self.notify_listeners(SerialPacketToSendEvent(contiki_packet))
+        elif line[:2] == b'$x':
+            try:
+                self._contexts.confirm(int(line[2:-1]))
+                logging.info('BRIDGE:contiki confirmed address context {}'.format(line[2:-1]))
+            except ValueError:
+                logging.error('BRIDGE:address context confirmation "{}" is not valid'.format(line))
         elif line[:2] == b'!b':
             self.notify_listeners(ContikiBootEvent(line))
         elif line[:2] == b'!c':
@@ -156,62 +215,131 @@ class SerialParser(EventProducer):
         elif line[:2] == b'!n':
             line = line.decode("UTF-8", "ignore")
             nodes = line[2:-1].split(';')
-            for node in nodes:
-                if node != "":
-                    try:
-                        ip_obj = ipaddress.ip_address(node)
-                        node_obj = NodeAddress(ip_address=ip_obj, tech_type="rpl")
-                        self._node_table.add_node_address(node_obj)
-                    except ValueError:
-                        logging.error('BRIDGE:neighbour ip address "{} is not valid'.format(node))
+            generation = None
+            if nodes[0][:1] == '@':
+                try:
+                    generation = int(nodes.pop(0)[1:])
+                except ValueError:
+                    logging.error('BRIDGE:neighbour generation in "{}" is not valid'.format(line))
+            self._node_table.sync_neighbours(self._parse_neighbour_addresses(nodes), generation, self._radio)
+        elif line[:2] == b'!d':
+            line = line.decode("UTF-8", "ignore")
+            changes = line[2:-1].split(';')
+            try:
+                generation = int(changes[0])
+            except ValueError:
+                logging.error('BRIDGE:neighbour generation in "{}" is not valid'.format(line))
+                return
+            added = self._parse_neighbour_addresses([change[1:] for change in changes[1:] if change[:1] == '+'])
+            removed = self._parse_neighbour_addresses([change[1:] for change in changes[1:] if change[:1] == '-'])
+            if self._node_table.apply_neighbour_delta(generation, added, removed, self._radio) == NodeTable.DELTA_GAP:
+                self.notify_listeners(NeighbourResyncEvent(generation))
 
         else:
-            print(line)
-            logging.debug('CONTIKI:{}'.format(line))
+            self._print(line, True)
 
 
-class SerialListener(Thread):
+class SerialListener(StoppableThread):
     """
     This thread is responsible for creating connection over serial line. After that, each received line is passed to
-    SerialParser for handle data.
+    SerialParser for handle data. Reading blocks with timeout, so idle listener does not use CPU. When serial link
+    framing is used, lines are checked by SerialLink first and unacknowledged frames are retransmitted meanwhile.
     """
-    def __init__(self, device: str, serial_parser: SerialParser):
-        Thread.__init__(self)
+    READ_TIMEOUT = 0.5
+
+    def __init__(self, device: str, serial_parser: SerialParser, data: Data, baudrate: int = 115200,
+                 rtscts: bool = False, link: SerialLink = None, recorder: Recorder = None):
+        StoppableThread.__init__(self)
+        self._recorder = recorder
         self._device = device
         self._serial_parser = serial_parser
+        self._data = data
+        self._baudrate = baudrate
+        self._rtscts = rtscts
+        self._link = link
 
     def get_input_parser(self):
         return self._serial_parser
 
     def run(self):
-        ser = serial.Serial(port=self._device, baudrate=115200, parity=serial.PARITY_NONE,
-                            stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=0)
-        logging.info('BRIDGE:connected to serial device "{}"'.format(self._device))
-        while True:
-            line = ser.readline()
-            if line:
-                self._serial_parser.parse(line)
+        ser = serial.Serial(port=self._device, baudrate=self._baudrate, parity=serial.PARITY_NONE,
+                            stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=self.READ_TIMEOUT,
+                            rtscts=self._rtscts)
+        logging.info('BRIDGE:connected to serial device "{}" ({} Bd)'.format(self._device, self._baudrate))
+        self._data.set_ready(Data.READY_SERIAL)
+        line = b''
+        try:
+            while not self.is_stopped():
+                if self._link:
+                    ser.timeout = self._link.get_poll_interval()
+                    self._link.poll()
+                # readline returns incomplete line when timeout expires
+                line += ser.readline()
+                if line[-1:] == b'\n':
+                    if self._recorder:
+                        self._recorder.record(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_RX, line)
+                    if self._link:
+                        line = self._link.receive(line)
+                    if line:
+                        self._serial_parser.parse(line)
+                    line = b''
+        finally:
+            ser.close()
+            logging.info('BRIDGE:disconnected from serial device "{}"'.format(self._device))
 
 
 class SerialSender:
     """
-    Simple class which is responsible for making serial connection and sending data over
+    Simple class which is responsible for making serial connection and sending data over. With framing, messages are
+    sent through SerialLink.
     """
-    def __init__(self, device: str):
-        self._ser = serial.Serial(port=device, baudrate=115200, parity=serial.PARITY_NONE,
-                                  stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=0)
+    def __init__(self, device: str, baudrate: int = 115200, rtscts: bool = False, framing: bool = False,
+                 recorder: Recorder = None):
+        self._recorder = recorder
+        self._ser = serial.Serial(port=device, baudrate=baudrate, parity=serial.PARITY_NONE,
+                                  stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=0, rtscts=rtscts)
+        self._write_lock = Lock()
+        self._link = SerialLink(self._write) if framing else None
+        if self._link:
+            self._link.reset()
+
+    def _write(self, msg: bytes):
+        with self._write_lock:
+            if self._recorder:
+                self._recorder.record(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_TX, msg)
+            self._ser.write(msg)
+
+    def get_link(self) -> SerialLink:
+        return self._link
 
     def send(self, msg: bytes):
-        self._ser.write(msg)
+        if self._link:
+            self._link.send(msg)
+        else:
+            self._write(msg)
+
+    def drain(self, timeout: float = None):
+        """
+        Waits until all queued data are transmitted (and acknowledged when framing is used)
+        """
+        if self._link and timeout is not None:
+            self._link.drain(timeout)
+        self._ser.flush()
+
+    def close(self):
+        self._ser.close()
 
 
 class SerialCommands(EventListener):
     """
-    Defines messages which are send over serial line
+    Defines messages which are send over serial line. Full neighbour list is requested when neighbours of radio were
+    evicted from node table.
     """
-    def __init__(self, slip_sender: SerialSender, data: Data):
+    def __init__(self, slip_sender: SerialSender, data: Data, contexts: AddressContextTable, radio: str = None):
         self._slip_sender = slip_sender
         self._data = data
+        self._contexts = contexts
+        self._radio = radio
 
     def print_flows_request(self):
         self._slip_sender.send(str.encode("#f"))
@@ -224,10 +352,22 @@ class SerialCommands(EventListener):
 
     def send_config_to_contiki(self):
         metrics = self._data.get_configuration()['metrics']
-        cmd = "!we{}b{}x{}\n".format(metrics['en'], metrics['bw'], metrics['etx'])
+        self.send_metrics_to_contiki(metrics['en'], metrics['bw'], metrics['etx'])
+
+    def send_metrics_to_contiki(self, en, bw, etx):
+        cmd = "!we{}b{}x{}\n".format(en, bw, etx)
         self._slip_sender.send(str.encode(cmd))
         logging.info('BRIDGE:sending config "{}" to contiki'.format(cmd))
 
+    def send_address_context(self, context_id: int):
+        cmd = "!x{};{}\n".format(context_id, self._contexts.get_contexts()[context_id])
+        self._slip_sender.send(str.encode(cmd))
+        logging.info('BRIDGE:sending address context "{}" to contiki'.format(cmd))
+
+    def send_address_contexts(self):
+        for context_id in self._contexts.get_contexts():
+            self.send_address_context(context_id)
+
     def send_route_request_response_to_contiki(self, question_id: int, response: int):
         cmd = "$p;{};{}".format(question_id, response)
         self._slip_sender.send(str.encode(cmd))
@@ -241,17 +381,22 @@ class SerialCommands(EventListener):
         self._slip_sender.send(b'?n\n')
         logging.info('BRIDGE:requesting neighbours from contiki')
 
+    def request_neighbour_updates(self):
+        self._slip_sender.send(b'!d\n')
+        logging.info('BRIDGE:requesting neighbour deltas from contiki')
+
     def request_forward_packet_decision(self, id: int, contiki_packet: ContikiPacket):
-        self._slip_sender.send(str.encode("?p;{};{}\n".format(id, contiki_packet.get_contiki_format())))
+        self._slip_sender.send(str.encode("?p;{};{}\n".format(
+            id, self._contexts.compress(contiki_packet.get_contiki_format()))))
         # print("sending: {}\n".format("?p;{};{}\n".format(id, raw_packet)))
         logging.info('BRIDGE:requesting forward decision')
 
     def send_packet_to_contiki(self, contiki_packet: ContikiPacket):
-        self._slip_sender.send(str.encode("!p;{}\n".format(contiki_packet.get_contiki_format())))
+        self._slip_sender.send(str.encode("!p;{}\n".format(self._contexts.compress(contiki_packet.get_contiki_format()))))
         logging.debug('BRIDGE:sending packet to contiki')
 
     def forward_packet_to_contiki(self, contiki_packet: ContikiPacket):
-        self._slip_sender.send(str.encode("!f;{}\n".format(contiki_packet.get_contiki_format())))
+        self._slip_sender.send(str.encode("!f;{}\n".format(self._contexts.compress(contiki_packet.get_contiki_format()))))
         logging.debug('BRIDGE:forwarding packet to contiki')
 
     def _send_hello_response(self):
@@ -262,6 +407,17 @@ class SerialCommands(EventListener):
         from data import PacketBuffEvent
         if isinstance(event, ContikiBootEvent):
             self.send_config_to_contiki()
+            self.request_neighbour_updates()
+            self._contexts.reset_confirmations()
+            self.send_address_contexts()
+        elif isinstance(event, MoteGlobalAddressEvent):
+            if self._contexts.set_context(AddressContextTable.MOTE_CONTEXT, "{}/64".format(event.get_event())):
+                self.send_address_context(AddressContextTable.MOTE_CONTEXT)
+        elif isinstance(event, NeighbourResyncEvent):
+            self.request_neighbours_from_contiki()
+        elif isinstance(event, NeighbourEvictionEvent):
+            if event.get_event() in [self._radio, None]:
+                self.request_neighbours_from_contiki()
         elif isinstance(event, PacketSendToSerialEvent):
             self.send_packet_to_contiki(event.get_event())
         elif isinstance(event, PacketForwardToSerialEvent):
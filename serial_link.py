@@ -0,0 +1,255 @@
+from collections import OrderedDict, deque
+from threading import Condition
+import binascii
+import logging
+import os
+import serial
+import time
+
+
+def crc16(data: bytes) -> int:
+    return binascii.crc_hqx(data, 0xffff)
+
+
+class SerialLink:
+    """
+    Link layer for serial line. Each line is sent as frame with sequence number and CRC-16/CCITT, frames are
+    acknowledged cumulatively and retransmitted (go-back-N) when ack is not received in time. Sending never blocks:
+    payloads over window wait in bounded backlog and they are sent as acks free the window, so serial reader thread
+    (which handles acks) can send too.
+    data frame:  %<seq:2 hex><payload><crc:4 hex>\\n     (crc of seq and payload)
+    ack frame:   %K<seq:2 hex><crc:4 hex>\\n             (all frames up to seq received)
+    reset frame: %R<crc:4 hex>\\n                        (both sides start from sequence 0)
+    """
+    FRAME_START = b'%'
+    ACK = b'K'
+    RESET = b'R'
+    SEQUENCE_MODULO = 256
+    WINDOW_SIZE = 8
+    RETRANSMIT_TIMEOUT = 0.2
+    MAX_RETRANSMISSIONS = 10
+    BACKLOG_SIZE = 256
+    IDLE_POLL_INTERVAL = 0.5
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._condition = Condition()
+        self._next_sequence = 0
+        self._unacked = OrderedDict()
+        self._backlog = deque()
+        self._retransmissions = 0
+        self._expected_sequence = 0
+        self.sent = 0
+        self.received = 0
+        self.retransmitted = 0
+        self.crc_errors = 0
+        self.out_of_order = 0
+        self.unframed = 0
+        self.lost = 0
+
+    @classmethod
+    def _frame(cls, body: bytes) -> bytes:
+        return cls.FRAME_START + body + b'%04x' % crc16(body) + b'\n'
+
+    def reset(self):
+        with self._condition:
+            if self._unacked:
+                logging.warning('BRIDGE:serial link reset, {} unacknowledged frames lost'.format(len(self._unacked)))
+            self.lost += len(self._unacked)
+            self._unacked.clear()
+            self._next_sequence = 0
+            self._retransmissions = 0
+            self._writer(self._frame(self.RESET))
+            self._send_backlog()
+            self._condition.notify_all()
+
+    def send(self, payload: bytes) -> bool:
+        """
+        Queues payload without blocking, it is sent when window has space. Returns False when backlog is full and
+        payload was dropped. Payload can not contain new line character (except last one).
+        """
+        with self._condition:
+            if len(self._backlog) >= self.BACKLOG_SIZE:
+                self.lost += 1
+                logging.warning('BRIDGE:serial link backlog is full, frame dropped')
+                return False
+            self._backlog.append(payload.rstrip(b'\n'))
+            self._send_backlog()
+            return True
+
+    def _send_backlog(self):
+        """
+        Sends queued payloads while window has space, it has to be called with condition
+        """
+        while self._backlog and len(self._unacked) < self.WINDOW_SIZE:
+            frame = self._frame(b'%02x' % self._next_sequence + self._backlog.popleft())
+            self._unacked.update({self._next_sequence: [frame, time.monotonic()]})
+            self._next_sequence = (self._next_sequence + 1) % self.SEQUENCE_MODULO
+            self._writer(frame)
+            self.sent += 1
+
+    def _retransmit_expired(self):
+        if not self._unacked:
+            return
+        oldest = next(iter(self._unacked.values()))
+        now = time.monotonic()
+        if now - oldest[1] < self.RETRANSMIT_TIMEOUT:
+            return
+        self._retransmissions += 1
+        if self._retransmissions > self.MAX_RETRANSMISSIONS:
+            logging.error('BRIDGE:serial link frames not acknowledged, resetting link')
+            self.reset()
+            return
+        for record in self._unacked.values():
+            self._writer(record[0])
+            record[1] = now
+            self.retransmitted += 1
+
+    def poll(self):
+        with self._condition:
+            self._retransmit_expired()
+
+    def get_poll_interval(self) -> float:
+        return self.RETRANSMIT_TIMEOUT / 2 if self._unacked or self._backlog else self.IDLE_POLL_INTERVAL
+
+    def _handle_ack(self, sequence: int):
+        with self._condition:
+            if not self._unacked:
+                return
+            first = next(iter(self._unacked))
+            if (sequence - first) % self.SEQUENCE_MODULO >= len(self._unacked):
+                return      # old or invalid ack
+            while self._unacked:
+                acked, record = self._unacked.popitem(last=False)
+                if acked == sequence:
+                    break
+            self._retransmissions = 0
+            self._send_backlog()
+            self._condition.notify_all()
+
+    def _send_ack(self, sequence: int):
+        self._writer(self._frame(self.ACK + b'%02x' % sequence))
+
+    def receive(self, line: bytes):
+        """
+        Returns payload of valid in-order data frame (with new line character), None otherwise
+        """
+        line = line.rstrip(b'\r\n')
+        if line[:1] != self.FRAME_START or len(line) < 5:
+            self.unframed += 1
+            logging.debug('BRIDGE:unframed serial line "{}"'.format(line))
+            return None
+        body = line[1:-4]
+        try:
+            valid = crc16(body) == int(line[-4:], 16)
+        except ValueError:
+            valid = False
+        if not valid:
+            self.crc_errors += 1
+            return None
+        if body[:1] == self.ACK:
+            self._handle_ack(int(body[1:3], 16))
+            return None
+        if body[:1] == self.RESET:
+            self._expected_sequence = 0
+            return None
+        try:
+            sequence = int(body[:2], 16)
+        except ValueError:
+            self.crc_errors += 1
+            return None
+        if sequence != self._expected_sequence:
+            # duplicate or missing frame, repeat last ack so sender goes back
+            self.out_of_order += 1
+            self._send_ack((self._expected_sequence - 1) % self.SEQUENCE_MODULO)
+            return None
+        self._expected_sequence = (sequence + 1) % self.SEQUENCE_MODULO
+        self._send_ack(sequence)
+        self.received += 1
+        return body[2:] + b'\n'
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Waits until all queued frames are sent and acknowledged
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while (self._unacked or self._backlog) and time.monotonic() < deadline:
+                self._retransmit_expired()
+                self._condition.wait(min(self.RETRANSMIT_TIMEOUT, max(deadline - time.monotonic(), 0)))
+            return not self._unacked and not self._backlog
+
+    def get_stats(self) -> dict:
+        return {"sent": self.sent, "received": self.received, "retransmitted": self.retransmitted,
+                "crc_errors": self.crc_errors, "out_of_order": self.out_of_order, "unframed": self.unframed,
+                "lost": self.lost, "unacked": len(self._unacked), "queued": len(self._backlog)}
+
+
+class BaudRateProbe:
+    """
+    Finds highest stable baud rate of attached mote. For each candidate (from the highest), bridge asks mote at base
+    baud rate to switch ("!B<baudrate>"), switches too and sends echo requests ("?e<pattern>") which mote has to
+    return unchanged ("$e<pattern>"). Echo can come in parts or late (until ECHO_DEADLINE) and other lines of mote
+    are skipped, only corrupted or missing echo rejects baud rate. When all echoes are correct, baud rate is confirmed
+    ("!Bok"). Mote returns to base baud rate when confirmation does not come in time.
+    """
+    ECHO_COUNT = 20
+    ECHO_TIMEOUT = 0.2
+    ECHO_DEADLINE = 1.0
+    SWITCH_DELAY = 0.05
+    MOTE_REVERT_TIMEOUT = 1
+
+    def __init__(self, device: str, base_baudrate: int, candidates: list, rtscts: bool):
+        self._device = device
+        self._base_baudrate = base_baudrate
+        self._candidates = sorted([candidate for candidate in candidates if candidate > base_baudrate], reverse=True)
+        self._rtscts = rtscts
+
+    def _open(self, baudrate: int):
+        return serial.Serial(port=self._device, baudrate=baudrate, parity=serial.PARITY_NONE,
+                             stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS, timeout=self.ECHO_TIMEOUT,
+                             rtscts=self._rtscts)
+
+    def _read_echo(self, ser, expected: bytes) -> bool:
+        deadline = time.monotonic() + self.ECHO_DEADLINE
+        line = b''
+        while time.monotonic() < deadline:
+            # readline returns incomplete line when timeout expires
+            line += ser.readline()
+            if line[-1:] != b'\n':
+                continue
+            if line == expected:
+                return True
+            if line[:2] == b'$e':
+                return False
+            line = b''
+        return False
+
+    def _is_stable(self, ser) -> bool:
+        for i in range(self.ECHO_COUNT):
+            pattern = b'%02x' % i + os.urandom(24).hex().encode() + b'UU**'
+            ser.write(b'?e' + pattern + b'\n')
+            if not self._read_echo(ser, b'$e' + pattern + b'\n'):
+                return False
+        return True
+
+    def probe(self) -> int:
+        for baudrate in self._candidates:
+            try:
+                with self._open(self._base_baudrate) as ser:
+                    ser.reset_input_buffer()
+                    ser.write(b'!B%d\n' % baudrate)
+                    ser.flush()
+                    time.sleep(self.SWITCH_DELAY)
+                with self._open(baudrate) as ser:
+                    ser.reset_input_buffer()
+                    if self._is_stable(ser):
+                        ser.write(b'!Bok\n')
+                        ser.flush()
+                        logging.info('BRIDGE:serial baud rate {} is stable'.format(baudrate))
+                        return baudrate
+            except serial.SerialException as e:
+                logging.warning('BRIDGE:serial baud rate {} probe failed: {}'.format(baudrate, str(e)))
+            logging.info('BRIDGE:serial baud rate {} is not stable'.format(baudrate))
+            time.sleep(self.MOTE_REVERT_TIMEOUT)
+        return self._base_baudrate
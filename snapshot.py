@@ -0,0 +1,118 @@
+from ipaddress import IPv6Address
+from neighbors import NodeTable, NodeAddress
+from data import Data
+import logging
+import mmap
+import os
+import struct
+import time
+
+
+class NodeTableSnapshot:
+    """
+    Stores node table, wifi adjacencies and MAC address of first root (border router) into binary file, which is loaded
+    after restart.
+    File format (little endian):
+    header: magic, version, node count, adjacency count, write time, border router MAC flag, border router MAC
+    node record: technology index, MAC flag, IPv6 address, MAC address, lifetime
+    adjacency record: node record index, node record index
+    File is replaced atomically and read using mmap. Loaded records are marked stale until they are confirmed.
+    """
+    MAGIC = b'BRSN'
+    VERSION = 1
+    HEADER = struct.Struct("<4sHIIdB6s")
+    NODE_RECORD = struct.Struct("<BB16s6sH")
+    ADJACENCY_RECORD = struct.Struct("<II")
+
+    def __init__(self, path: str, node_table: NodeTable, data: Data, tech_types: list):
+        self._path = path
+        self._node_table = node_table
+        self._data = data
+        self._tech_types = tech_types
+
+    @staticmethod
+    def _mac_to_bytes(mac: str) -> bytes:
+        return bytes.fromhex(mac.replace(":", ""))
+
+    @staticmethod
+    def _bytes_to_mac(raw: bytes) -> str:
+        return ":".join(["{:02x}".format(x) for x in raw])
+
+    def _encode(self) -> bytes:
+        nodes = []
+        indexes = {}
+        for tech_type in self._tech_types:
+            for node in self._node_table.get_node_addresses(tech_type):
+                indexes.update({id(node): len(nodes)})
+                nodes.append(node)
+        records = []
+        adjacencies = []
+        for index, node in enumerate(nodes):
+            mac = node.get_l2_address()
+            records.append(self.NODE_RECORD.pack(self._tech_types.index(node.get_tech_type()), 1 if mac else 0,
+                                                 IPv6Address(str(node.get_ip_address())).packed,
+                                                 self._mac_to_bytes(mac) if mac else bytes(6),
+                                                 max(node.get_lifetime(), 0)))
+            for next_node in node.get_node_addresses().values():
+                next_index = indexes.get(id(next_node))
+                if next_index is not None and index < next_index:
+                    adjacencies.append(self.ADJACENCY_RECORD.pack(index, next_index))
+        border_router_l2 = self._data.get_roots().get_l2_address(self._data.get_roots().get_addresses()[0])
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, len(records), len(adjacencies), time.time(),
+                                  1 if border_router_l2 else 0,
+                                  self._mac_to_bytes(border_router_l2) if border_router_l2 else bytes(6))
+        return header + b''.join(records) + b''.join(adjacencies)
+
+    def write(self):
+        content = self._encode()
+        tmp_path = "{}.tmp".format(self._path)
+        with open(tmp_path, "wb") as snapshot_file:
+            snapshot_file.write(content)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, self._path)
+        logging.debug('BRIDGE:node table snapshot written to "{}"'.format(self._path))
+
+    """
+    Restores records from snapshot. Snapshot older than node lifetime is ignored, because all its records would be
+    expired already.
+    """
+    def load(self) -> int:
+        if not os.path.exists(self._path) or os.path.getsize(self._path) < self.HEADER.size:
+            return 0
+        with open(self._path, "rb") as snapshot_file:
+            with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                try:
+                    return self._decode(content)
+                except (struct.error, ValueError, IndexError) as e:
+                    logging.error('BRIDGE:node table snapshot "{}" is corrupted: {}'.format(self._path, str(e)))
+                    return 0
+
+    def _decode(self, content) -> int:
+        magic, version, node_count, adjacency_count, written_at, has_br_l2, border_router_l2 = \
+            self.HEADER.unpack_from(content, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            logging.warning('BRIDGE:node table snapshot "{}" has unknown format'.format(self._path))
+            return 0
+        age = time.time() - written_at
+        if age > self._node_table.get_lifetime():
+            logging.info('BRIDGE:node table snapshot is too old ({:.0f}s)'.format(age))
+            return 0
+        first_root = self._data.get_roots().get_addresses()[0]
+        if has_br_l2:
+            self._data.get_roots().set_l2_address(first_root, self._bytes_to_mac(border_router_l2), keep_known=True)
+        nodes = []
+        offset = self.HEADER.size
+        for i in range(node_count):
+            tech_index, has_mac, ip_address, mac, lifetime = self.NODE_RECORD.unpack_from(content, offset)
+            offset += self.NODE_RECORD.size
+            node = NodeAddress(IPv6Address(ip_address), self._tech_types[tech_index],
+                               self._bytes_to_mac(mac) if has_mac else None)
+            node.set_stale(int(lifetime - age))
+            nodes.append(self._node_table.restore_node_address(node))
+        for i in range(adjacency_count):
+            first, second = self.ADJACENCY_RECORD.unpack_from(content, offset)
+            offset += self.ADJACENCY_RECORD.size
+            self._node_table.add_next_node_address(nodes[first], nodes[second])
+        logging.info('BRIDGE:restored {} nodes and {} adjacencies from snapshot'.format(node_count, adjacency_count))
+        return node_count
@@ -0,0 +1,120 @@
+from threading import Event
+import logging
+import signal
+import time
+
+
+class WorkerRecord:
+    """
+    Single supervised thread. Thread is recreated by factory when it dies
+    """
+    def __init__(self, name: str, thread, factory=None):
+        self.name = name
+        self.thread = thread
+        self.factory = factory
+        self.restarts = 0
+        self.backoff = Supervisor.INITIAL_BACKOFF
+        self.restart_at = None
+        self.started_at = time.monotonic()
+
+
+class Supervisor:
+    """
+    Keeps main thread blocked (without CPU usage) until stop is requested by signal or command. Meanwhile, it checks
+    health of supervised threads and restarts dead ones with exponential backoff. SIGHUP requests reload, which is
+    done by supervisor loop outside of signal handler.
+    """
+    CHECK_INTERVAL = 1
+    INITIAL_BACKOFF = 0.5
+    MAX_BACKOFF = 30
+    STABLE_RUN_TIME = 60
+
+    def __init__(self):
+        self._stop_event = Event()
+        self._workers = {}
+        self._reload_function = None
+        self._reload_requested = False
+
+    def watch(self, name: str, thread, factory=None):
+        """
+        Starts supervising thread, thread without factory is only reported when dies
+        """
+        self._workers.update({name: WorkerRecord(name, thread, factory)})
+
+    def get_worker(self, name: str):
+        if name in self._workers:
+            return self._workers[name].thread
+        return None
+
+    def stop_worker(self, name: str, timeout: float):
+        thread = self.get_worker(name)
+        if thread and thread.is_alive():
+            thread.stop()
+            thread.join(max(timeout, 0))
+            if thread.is_alive():
+                logging.warning('BRIDGE:worker "{}" did not stop in time'.format(name))
+
+    def install_signal_handlers(self, reload_function=None):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        if reload_function:
+            self._reload_function = reload_function
+            signal.signal(signal.SIGHUP, self._handle_reload_signal)
+
+    def _handle_reload_signal(self, signum, frame):
+        logging.info('BRIDGE:received signal {}, reloading configuration'.format(signum))
+        self._reload_requested = True
+
+    def _handle_signal(self, signum, frame):
+        logging.info('BRIDGE:received signal {}, stopping bridge'.format(signum))
+        self.stop()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def _check_worker(self, worker: WorkerRecord):
+        if worker.thread.is_alive():
+            if worker.restart_at is None and time.monotonic() - worker.started_at > self.STABLE_RUN_TIME:
+                worker.backoff = self.INITIAL_BACKOFF
+            return
+        if not worker.factory:
+            if worker.restart_at is None:
+                logging.error('BRIDGE:worker "{}" died and can not be restarted'.format(worker.name))
+                worker.restart_at = float("inf")
+            return
+        now = time.monotonic()
+        if worker.restart_at is None:
+            worker.restart_at = now + worker.backoff
+            logging.error('BRIDGE:worker "{}" died, restarting in {}s'.format(worker.name, worker.backoff))
+            worker.backoff = min(worker.backoff * 2, self.MAX_BACKOFF)
+        elif now >= worker.restart_at:
+            try:
+                worker.thread = worker.factory()
+                worker.thread.start()
+                worker.restarts += 1
+                worker.started_at = now
+                logging.info('BRIDGE:worker "{}" restarted ({} restarts)'.format(worker.name, worker.restarts))
+            except Exception as e:
+                logging.error('BRIDGE:worker "{}" restart failed: {}'.format(worker.name, str(e)))
+            worker.restart_at = None
+
+    def run(self):
+        """
+        Blocks until stop is requested
+        """
+        while not self._stop_event.wait(self.CHECK_INTERVAL):
+            if self._reload_requested:
+                self._reload_requested = False
+                try:
+                    self._reload_function()
+                except Exception as e:
+                    logging.error('BRIDGE:configuration reload failed: {}'.format(str(e)))
+            for worker in list(self._workers.values()):
+                self._check_worker(worker)
+
+    def get_snapshot(self) -> list:
+        return [{"name": name, "alive": worker.thread.is_alive(), "restarts": worker.restarts}
+                for (name, worker) in list(self._workers.items())]
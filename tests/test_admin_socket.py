@@ -0,0 +1,30 @@
+import json
+import unittest
+from admin_socket import AdminServer
+from command_listener import Command
+
+
+class AdminServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = AdminServer("unused.sock")
+        self.server.add_command(Command("echo", lambda value=None: value, "Echo"))
+        self.server.add_command(Command("fail", lambda: 1 / 0, "Fails"))
+
+    def _request(self, cmd: str, **args) -> dict:
+        return self.server._handle_request(json.dumps({"cmd": cmd, "args": args}).encode())
+
+    def test_command_result(self):
+        self.assertEqual(self._request("echo", value=5), {"ok": True, "result": 5})
+
+    def test_unknown_command(self):
+        self.assertFalse(self._request("missing")["ok"])
+
+    def test_failing_command_returns_error(self):
+        response = self._request("fail")
+        self.assertFalse(response["ok"])
+        self.assertIn("division by zero", response["error"])
+
+    def test_copied_commands(self):
+        restarted = AdminServer("unused.sock")
+        restarted.copy_commands(self.server)
+        self.assertEqual(restarted._handle_request(b'{"cmd": "echo", "args": {"value": 1}}'), {"ok": True, "result": 1})
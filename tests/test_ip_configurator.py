@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+from data import Data, IpConfigurator, ChangeModeEvent
+from serial_connection import MoteGlobalAddressEvent
+from utils.netlink import NetlinkError
+
+
+class FakeBatch:
+    def __init__(self, netlink):
+        self._netlink = netlink
+        self.requests = []
+
+    def add_address(self, address: str):
+        self.requests.append(("add-address", address))
+
+    def remove_address(self, address: str):
+        self.requests.append(("remove-address", address))
+
+    def add_route(self, address: str):
+        self.requests.append(("add-route", address))
+
+    def remove_route(self, address: str):
+        self.requests.append(("remove-route", address))
+
+    def commit(self):
+        if self._netlink.failures:
+            self._netlink.failures -= 1
+            raise NetlinkError([("add address", 17)])
+        self._netlink.committed.append(self.requests)
+
+
+class FakeNetlink:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.committed = []
+
+    def batch(self, iface: str) -> FakeBatch:
+        return FakeBatch(self)
+
+
+class IpConfiguratorTest(unittest.TestCase):
+    def setUp(self):
+        self.data = Data({"border-router": {"ipv6": "2001:db8::1", "local": "", "failure-timeout": 3.0}})
+        self.netlink = FakeNetlink(failures=1)
+        with mock.patch("data.RouteNetlink", lambda: self.netlink):
+            self.configurator = IpConfigurator(self.data, "wlan0", "2001:db8:1::/64")
+
+    def test_failed_address_is_not_recorded_and_is_retried(self):
+        self.configurator.notify(MoteGlobalAddressEvent("2001:db8::5"))
+        self.assertIsNone(self.data.get_wifi_global_address())
+        self.configurator.notify(MoteGlobalAddressEvent("2001:db8::5"))
+        self.assertEqual(self.data.get_wifi_global_address(), "2001:db8:1::5")
+        self.assertEqual(len(self.netlink.committed), 1)
+
+    def test_failed_mode_is_retried(self):
+        self.configurator.notify(ChangeModeEvent(Data.MODE_NODE))
+        self.assertEqual(self.netlink.committed, [])
+        self.configurator.notify(MoteGlobalAddressEvent("2001:db8::5"))
+        self.assertEqual(self.netlink.committed[-1], [("remove-address", "2001:db8::1"), ("add-route", "2001:db8::1")])
@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+from interface_listener import NeighbourAdvertisementEvent
+from link_quality import LinkQualityMonitor
+
+
+class Configuration:
+    def get_configuration(self) -> dict:
+        return {"metrics": {"en": 1, "bw": 100, "etx": 1}}
+
+
+class LinkQualityMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("link_quality.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.monitor = LinkQualityMonitor(Configuration(), None)
+
+    def _measure(self, src_ip: str, target_ip: str, rtt: float):
+        self.monitor.ns_sent(target_ip)
+        self.now += rtt
+        self.monitor.notify(NeighbourAdvertisementEvent({"src_ip": src_ip, "src_l2_addr": "aa:bb:cc:dd:ee:01",
+                                                         "target_ip": target_ip}))
+
+    def test_stale_rtt_is_not_used(self):
+        self._measure("fe80::1", "2001:db8::1", 0.1)
+        self.assertEqual(self.monitor.get_metrics()["bw"], 10)
+        self.now += LinkQualityMonitor.RTT_MAX_AGE + 1
+        self.assertEqual(self.monitor.get_metrics()["bw"], 100)
+        self.assertIsNone(self.monitor.get_link_quality("fe80::1"))
+
+    def test_idle_links_and_pending_ns_are_pruned(self):
+        self._measure("fe80::1", "2001:db8::1", 0.01)
+        self.monitor.ns_sent("2001:db8::2")
+        self.now += LinkQualityMonitor.LINK_TIMEOUT + 1
+        self.monitor.packet_sent("fe80::2", 100)
+        self.monitor.evaluate()
+        self.assertEqual(list(self.monitor.get_snapshot().keys()), ["fe80::2"])
+        self.assertEqual(self.monitor._pending_ns, {})
+
+    def test_busy_link_gets_lower_weight(self):
+        self._measure("fe80::1", "2001:db8::1", 0.01)
+        self._measure("fe80::2", "2001:db8::2", 0.01)
+        for i in range(100):
+            self.monitor.packet_sent("fe80::1", 10000)
+        self.now += 1
+        self.monitor.evaluate()
+        self.assertLess(self.monitor.get_weight("fe80::1"), self.monitor.get_weight("fe80::2"))
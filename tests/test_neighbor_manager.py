@@ -0,0 +1,36 @@
+import unittest
+from ipaddress import IPv6Address
+from neighbors import NodeTable, NodeAddress, NeighborManager
+
+
+class RecordingPendings:
+    def __init__(self):
+        self.addresses = []
+
+    def add_pending(self, address: str, sender_function):
+        self.addresses.append(address)
+
+
+class RecordingSender:
+    def send_icmpv6_ns(self, ip_addr: str, dst_l2: str = None):
+        pass
+
+
+class RevalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.table = NodeTable(['wifi', 'rpl'])
+        self.pendings = RecordingPendings()
+        self.manager = NeighborManager(self.table, None, self.pendings, RecordingSender(), None)
+
+    def _restore(self, ip_address: str, tech_type: str, l2_address: str = None) -> NodeAddress:
+        node = NodeAddress(IPv6Address(ip_address), tech_type, l2_address)
+        node.set_stale(10)
+        return self.table.restore_node_address(node)
+
+    def test_restored_records_are_solicited(self):
+        self._restore("2001:db8::1", 'rpl')
+        mote = self.table.add_node_address(NodeAddress(IPv6Address("2001:db8::2"), 'rpl'))
+        self.table.add_next_node_address(mote, self._restore("2001:db8:1::1", 'wifi', "aa:bb:cc:dd:ee:01"))
+        self.table.add_node_address(NodeAddress(IPv6Address("2001:db8::3"), 'rpl'))
+        self.manager.revalidate_stale_nodes()
+        self.assertEqual(sorted(self.pendings.addresses), ["2001:db8::1", "2001:db8::2"])
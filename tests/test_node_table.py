@@ -0,0 +1,72 @@
+import unittest
+from ipaddress import IPv6Address
+from event_system import EventListener, Event
+from neighbors import NodeTable, NodeAddress, NeighbourEvictionEvent
+
+
+class CollectingListener(EventListener):
+    def __init__(self):
+        self.events = []
+
+    def notify(self, event: Event):
+        self.events.append(event.get_event())
+
+    def __str__(self):
+        return "collecting-listener"
+
+
+class NodeTableEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.table = NodeTable(['wifi', 'rpl'])
+        self.listener = CollectingListener()
+        self.table.subscribe_event(NeighbourEvictionEvent, self.listener)
+        self.table.sync_neighbours([IPv6Address("2001:db8::1"), IPv6Address("2001:db8::2")], 7, "radio0")
+        stale = NodeAddress(IPv6Address("2001:db8::3"), 'rpl')
+        stale.set_stale(10)
+        self.table.restore_node_address(stale)
+        self.table.add_node_address(NodeAddress("2001:db8:1::1", 'wifi', "aa:bb:cc:dd:ee:01"))
+
+    def _addresses(self, tech_type: str) -> list:
+        return sorted([str(node.get_ip_address()) for node in self.table.get_node_addresses(tech_type)])
+
+    def test_stale_and_wifi_records_go_first(self):
+        self.assertEqual(self.table.evict(NodeTable.MEMORY_RECORD * 2), 2)
+        self.assertEqual(self._addresses('rpl'), ["2001:db8::1", "2001:db8::2"])
+        self.assertEqual(self._addresses('wifi'), [])
+        self.assertTrue(self.table.is_neighbour_delta_synced("radio0"))
+        self.assertEqual(self.listener.events, [])
+
+    def test_evicted_neighbour_requests_resync(self):
+        self.table.evict(NodeTable.MEMORY_RECORD * 3)
+        self.assertEqual(len(self._addresses('rpl')), 1)
+        self.assertFalse(self.table.is_neighbour_delta_synced("radio0"))
+        self.assertEqual(self.listener.events, ["radio0"])
+        self.assertEqual(self.table.apply_neighbour_delta(8, [IPv6Address("2001:db8::4")], [], "radio0"),
+                         NodeTable.DELTA_IGNORED)
+        self.table.sync_neighbours([IPv6Address("2001:db8::1"), IPv6Address("2001:db8::2")], 9, "radio0")
+        self.assertEqual(self._addresses('rpl'), ["2001:db8::1", "2001:db8::2"])
+        self.assertEqual(self.table.apply_neighbour_delta(10, [], [IPv6Address("2001:db8::2")], "radio0"),
+                         NodeTable.DELTA_APPLIED)
+
+    def test_evict_frees_requested_memory(self):
+        for size in [1, NodeTable.MEMORY_RECORD + 1, NodeTable.MEMORY_RECORD * 6, NodeTable.MEMORY_RECORD * 10]:
+            self.setUp()
+            wifi = self.table.get_node_address("2001:db8:1::1", 'wifi')
+            for node in self.table.get_node_addresses('rpl'):
+                self.table.add_next_node_address(node, wifi)
+            before = self.table.get_memory()["bytes"]
+            self.table.evict(size)
+            self.assertGreaterEqual(before - self.table.get_memory()["bytes"], min(size, before))
+
+
+class NeighbourGenerationTest(unittest.TestCase):
+    def setUp(self):
+        self.table = NodeTable(['wifi', 'rpl'])
+        self.table.sync_neighbours([IPv6Address("2001:db8::1")], 7, "radio0")
+
+    def test_legacy_list_keeps_generation(self):
+        self.table.sync_neighbours([IPv6Address("2001:db8::1"), IPv6Address("2001:db8::2")], None, "radio0")
+        self.assertTrue(self.table.is_neighbour_delta_synced("radio0"))
+        self.assertEqual(self.table.apply_neighbour_delta(8, [IPv6Address("2001:db8::3")], [], "radio0"),
+                         NodeTable.DELTA_APPLIED)
+        self.assertEqual(len(self.table.get_node_addresses('rpl')), 3)
@@ -0,0 +1,93 @@
+import socket
+import struct
+import unittest
+from packet import (build_udp, parse_frame, NeighbourAdvertisementCache, ContikiPacket, _checksum, ETHER_HEADER,
+                    IPV6_HEADER, TUNNEL_HEADROOM, IPPROTO_IPV6, IPPROTO_ICMPV6, IPPROTO_UDP)
+
+
+def ones_complement_sum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack("!{}H".format(len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return total
+
+
+def pseudo_header(src_ip: str, dst_ip: str, length: int, next_header: int) -> bytes:
+    return socket.inet_pton(socket.AF_INET6, src_ip) + socket.inet_pton(socket.AF_INET6, dst_ip) + \
+        struct.pack("!I3xB", length, next_header)
+
+
+class ChecksumTest(unittest.TestCase):
+    def test_checksum_completes_sum(self):
+        for data in [b'\x00\x01\xf2\x03\xf4\xf5\xf6\xf7', b'\xff\xff\x12', b'\x45\x00\x00\x73\x00\x00\x40\x00']:
+            padded = data + b'\x00' * (len(data) % 2)
+            self.assertEqual(ones_complement_sum(padded + struct.pack("!H", _checksum(data))), 0xffff)
+
+
+class BuildUdpTest(unittest.TestCase):
+    def test_packet_fields_and_checksum(self):
+        packet = build_udp("2001:db8::1", "2001:db8::2", 1000, 5683, b'payload', headroom=4)
+        version, length, next_header, hop_limit, src, dst = IPV6_HEADER.unpack_from(packet, 4)
+        self.assertEqual((version >> 28, length, next_header), (6, 15, IPPROTO_UDP))
+        self.assertEqual(struct.unpack_from("!HHH", packet, 4 + IPV6_HEADER.size), (1000, 5683, 15))
+        self.assertEqual(bytes(packet[-7:]), b'payload')
+        udp = bytes(packet[4 + IPV6_HEADER.size:])
+        self.assertEqual(ones_complement_sum(pseudo_header("2001:db8::1", "2001:db8::2", 15, IPPROTO_UDP) + udp),
+                         0xffff)
+
+
+class ParseFrameTest(unittest.TestCase):
+    def setUp(self):
+        packet = ContikiPacket()
+        packet.set_contiki_format("2001:db8::1;2001:db8::2;5683;5683;0102")
+        self.inner = bytes(packet.get_wire_format())
+        self.frame = packet.get_frame("aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02", "fe80::1", "fe80::2")
+
+    def test_tunnelled_packet_is_parsed(self):
+        outer_src, outer_dst, next_header, payload = parse_frame(self.frame)
+        self.assertEqual((outer_src, outer_dst, next_header), ("fe80::1", "fe80::2", IPPROTO_IPV6))
+        self.assertEqual(bytes(payload), self.inner)
+        self.assertEqual(bytes(self.frame[0:6]), bytes.fromhex("aabbccddee02"))
+
+    def test_other_frames_are_ignored(self):
+        frame = bytearray(self.frame)
+        frame[12:14] = b'\x08\x00'
+        self.assertIsNone(parse_frame(frame))
+        self.assertIsNone(parse_frame(self.frame[:ETHER_HEADER.size + IPV6_HEADER.size - 1]))
+
+    def test_wire_format_round_trip(self):
+        packet = ContikiPacket()
+        self.assertTrue(packet.set_wire_format(parse_frame(self.frame)[3]))
+        self.assertEqual(packet.get_contiki_format(), "2001:db8::1;2001:db8::2;5683;5683;0102")
+        original = ContikiPacket()
+        original.set_contiki_format("2001:db8::1;2001:db8::2;5683;5683;0102")
+        self.assertEqual(packet.get_key(), original.get_key())
+
+
+class NeighbourAdvertisementCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = NeighbourAdvertisementCache()
+
+    def _check_frame(self, frame: bytearray, dst_l2: str, dst_ip: str):
+        self.assertEqual(bytes(frame[0:6]), bytes.fromhex(dst_l2.replace(":", "")))
+        self.assertEqual(bytes(frame[6:12]), bytes.fromhex("aabbccddee01"))
+        version, length, next_header, hop_limit, src, dst = IPV6_HEADER.unpack_from(frame, ETHER_HEADER.size)
+        self.assertEqual((length, next_header), (24, IPPROTO_ICMPV6))
+        self.assertEqual(dst, socket.inet_pton(socket.AF_INET6, dst_ip))
+        self.assertEqual(frame[TUNNEL_HEADROOM], 136)
+        self.assertEqual(bytes(frame[-16:]), socket.inet_pton(socket.AF_INET6, "2001:db8::ff"))
+        self.assertEqual(ones_complement_sum(pseudo_header("fe80::1", dst_ip, 24, IPPROTO_ICMPV6) +
+                                             bytes(frame[TUNNEL_HEADROOM:])), 0xffff)
+
+    def test_frames_from_template_have_valid_checksum(self):
+        for (dst_l2, dst_ip) in [("aa:bb:cc:dd:ee:02", "fe80::2"), ("aa:bb:cc:dd:ee:03", "fe80::ffff:3")]:
+            frame = self.cache.get_frame("aa:bb:cc:dd:ee:01", "fe80::1", dst_l2, dst_ip, "2001:db8::ff")
+            self._check_frame(frame, dst_l2, dst_ip)
+        self.assertEqual(len(self.cache._templates), 1)
+
+    def test_template_is_not_changed(self):
+        first = self.cache.get_frame("aa:bb:cc:dd:ee:01", "fe80::1", "aa:bb:cc:dd:ee:02", "fe80::2", "2001:db8::ff")
+        self.cache.get_frame("aa:bb:cc:dd:ee:01", "fe80::1", "aa:bb:cc:dd:ee:03", "fe80::3", "2001:db8::ff")
+        self._check_frame(first, "aa:bb:cc:dd:ee:02", "fe80::2")
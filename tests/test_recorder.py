@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from recorder import Recorder, RecordingReader, Replayer
+from serial_link import SerialLink
+
+
+class CollectingParser:
+    def __init__(self):
+        self.lines = []
+
+    def parse(self, line):
+        self.lines.append(bytes(line))
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        descriptor, self.path = tempfile.mkstemp()
+        os.close(descriptor)
+        os.remove(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _replay(self) -> list:
+        parser = CollectingParser()
+        Replayer(self.path, parser, speed=0).run()
+        return parser.lines
+
+    def test_records_round_trip(self):
+        recorder = Recorder(self.path)
+        recorder.record(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_RX, b'!c1\n')
+        recorder.record(Recorder.CHANNEL_WIFI, Recorder.DIRECTION_TX, b'\x00\x01')
+        recorder.close()
+        records = [(channel, direction, bytes(data)) for (timestamp, channel, direction, data)
+                   in RecordingReader(self.path)]
+        self.assertEqual(records, [(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_RX, b'!c1\n'),
+                                   (Recorder.CHANNEL_WIFI, Recorder.DIRECTION_TX, b'\x00\x01')])
+
+    def test_unframed_lines_are_replayed(self):
+        recorder = Recorder(self.path)
+        for line in [b'!c1\n', b'!r2001:db8::1;\n']:
+            recorder.record(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_RX, line)
+        recorder.close()
+        self.assertEqual(self._replay(), [b'!c1\n', b'!r2001:db8::1;\n'])
+
+    def test_framed_lines_are_unwrapped(self):
+        frames = []
+        sender = SerialLink(frames.append)
+        sender.reset()
+        sender.send(b'!c1')
+        sender.send(b'!r2001:db8::1;')
+        recorder = Recorder(self.path)
+        for frame in frames + [frames[-1], SerialLink._frame(SerialLink.ACK + b'00')]:
+            recorder.record(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_RX, frame)
+        recorder.record(Recorder.CHANNEL_SERIAL, Recorder.DIRECTION_TX, frames[1])
+        recorder.close()
+        self.assertEqual(self._replay(), [b'!c1\n', b'!r2001:db8::1;\n'])
@@ -0,0 +1,38 @@
+import unittest
+from responder import NeighbourResponder
+
+
+class RecordingSender:
+    def __init__(self):
+        self.advertisements = []
+
+    def send_icmpv6_na(self, src_l2: str, src_ip: str, target_ip: str):
+        self.advertisements.append((src_l2, src_ip, target_ip))
+
+
+class NeighbourResponderTest(unittest.TestCase):
+    def setUp(self):
+        self.sender = RecordingSender()
+        self.responder = NeighbourResponder(self.sender, window=1.0, rate=0.1, burst=2)
+
+    def test_storm_is_rate_limited(self):
+        answered = [self.responder.respond("aa:bb:cc:dd:ee:{:02x}".format(i), "2001:db8::{:x}".format(i),
+                                           "2001:db8::ffff") for i in range(10)]
+        self.assertEqual(answered.count(True), 2)
+        self.assertEqual(self.responder.get_stats()["rate_limited"], 8)
+
+    def test_same_solicitation_is_answered_once_per_window(self):
+        self.assertTrue(self.responder.respond("aa:bb:cc:dd:ee:01", "2001:db8::1", "2001:db8::ffff"))
+        self.assertFalse(self.responder.respond("aa:bb:cc:dd:ee:01", "2001:db8::1", "2001:db8::ffff"))
+
+    def test_probes_skip_shared_bucket(self):
+        for i in range(10):
+            self.responder.respond("aa:bb:cc:dd:ee:{:02x}".format(i), "2001:db8::{:x}".format(i), "2001:db8::ffff")
+        self.assertTrue(self.responder.respond("aa:bb:cc:dd:ee:99", "2001:db8::99", "2001:db8::2", probe=True))
+        self.assertTrue(self.responder.respond("aa:bb:cc:dd:ee:99", "2001:db8::99", "2001:db8::2", probe=True))
+
+    def test_probes_are_limited_per_source(self):
+        answered = [self.responder.respond("aa:bb:cc:dd:ee:01", "2001:db8::1", "2001:db8::2", probe=True)
+                    for i in range(NeighbourResponder.PROBE_BURST + 3)]
+        self.assertEqual(answered.count(True), NeighbourResponder.PROBE_BURST)
+        self.assertTrue(self.responder.respond("aa:bb:cc:dd:ee:02", "2001:db8::3", "2001:db8::2", probe=True))
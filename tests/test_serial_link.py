@@ -0,0 +1,80 @@
+import time
+import unittest
+from serial_link import SerialLink, BaudRateProbe
+
+
+class SerialLinkTest(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+        self.link = SerialLink(self.written.append)
+
+    def _data_frames(self) -> list:
+        return [frame for frame in self.written if frame[1:2] not in [SerialLink.ACK, SerialLink.RESET]]
+
+    def test_frames_round_trip(self):
+        receiver_written = []
+        receiver = SerialLink(receiver_written.append)
+        self.link.send(b'!p;payload\n')
+        self.assertEqual(receiver.receive(self.written[-1]), b'!p;payload\n')
+        self.link.receive(receiver_written[-1])
+        self.assertEqual(self.link.get_stats()["unacked"], 0)
+
+    def test_corrupted_frame_is_rejected(self):
+        self.link.send(b'!p;payload')
+        frame = bytearray(self.written[-1])
+        frame[4] ^= 1
+        self.assertIsNone(SerialLink(lambda frame: None).receive(bytes(frame)))
+
+    def test_full_window_does_not_block(self):
+        started = time.monotonic()
+        for i in range(SerialLink.WINDOW_SIZE * 2):
+            self.assertTrue(self.link.send(b'line %d' % i))
+        self.assertLess(time.monotonic() - started, SerialLink.RETRANSMIT_TIMEOUT)
+        self.assertEqual(len(self._data_frames()), SerialLink.WINDOW_SIZE)
+        self.assertEqual(self.link.get_stats()["queued"], SerialLink.WINDOW_SIZE)
+
+    def test_ack_sends_backlog(self):
+        for i in range(SerialLink.WINDOW_SIZE + 3):
+            self.link.send(b'line %d' % i)
+        self.link.receive(SerialLink._frame(SerialLink.ACK + b'%02x' % 2))
+        self.assertEqual(len(self._data_frames()), SerialLink.WINDOW_SIZE + 3)
+        self.assertEqual(self.link.get_stats()["queued"], 0)
+
+    def test_full_backlog_drops_frame(self):
+        for i in range(SerialLink.WINDOW_SIZE + SerialLink.BACKLOG_SIZE):
+            self.link.send(b'line')
+        self.assertFalse(self.link.send(b'line'))
+        self.assertEqual(self.link.get_stats()["lost"], 1)
+
+
+class FakeSerial:
+    """
+    Returns prepared chunks from readline, echo of written request is added to chunks by function
+    """
+    def __init__(self, respond):
+        self._respond = respond
+        self._chunks = []
+
+    def write(self, data: bytes):
+        self._chunks.extend(self._respond(data))
+
+    def readline(self) -> bytes:
+        return self._chunks.pop(0) if self._chunks else b''
+
+
+class BaudRateProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.probe = BaudRateProbe("/dev/null", 115200, [], False)
+
+    def test_partial_and_late_echo_is_accepted(self):
+        def respond(data: bytes) -> list:
+            echo = b'$e' + data[2:]
+            return [b'', b'debug print\n', echo[:10], b'', echo[10:]]
+        self.assertTrue(self.probe._is_stable(FakeSerial(respond)))
+
+    def test_corrupted_echo_is_rejected(self):
+        self.assertFalse(self.probe._is_stable(FakeSerial(lambda data: [b'$e' + data[3:]])))
+
+    def test_missing_echo_is_rejected(self):
+        self.probe.ECHO_DEADLINE = 0.05
+        self.assertFalse(self.probe._is_stable(FakeSerial(lambda data: [])))
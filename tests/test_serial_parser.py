@@ -0,0 +1,59 @@
+import io
+import unittest
+from console import ConsoleSink
+from event_system import EventListener, Event
+from neighbors import NodeTable
+from packet import AddressContextTable
+from serial_connection import SerialParser, RequestRouteToMoteEvent, SerialPacketToSendEvent
+
+
+class CollectingListener(EventListener):
+    def __init__(self):
+        self.events = []
+
+    def notify(self, event: Event):
+        self.events.append(event.get_event())
+
+    def __str__(self):
+        return "collecting-listener"
+
+
+class SerialParserTest(unittest.TestCase):
+    def setUp(self):
+        self.contexts = AddressContextTable()
+        self.contexts.set_context(AddressContextTable.WIFI_CONTEXT, "2001:db8::/64")
+        self.parser = SerialParser(None, NodeTable(['wifi', 'rpl']), self.contexts)
+        self.listener = CollectingListener()
+        self.parser.subscribe_event(RequestRouteToMoteEvent, self.listener)
+        self.parser.subscribe_event(SerialPacketToSendEvent, self.listener)
+
+    def test_route_request_address_is_expanded(self):
+        self.parser.parse(b'?p;7;*0a\n')
+        self.parser.parse(b'?p;8;2001:db8:1::1\n')
+        self.assertEqual(self.listener.events, [{"question_id": "7", "ip_addr": "2001:db8::a"},
+                                                {"question_id": "8", "ip_addr": "2001:db8:1::1"}])
+
+    def test_route_request_with_unknown_context_is_dropped(self):
+        self.parser.parse(b'?p;7;*5a\n')
+        self.assertEqual(self.listener.events, [])
+
+    def test_malformed_packet_is_dropped(self):
+        self.parser.parse(b'!p;2001:db8::1;not-an-address;5683;5683;00\n')
+        self.parser.parse(b'!p;2001:db8::1;2001:db8::2;port;5683;00\n')
+        self.parser.parse(b'!p;2001:db8::1\n')
+        self.assertEqual(self.listener.events, [])
+        self.parser.parse(b'!p;2001:db8::1;2001:db8::2;5683;5683;00\n')
+        self.assertEqual(len(self.listener.events), 1)
+
+
+class UnknownLineTest(unittest.TestCase):
+    def test_unknown_line_is_logged_by_console_sink(self):
+        console = ConsoleSink()
+        parser = SerialParser(None, NodeTable(['wifi', 'rpl']), AddressContextTable(), radio="radio0", console=console)
+        parser.parse(b'unknown line\n')
+        self.assertEqual(console.get_stats()["queued"], 1)
+        stream = io.StringIO()
+        with self.assertLogs(level="DEBUG") as logs:
+            console.flush(stream)
+        self.assertEqual(logs.output, ["DEBUG:root:CONTIKI:unknown line"])
+        self.assertEqual(stream.getvalue(), "[radio0] unknown line\n")
@@ -0,0 +1,53 @@
+import multiprocessing
+import unittest
+from utils.shared_ring import SharedRing, SeqlockRegion
+
+
+class SharedRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedRing(multiprocessing.Event(), slots=4)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_records_keep_order(self):
+        for record in [b'first', b'', b'third']:
+            self.assertTrue(self.ring.put(record))
+        self.assertEqual([self.ring.get(0) for i in range(3)], [b'first', b'', b'third'])
+        self.assertIsNone(self.ring.get(0.01))
+
+    def test_full_ring_drops_record(self):
+        for i in range(4):
+            self.assertTrue(self.ring.put(b'%d' % i))
+        self.assertFalse(self.ring.put(b'4'))
+        self.assertEqual(self.ring.get_dropped(), 1)
+        self.assertEqual(self.ring.get(0), b'0')
+        self.assertTrue(self.ring.put(b'4'))
+
+    def test_oversized_record_is_dropped(self):
+        self.assertFalse(self.ring.put(bytes(SharedRing.SLOT_SIZE)))
+        self.assertTrue(self.ring.put(bytes(SharedRing.SLOT_SIZE - SharedRing.LENGTH.size)))
+        self.assertEqual(self.ring.get_oversized(), 1)
+        self.assertEqual(len(self.ring), 1)
+
+    def test_counters_are_shared(self):
+        attached = SharedRing(self.ring.get_doorbell(), self.ring.get_name(), 4)
+        try:
+            self.ring.put(bytes(SharedRing.SLOT_SIZE))
+            self.ring.put(b'record')
+            self.assertEqual(attached.get_oversized(), 1)
+            self.assertEqual(attached.get(0), b'record')
+        finally:
+            attached.close()
+
+
+class SeqlockRegionTest(unittest.TestCase):
+    def test_read_returns_written_data(self):
+        region = SeqlockRegion(size=64)
+        try:
+            region.write(b'snapshot')
+            self.assertEqual(region.read(), (2, b'snapshot'))
+            with self.assertRaises(ValueError):
+                region.write(bytes(65))
+        finally:
+            region.close()
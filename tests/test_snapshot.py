@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from ipaddress import IPv6Address
+from neighbors import NodeTable, NodeAddress
+from roots import RootSet
+from snapshot import NodeTableSnapshot
+
+
+class RootData:
+    def __init__(self):
+        self._roots = RootSet("2001:db8::1")
+
+    def get_roots(self) -> RootSet:
+        return self._roots
+
+
+class NodeTableSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "snapshot.bin")
+        self.table = NodeTable(['wifi', 'rpl'])
+        mote = self.table.add_node_address(NodeAddress(IPv6Address("2001:db8::2"), 'rpl'))
+        wifi = self.table.add_node_address(NodeAddress(IPv6Address("2001:db8:1::2"), 'wifi', "aa:bb:cc:dd:ee:02"))
+        self.table.add_next_node_address(mote, wifi)
+        data = RootData()
+        data.get_roots().set_l2_address("2001:db8::1", "aa:bb:cc:dd:ee:01")
+        NodeTableSnapshot(self.path, self.table, data, ['wifi', 'rpl']).write()
+
+    def _load(self) -> tuple:
+        table = NodeTable(['wifi', 'rpl'])
+        data = RootData()
+        return table, data, NodeTableSnapshot(self.path, table, data, ['wifi', 'rpl']).load()
+
+    def test_records_are_restored_stale(self):
+        table, data, restored = self._load()
+        self.assertEqual(restored, 2)
+        mote = table.get_node_address("2001:db8::2", 'rpl')
+        wifi = table.get_node_address("2001:db8:1::2", 'wifi')
+        self.assertTrue(mote.is_stale() and wifi.is_stale())
+        self.assertLessEqual(mote.get_lifetime(), NodeAddress.STALE_LIFETIME)
+        self.assertEqual(wifi.get_l2_address(), "aa:bb:cc:dd:ee:02")
+        self.assertEqual(list(mote.get_node_addresses().values()), [wifi])
+        self.assertEqual(data.get_roots().get_l2_address("2001:db8::1"), "aa:bb:cc:dd:ee:01")
+
+    def test_confirmed_record_is_not_stale(self):
+        table, data, restored = self._load()
+        table.refresh_node_address(IPv6Address("2001:db8::2"), 'rpl')
+        self.assertFalse(table.get_node_address("2001:db8::2", 'rpl').is_stale())
+
+    def test_corrupted_snapshot_is_ignored(self):
+        with open(self.path, "r+b") as snapshot_file:
+            snapshot_file.truncate(os.path.getsize(self.path) - 4)
+        table, data, restored = self._load()
+        self.assertEqual(restored, 0)
+
+    def test_snapshot_of_other_format_is_ignored(self):
+        with open(self.path, "r+b") as snapshot_file:
+            snapshot_file.write(b'XXXX')
+        table, data, restored = self._load()
+        self.assertEqual((restored, table.get_node_addresses('rpl')), (0, []))
+
+    def test_known_root_address_is_kept(self):
+        table = NodeTable(['wifi', 'rpl'])
+        data = RootData()
+        data.get_roots().confirm("2001:db8::1", "aa:bb:cc:dd:ee:09")
+        NodeTableSnapshot(self.path, table, data, ['wifi', 'rpl']).load()
+        self.assertEqual(data.get_roots().get_l2_address("2001:db8::1"), "aa:bb:cc:dd:ee:09")
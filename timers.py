@@ -1,35 +1,147 @@
-from threading import Thread
-from serial_connection import SerialCommands
-from neighbors import NodeTable
-import time
+from utils.stoppable_thread import StoppableThread
+from serial_connection import SerialCommands, NeighbourResyncEvent
+from neighbors import NodeTable, NeighbourEvictionEvent
+from data import Data
+from event_system import EventListener, Event
+import logging
 
 
-class NeighbourRequestTimer(Thread):
+class NeighbourRequestTimer(StoppableThread, EventListener):
     """
-    Timer for sending request periodically over serial line
+    Timer for sending request periodically over serial line. First request is sent as soon as mote address is known.
+    While contiki pushes neighbour deltas, full list is only a fallback and request interval is doubled up to refresh
+    interval of node table (lower than node lifetime, so records are still refreshed). Interval is reset on delta gap.
     """
-    def __init__(self, request_time: int, slip_commands: SerialCommands):
-        Thread.__init__(self)
+    def __init__(self, request_time: int, slip_commands: SerialCommands, data: Data, node_table: NodeTable,
+                 radio: str = None):
+        StoppableThread.__init__(self)
+        EventListener.__init__(self)
         self._neighbours_request_time = request_time
+        self._current_request_time = request_time
         self._slip_commands = slip_commands
+        self._data = data
+        self._node_table = node_table
+        self._radio = radio
 
     def run(self):
-        time.sleep(5)
-        while 1:
+        while not self._data.wait_ready(Data.READY_MOTE_ADDRESS, self._neighbours_request_time):
+            if self.is_stopped():
+                return
+        while not self.is_stopped():
             self._slip_commands.request_neighbours_from_contiki()
-            time.sleep(self._neighbours_request_time)
+            self.wait(self._current_request_time)
+            if self._node_table.is_neighbour_delta_synced(self._radio):
+                self._current_request_time = min(self._current_request_time * 2,
+                                                 self._node_table.get_refresh_interval())
+            else:
+                self._current_request_time = self._neighbours_request_time
+
+    def notify(self, event: Event):
+        if isinstance(event, NeighbourResyncEvent):
+            self._current_request_time = self._neighbours_request_time
+        elif isinstance(event, NeighbourEvictionEvent) and event.get_event() in [self._radio, None]:
+            self._current_request_time = self._neighbours_request_time
+
+    def apply_configuration(self, configuration: dict):
+        self._neighbours_request_time = configuration['neighbours']['request-interval']
+        self._current_request_time = self._neighbours_request_time
+
+    def __str__(self):
+        return "neighbour-request-timer"
 
 
-class PurgeTimer(Thread):
+class PurgeTimer(StoppableThread):
     """
-    Timer responsible for decreasing lifetime of records
+    Timer responsible for decreasing lifetime of records, expiring idle flows and enforcing memory budget of tables
     """
-    def __init__(self, purging_interval: int, node_table: NodeTable):
-        Thread.__init__(self)
+    def __init__(self, purging_interval: int, node_table: NodeTable, flow_table=None, memory_budget=None):
+        StoppableThread.__init__(self)
         self._purging_interval = purging_interval
         self._node_table = node_table
+        self._flow_table = flow_table
+        self._memory_budget = memory_budget
 
     def run(self):
-        while 1:
+        while not self.is_stopped():
             self._node_table.decrease_lifetime()
-            time.sleep(self._purging_interval)
+            if self._flow_table:
+                self._flow_table.expire()
+            if self._memory_budget:
+                self._memory_budget.check()
+            self.wait(self._purging_interval)
+
+    def apply_configuration(self, configuration: dict):
+        self._purging_interval = configuration['neighbours']['purge-interval']
+
+
+class SnapshotTimer(StoppableThread):
+    """
+    Timer responsible for periodical writing of node table snapshot
+    """
+    def __init__(self, interval: int, snapshot):
+        StoppableThread.__init__(self)
+        self._interval = interval
+        self._snapshot = snapshot
+
+    def run(self):
+        while self.wait(self._interval):
+            try:
+                self._snapshot.write()
+            except OSError as e:
+                logging.error('BRIDGE:writing of node table snapshot failed: {}'.format(str(e)))
+
+    def apply_configuration(self, configuration: dict):
+        self._interval = configuration['snapshot']['interval']
+
+
+class LinkQualityTimer(StoppableThread):
+    """
+    Timer which evaluates wifi link quality and pushes changed metrics to contiki devices of all radios
+    """
+    def __init__(self, interval: int, link_monitor, slip_commands: list):
+        StoppableThread.__init__(self)
+        self._interval = interval
+        self._link_monitor = link_monitor
+        self._slip_commands = slip_commands
+
+    def run(self):
+        while self.wait(self._interval):
+            metrics = self._link_monitor.evaluate()
+            if metrics:
+                for slip_commands in self._slip_commands:
+                    slip_commands.send_metrics_to_contiki(metrics["en"], metrics["bw"], metrics["etx"])
+
+    def apply_configuration(self, configuration: dict):
+        self._interval = configuration['metrics']['link-quality-interval']
+
+
+class RootProbeTimer(StoppableThread):
+    """
+    Timer responsible for liveness of roots in node mode. Every root is solicited each interval and roots answer by
+    NA. Solicitation is unicast to root with known L2 address. Root without answer for failure timeout is skipped by
+    root selection.
+    """
+    def __init__(self, interval: float, data: Data, packet_sender):
+        StoppableThread.__init__(self)
+        self._interval = interval
+        self._data = data
+        self._packet_sender = packet_sender
+        self.probes = 0
+
+    def probe(self):
+        for address in self._data.get_roots().get_addresses():
+            self._packet_sender.send_icmpv6_ns(address, self._data.get_roots().get_l2_address(address))
+            self.probes += 1
+
+    def run(self):
+        while not self.is_stopped():
+            if self._data.get_mode() == Data.MODE_NODE:
+                self.probe()
+            self._data.get_roots().check()
+            self.wait(self._interval)
+
+    def apply_configuration(self, configuration: dict):
+        self._interval = configuration['border-router']['probe-interval']
+
+    def get_stats(self) -> dict:
+        return {"probes": self.probes, "roots": self._data.get_roots().get_snapshot()}
@@ -0,0 +1,35 @@
+import logging
+import time
+
+
+class BootTimer:
+    """
+    Collects timestamps of boot phases and reports time elapsed since process start (import time included)
+    """
+    def __init__(self, started: float = None):
+        self._started = started if started is not None else time.perf_counter()
+        self._marks = []
+
+    def mark(self, phase: str, timestamp: float = None):
+        self._marks.append((phase, timestamp if timestamp is not None else time.perf_counter()))
+
+    def get_elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def report(self) -> str:
+        result = "Boot timing\n{:<25}{:>12}{:>12}\n".format("Phase", "Delta [ms]", "Total [ms]")
+        previous = self._started
+        for phase, timestamp in self._marks:
+            result += "{:<25}{:>12.1f}{:>12.1f}\n".format(phase, (timestamp - previous) * 1000,
+                                                          (timestamp - self._started) * 1000)
+            previous = timestamp
+        return result
+
+    def get_snapshot(self) -> list:
+        return [{"phase": phase, "total_ms": round((timestamp - self._started) * 1000, 1)}
+                for (phase, timestamp) in self._marks]
+
+    def print_report(self):
+        report = self.report()
+        logging.info('BRIDGE:{}'.format(report.replace("\n", " | ")))
+        print(report)
@@ -1,31 +1,163 @@
 import configparser
+import logging
+
+
+class Option:
+    """
+    Typed option of configuration file. Option without default is required. Live option is applied to running bridge
+    on reload, change of other options needs restart.
+    """
+    def __init__(self, kind: type, default=None, minimum=None, maximum=None, live: bool = False):
+        self.kind = kind
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.live = live
+
+    def parse(self, value: str):
+        if self.kind is bool:
+            if value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+                raise ValueError('"{}" is not boolean'.format(value))
+            return configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+        result = self.kind(value)
+        if self.minimum is not None and result < self.minimum:
+            raise ValueError("{} is lower than {}".format(result, self.minimum))
+        if self.maximum is not None and result > self.maximum:
+            raise ValueError("{} is greater than {}".format(result, self.maximum))
+        return result
+
+
+class ConfigurationError(Exception):
+    def __init__(self, errors: list):
+        Exception.__init__(self, "; ".join(errors))
+        self.errors = errors
 
 
 class ConfigurationLoader:
+    SCHEMA = {
+        "border-router": {
+            "ipv6": Option(str),
+            "local": Option(str, ""),
+            "probe-interval": Option(float, 1.0, minimum=0.1, live=True),
+            "failure-timeout": Option(float, 3.0, minimum=0.1, live=True)
+        },
+        "serial": {
+            "device": Option(str),
+            "baudrate": Option(int, 115200, minimum=50),
+            "rtscts": Option(bool, False),
+            "framing": Option(bool, False),
+            "probe-baudrates": Option(str, "")
+        },
+        "metrics": {
+            "en": Option(int, minimum=0, live=True),
+            "bw": Option(int, minimum=0, live=True),
+            "etx": Option(int, minimum=0, live=True),
+            "link-quality-interval": Option(float, 5.0, minimum=0.1, live=True)
+        },
+        "wifi": {
+            "device": Option(str),
+            "subnet": Option(str),
+            "receive-buffer": Option(int, 2 ** 30, minimum=65536, live=True),
+            "aggregation": Option(bool, False),
+            "aggregation-delay": Option(int, 5, minimum=0),
+            "aggregation-bytes": Option(int, 1200, minimum=64, maximum=1400),
+            "kernel-neighbours": Option(bool, True)
+        },
+        "neighbours": {
+            "request-interval": Option(int, 10, minimum=1, live=True),
+            "purge-interval": Option(int, 1, minimum=1, live=True),
+            "lifetime": Option(int, 255, minimum=2, live=True),
+            "pending-attempts": Option(int, 4, minimum=1, live=True),
+            "pending-delay": Option(int, 5, minimum=1, live=True),
+            "ns-window": Option(float, 1.0, minimum=0, live=True),
+            "na-rate": Option(float, 50.0, minimum=0.1, live=True),
+            "na-burst": Option(int, 20, minimum=1, live=True)
+        },
+        "buffer": {
+            "capacity": Option(int, 1024, minimum=1, live=True),
+            "dedup-capacity": Option(int, 4096, minimum=16),
+            "dedup-window": Option(float, 1.0, minimum=0, live=True)
+        },
+        "flows": {
+            "capacity": Option(int, 4096, minimum=1, live=True),
+            "idle-timeout": Option(float, 60.0, minimum=0, live=True)
+        },
+        "memory": {
+            "budget": Option(int, 32 * 2 ** 20, minimum=2 ** 20, live=True),
+            "node-table-share": Option(float, 0.4, minimum=0, maximum=1, live=True),
+            "buffer-share": Option(float, 0.3, minimum=0, maximum=1, live=True),
+            "pending-share": Option(float, 0.05, minimum=0, maximum=1, live=True),
+            "flows-share": Option(float, 0.25, minimum=0, maximum=1, live=True)
+        },
+        "console": {
+            "output": Option(str, "stdout"),
+            "capacity": Option(int, 4096, minimum=16),
+            "rate": Option(float, 200.0, minimum=1, live=True),
+            "burst": Option(int, 500, minimum=1, live=True)
+        },
+        "admin": {
+            "socket": Option(str, "bridge.sock")
+        },
+        "recorder": {
+            "path": Option(str, "")
+        },
+        "snapshot": {
+            "path": Option(str, "bridge.snapshot"),
+            "interval": Option(int, 30, minimum=1, live=True)
+        },
+        "pipeline": {
+            "processes": Option(bool, False),
+            "ring-slots": Option(int, 1024, minimum=16)
+        }
+    }
+
     def __init__(self, conf_parser: configparser):
         self.confParser = conf_parser
 
     """
-    Function loads configuration
+    Function loads configuration, values are converted to types of SCHEMA. All invalid or missing options are reported
+    together by ConfigurationError, unknown options are only logged.
     """
     def read_configuration(self, config_file: str) -> dict:
+        self.confParser.clear()
         self.confParser.read(config_file)
-        read_config = {
-            "border-router": {},
-            "serial": {},
-            "metrics": {},
-            "wifi": {}
-        }
+        read_config = {}
+        errors = []
+        for section, options in self.SCHEMA.items():
+            read_config.update({section: {}})
+            values = self.confParser[section] if self.confParser.has_section(section) else {}
+            for key, option in options.items():
+                if key not in values:
+                    if option.default is None:
+                        errors.append("missing option [{}] {}".format(section, key))
+                    read_config[section][key] = option.default
+                    continue
+                try:
+                    read_config[section][key] = option.parse(values[key])
+                except ValueError as e:
+                    errors.append("invalid option [{}] {}: {}".format(section, key, str(e)))
         for section in self.confParser.sections():
-            if section == 'border-router':
-                read_config[section]['ipv6'] = self.confParser[section]['ipv6']
-            elif section == 'serial':
-                read_config[section]['device'] = self.confParser[section]['device']
-            elif section == 'wifi':
-                read_config[section]['device'] = self.confParser[section]['device']
-                read_config[section]['subnet'] = self.confParser[section]['subnet']
-            elif section == 'metrics':
-                read_config[section]['en'] = self.confParser[section]['en']
-                read_config[section]['bw'] = self.confParser[section]['bw']
-                read_config[section]['etx'] = self.confParser[section]['etx']
+            for key in self.confParser[section]:
+                if key not in self.SCHEMA.get(section, {}):
+                    logging.warning('BRIDGE:unknown configuration option [{}] {}'.format(section, key))
+        if errors:
+            raise ConfigurationError(errors)
         return read_config
+
+    def reload_configuration(self, config_file: str, configuration: dict) -> dict:
+        """
+        Reads configuration again and copies changed live options into configuration in place, so running services see
+        them. Changes of other options are only reported.
+        """
+        new_config = self.read_configuration(config_file)
+        applied = []
+        restart_required = []
+        for section, options in self.SCHEMA.items():
+            for key, option in options.items():
+                if new_config[section][key] != configuration[section][key]:
+                    if option.live:
+                        configuration[section][key] = new_config[section][key]
+                        applied.append("{}.{}".format(section, key))
+                    else:
+                        restart_required.append("{}.{}".format(section, key))
+        return {"applied": applied, "restart_required": restart_required}
@@ -0,0 +1,266 @@
+from ipaddress import IPv6Interface
+from threading import Lock
+import errno
+import logging
+import os
+import socket
+import struct
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_NEWNEIGH = 28
+RTM_DELNEIGH = 29
+RTM_GETNEIGH = 30
+
+NLM_F_REQUEST = 0x001
+NLM_F_ACK = 0x004
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+NLM_F_DUMP = 0x300
+
+RTMGRP_NEIGH = 0x4
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTA_DST = 1
+RTA_OIF = 4
+NDA_DST = 1
+NDA_LLADDR = 2
+
+NUD_INCOMPLETE = 0x01
+NUD_REACHABLE = 0x02
+NUD_STALE = 0x04
+NUD_DELAY = 0x08
+NUD_PROBE = 0x10
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+NUD_PERMANENT = 0x80
+
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RTN_UNICAST = 1
+
+NLMSG_HEADER = struct.Struct("=IHHII")
+NLMSG_ERROR_CODE = struct.Struct("=i")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTMSG = struct.Struct("=BBBBBBBBI")
+NDMSG = struct.Struct("=BBHiHBB")
+RTATTR = struct.Struct("=HH")
+RTA_UINT32 = struct.Struct("=I")
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _attribute(attr_type: int, value: bytes) -> bytes:
+    length = RTATTR.size + len(value)
+    return RTATTR.pack(length, attr_type) + value + b'\0' * (_align(length) - length)
+
+
+def parse_ipv6(address: str, default_prefixlen: int = 128):
+    """
+    Returns packed address and prefix length of "<ipv6>[/<prefix>]" string
+    """
+    if "/" not in address:
+        address = "{}/{}".format(address, default_prefixlen)
+    interface = IPv6Interface(address)
+    return interface.ip.packed, interface.network.prefixlen
+
+
+def parse_neighbour_messages(data: bytes) -> list:
+    """
+    Returns IPv6 neighbour updates of rtnetlink messages as (deleted, ifindex, state, address, l2 address) tuples, l2
+    address is None when kernel does not know it
+    """
+    updates = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msg_type, flags, sequence, pid = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+        body = offset + NLMSG_HEADER.size
+        if msg_type in (RTM_NEWNEIGH, RTM_DELNEIGH) and body + NDMSG.size <= offset + length:
+            family, pad1, pad2, ifindex, state, ndm_flags, ndm_type = NDMSG.unpack_from(data, body)
+            address = None
+            l2_address = None
+            attribute = body + NDMSG.size
+            while family == socket.AF_INET6 and attribute + RTATTR.size <= offset + length:
+                attr_length, attr_type = RTATTR.unpack_from(data, attribute)
+                if attr_length < RTATTR.size:
+                    break
+                value = data[attribute + RTATTR.size:attribute + attr_length]
+                if attr_type == NDA_DST and len(value) == 16:
+                    address = socket.inet_ntop(socket.AF_INET6, value)
+                elif attr_type == NDA_LLADDR and len(value) == 6:
+                    l2_address = value.hex(":")
+                attribute += _align(attr_length)
+            if address:
+                updates.append((msg_type == RTM_DELNEIGH, ifindex, state, address, l2_address))
+        offset += _align(length)
+    return updates
+
+
+class NetlinkError(Exception):
+    """
+    Raised when kernel refuses one or more operations of netlink batch
+    """
+    def __init__(self, failures: list):
+        Exception.__init__(self, "; ".join(["{}: {}".format(description, os.strerror(code))
+                                            for (description, code) in failures]))
+        self.failures = failures
+
+
+class NetlinkBatch:
+    """
+    Collects rtnetlink requests which are sent to kernel together by single system call
+    """
+    def __init__(self, route_netlink, ifindex: int):
+        self._route_netlink = route_netlink
+        self._ifindex = ifindex
+        self._requests = []
+
+    def _add_request(self, msg_type: int, flags: int, body: bytes, description: str, ignored_errors: tuple):
+        self._requests.append((msg_type, flags, body, description, ignored_errors))
+
+    def _address_body(self, address: str) -> bytes:
+        packed, prefixlen = parse_ipv6(address)
+        return IFADDRMSG.pack(socket.AF_INET6, prefixlen, 0, RT_SCOPE_UNIVERSE, self._ifindex) + \
+            _attribute(IFA_LOCAL, packed) + _attribute(IFA_ADDRESS, packed)
+
+    def _route_body(self, address: str) -> bytes:
+        if address == "default":
+            body = RTMSG.pack(socket.AF_INET6, 0, 0, 0, RT_TABLE_MAIN, RTPROT_BOOT, RT_SCOPE_UNIVERSE, RTN_UNICAST, 0)
+        else:
+            packed, prefixlen = parse_ipv6(address)
+            body = RTMSG.pack(socket.AF_INET6, prefixlen, 0, 0, RT_TABLE_MAIN, RTPROT_BOOT, RT_SCOPE_UNIVERSE,
+                              RTN_UNICAST, 0) + _attribute(RTA_DST, packed)
+        return body + _attribute(RTA_OIF, RTA_UINT32.pack(self._ifindex))
+
+    def add_address(self, address: str):
+        self._add_request(RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL, self._address_body(address),
+                          'add address "{}"'.format(address), (errno.EEXIST,))
+
+    def remove_address(self, address: str):
+        self._add_request(RTM_DELADDR, 0, self._address_body(address), 'remove address "{}"'.format(address),
+                          (errno.EADDRNOTAVAIL,))
+
+    def add_route(self, address: str):
+        self._add_request(RTM_NEWROUTE, NLM_F_CREATE | NLM_F_EXCL, self._route_body(address),
+                          'add route "{}"'.format(address), (errno.EEXIST,))
+
+    def remove_route(self, address: str):
+        self._add_request(RTM_DELROUTE, 0, self._route_body(address), 'remove route "{}"'.format(address),
+                          (errno.ESRCH,))
+
+    def __len__(self):
+        return len(self._requests)
+
+    def commit(self):
+        """
+        Sends all requests, raises NetlinkError for requests which failed (except idempotency errors, e.g. adding
+        existing route)
+        """
+        if self._requests:
+            self._route_netlink.send_batch(self._requests)
+            self._requests = []
+
+
+class RouteNetlink:
+    """
+    Raw rtnetlink socket used for interface address and route configuration
+    """
+    RECEIVE_TIMEOUT = 1
+    RECEIVE_BUFFER = 65536
+
+    def __init__(self):
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self._socket.bind((0, 0))
+        self._socket.settimeout(self.RECEIVE_TIMEOUT)
+        self._sequence = 0
+        self._lock = Lock()
+
+    def batch(self, iface: str) -> NetlinkBatch:
+        return NetlinkBatch(self, socket.if_nametoindex(iface))
+
+    def send_batch(self, requests: list):
+        with self._lock:
+            message = b''
+            pending = {}
+            for (msg_type, flags, body, description, ignored_errors) in requests:
+                self._sequence += 1
+                pending.update({self._sequence: (description, ignored_errors)})
+                message += NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), msg_type,
+                                             NLM_F_REQUEST | NLM_F_ACK | flags, self._sequence, 0) + body
+            self._socket.send(message)
+            failures = self._receive_acks(pending)
+        if failures:
+            raise NetlinkError(failures)
+
+    def _receive_acks(self, pending: dict) -> list:
+        failures = []
+        while pending:
+            try:
+                data = self._socket.recv(self.RECEIVE_BUFFER)
+            except socket.timeout:
+                failures.extend([(description, errno.ETIMEDOUT) for (description, ignored) in pending.values()])
+                break
+            offset = 0
+            while offset + NLMSG_HEADER.size <= len(data):
+                length, msg_type, flags, sequence, pid = NLMSG_HEADER.unpack_from(data, offset)
+                if length < NLMSG_HEADER.size:
+                    break
+                if msg_type == NLMSG_ERROR and sequence in pending:
+                    code = -NLMSG_ERROR_CODE.unpack_from(data, offset + NLMSG_HEADER.size)[0]
+                    description, ignored_errors = pending.pop(sequence)
+                    if code and code not in ignored_errors:
+                        failures.append((description, code))
+                    elif code:
+                        logging.debug('BRIDGE:netlink {} skipped: {}'.format(description, os.strerror(code)))
+                offset += _align(length)
+        return failures
+
+    def close(self):
+        self._socket.close()
+
+
+class NeighbourNetlink:
+    """
+    Rtnetlink socket subscribed to neighbour updates of kernel (RTM_NEWNEIGH/RTM_DELNEIGH). Current IPv6 neighbour cache
+    is requested by dump, its entries are received same way as updates.
+    """
+    RECEIVE_TIMEOUT = 1
+    RECEIVE_BUFFER = 65536
+
+    def __init__(self):
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self._socket.bind((0, RTMGRP_NEIGH))
+        self._socket.settimeout(self.RECEIVE_TIMEOUT)
+        self._sequence = 0
+
+    def request_dump(self):
+        self._sequence += 1
+        body = NDMSG.pack(socket.AF_INET6, 0, 0, 0, 0, 0, 0)
+        self._socket.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP,
+                                            self._sequence, 0) + body)
+
+    def receive(self) -> list:
+        """
+        Returns received neighbour updates, empty list after timeout. OSError with ENOBUFS means that updates were lost
+        and dump has to be requested again.
+        """
+        try:
+            data = self._socket.recv(self.RECEIVE_BUFFER)
+        except socket.timeout:
+            return []
+        return parse_neighbour_messages(data)
+
+    def close(self):
+        self._socket.close()
@@ -0,0 +1,19 @@
+import hashlib
+import math
+
+
+def select_rendezvous(flow: str, candidates: list):
+    """
+    Weighted rendezvous hashing, returns address of (address, weight) candidate with highest score for flow
+    """
+    best = None
+    best_score = None
+    for address, weight in candidates:
+        digest = hashlib.blake2b("{};{}".format(flow, address).encode(), digest_size=8).digest()
+        # hash mapped into (0, 1), score = -weight / ln(hash)
+        point = (int.from_bytes(digest, "big") + 1) / (2 ** 64 + 1)
+        score = -weight / math.log(point)
+        if best_score is None or score > best_score:
+            best = address
+            best_score = score
+    return best
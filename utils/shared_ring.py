@@ -0,0 +1,154 @@
+from multiprocessing import shared_memory
+import struct
+
+
+class SharedRing:
+    """
+    Single-producer single-consumer ring of records in shared memory, it connects two processes without locks. Header
+    holds head (records written), tail (records read), flag of sleeping consumer and counters of records dropped by
+    full ring and oversized records (so both processes see them). Only producer writes head and counters and only
+    consumer writes tail. Every record occupies one slot of SLOT_SIZE bytes and starts with its length. Sleeping
+    consumer is woken by doorbell (multiprocessing event), lost wakeup is limited by timeout of get. Counters are
+    accessed through memoryview of native 64-bit integers, so they are stored by single aligned write and other process
+    never sees torn value (struct packing writes byte by byte).
+    """
+    HEADER_SIZE = 64
+    HEAD = 0
+    TAIL = 1
+    SLEEPING = 2
+    DROPPED = 3
+    OVERSIZED = 4
+    LENGTH = struct.Struct("=I")
+    SLOT_SIZE = 2048
+    DEFAULT_SLOTS = 1024
+
+    def __init__(self, doorbell, name: str = None, slots: int = DEFAULT_SLOTS):
+        self._owner = name is None
+        self._slots = slots
+        self._doorbell = doorbell
+        self._memory = shared_memory.SharedMemory(name=name, create=self._owner,
+                                                  size=self.HEADER_SIZE + slots * self.SLOT_SIZE)
+        self._counters = self._memory.buf[:self.HEADER_SIZE].cast("Q")
+        if self._owner:
+            for index in range(len(self._counters)):
+                self._counters[index] = 0
+
+    def get_name(self) -> str:
+        return self._memory.name
+
+    def get_slots(self) -> int:
+        return self._slots
+
+    def get_doorbell(self):
+        return self._doorbell
+
+    def __len__(self):
+        return self._counters[self.HEAD] - self._counters[self.TAIL]
+
+    def get_dropped(self) -> int:
+        return self._counters[self.DROPPED]
+
+    def get_oversized(self) -> int:
+        return self._counters[self.OVERSIZED]
+
+    def put(self, data: bytes) -> bool:
+        """
+        Producer side, returns False (record is dropped) when ring is full or record does not fit into slot
+        """
+        if self.LENGTH.size + len(data) > self.SLOT_SIZE:
+            self._counters[self.OVERSIZED] += 1
+            return False
+        head = self._counters[self.HEAD]
+        if head - self._counters[self.TAIL] >= self._slots:
+            self._counters[self.DROPPED] += 1
+            return False
+        offset = self.HEADER_SIZE + (head % self._slots) * self.SLOT_SIZE
+        self.LENGTH.pack_into(self._memory.buf, offset, len(data))
+        self._memory.buf[offset + self.LENGTH.size:offset + self.LENGTH.size + len(data)] = data
+        self._counters[self.HEAD] = head + 1
+        if self._counters[self.SLEEPING]:
+            self._doorbell.set()
+        return True
+
+    def get(self, timeout: float):
+        """
+        Consumer side, returns None when no record came in timeout
+        """
+        tail = self._counters[self.TAIL]
+        if tail == self._counters[self.HEAD]:
+            self._counters[self.SLEEPING] = 1
+            if tail == self._counters[self.HEAD]:
+                self._doorbell.wait(timeout)
+            self._counters[self.SLEEPING] = 0
+            self._doorbell.clear()
+            if tail == self._counters[self.HEAD]:
+                return None
+        offset = self.HEADER_SIZE + (tail % self._slots) * self.SLOT_SIZE
+        length, = self.LENGTH.unpack_from(self._memory.buf, offset)
+        data = bytes(self._memory.buf[offset + self.LENGTH.size:offset + self.LENGTH.size + length])
+        self._counters[self.TAIL] = tail + 1
+        return data
+
+    def close(self):
+        self._counters.release()
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+class SeqlockRegion:
+    """
+    Shared memory block with single writer and lock-free readers. Writer makes sequence odd, writes data and makes
+    sequence even again. Reader copies data and retries when sequence was odd or changed meanwhile. Header is sequence
+    and length of data (native 64-bit integers).
+    """
+    HEADER_SIZE = 16
+    SEQUENCE = 0
+    LENGTH = 1
+    DEFAULT_SIZE = 1048576
+
+    def __init__(self, name: str = None, size: int = DEFAULT_SIZE):
+        self._owner = name is None
+        self._memory = shared_memory.SharedMemory(name=name, create=self._owner, size=self.HEADER_SIZE + size)
+        self._header = self._memory.buf[:self.HEADER_SIZE].cast("Q")
+        self._size = size
+        if self._owner:
+            self._header[self.SEQUENCE] = 0
+            self._header[self.LENGTH] = 0
+
+    def get_name(self) -> str:
+        return self._memory.name
+
+    def get_size(self) -> int:
+        return self._size
+
+    def get_sequence(self) -> int:
+        return self._header[self.SEQUENCE]
+
+    def write(self, data: bytes):
+        if len(data) > self._size:
+            raise ValueError("data of {} bytes does not fit into region of {} bytes".format(len(data), self._size))
+        sequence = self._header[self.SEQUENCE]
+        self._header[self.SEQUENCE] = sequence + 1
+        self._header[self.LENGTH] = len(data)
+        self._memory.buf[self.HEADER_SIZE:self.HEADER_SIZE + len(data)] = data
+        self._header[self.SEQUENCE] = sequence + 2
+
+    def read(self):
+        """
+        Returns (sequence, data) of consistent copy
+        """
+        while True:
+            sequence = self._header[self.SEQUENCE]
+            if sequence % 2:
+                continue
+            length = self._header[self.LENGTH]
+            data = bytes(self._memory.buf[self.HEADER_SIZE:self.HEADER_SIZE + min(length, self._size)])
+            if self._header[self.SEQUENCE] == sequence:
+                return sequence, data
+
+    def close(self):
+        self._header.release()
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
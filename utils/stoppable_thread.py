@@ -0,0 +1,25 @@
+from threading import Thread, Event
+
+
+class StoppableThread(Thread):
+    """
+    Daemon thread which can be asked to stop. Subclasses check is_stopped() in their loop and use wait() instead of
+    time.sleep(), so they sleep without CPU usage and wake up immediately on stop().
+    This class is ABSTRACT.
+    """
+    def __init__(self):
+        Thread.__init__(self)
+        self.daemon = True
+        self._stop_event = Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleeps for timeout seconds, returns False when thread was stopped meanwhile
+        """
+        return not self._stop_event.wait(timeout)